@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from digikala_extractors import EXTRACTORS, NEXT_DATA_START, get_extractor
+
+FIXTURES = ['digikala_page_source.html', 'digikala_page_source_after_scroll.html']
+BASE_URL = 'https://www.digikala.com/search/category-mobile-phone/'
+
+def with_next_data(html: str, count: int = 20) -> str:
+    """افزودن داده محصولات ساختگی به pageProps خالی فایل نمونه"""
+    products = [{
+        'id': 1000 + i,
+        'title_fa': f'محصول نمونه {i}',
+        'url': {'uri': f'/product/dkp-{1000 + i}/'},
+        'default_variant': {'price': {'selling_price': 1000000 + i}},
+        'images': {'main': {'url': [f'https://dkstatics-public.digikala.com/{i}.jpg']}},
+        'rating': {'rate': 4.2, 'count': i},
+    } for i in range(count)]
+    blob = {'props': {'pageProps': {'data': {'products': products, 'pager': {'current_page': 1, 'total_pages': 5}}}}}
+    start = html.index(NEXT_DATA_START) + len(NEXT_DATA_START)
+    end = html.index('</script>', start)
+    return html[:start] + json.dumps(blob, ensure_ascii=False) + html[end:]
+
+def bench(func, repeat: int) -> float:
+    """میانگین زمان اجرای هر فراخوانی به میلی‌ثانیه"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='مقایسه سرعت موتورهای استخراج روی فایل‌های HTML نمونه')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for fixture in FIXTURES:
+        with open(os.path.join(ROOT, fixture), 'r', encoding='utf-8') as f:
+            html = f.read()
+        print(f'--- {fixture} ({len(html) // 1024} KB) ---')
+        results = {}
+        timings = {}
+        for name in EXTRACTORS:
+            extractor = get_extractor(name)
+            results[name] = (
+                extractor.categories(html, BASE_URL),
+                extractor.listing(html, BASE_URL, 'mobile-phone'),
+                extractor.product_page(html),
+            )
+            timings[name] = {
+                'categories': bench(lambda: extractor.categories(html, BASE_URL), args.repeat),
+                'listing': bench(lambda: extractor.listing(html, BASE_URL, 'mobile-phone'), args.repeat),
+                'product_page': bench(lambda: extractor.product_page(html), args.repeat),
+            }
+        baseline = timings['soup']
+        for name, timing in timings.items():
+            row = '  '.join(
+                f'{stage}={ms:7.2f}ms (x{baseline[stage] / ms:4.1f})' for stage, ms in timing.items()
+            )
+            print(f'{name:>9}: {row}')
+        same = all(result == results['soup'] for result in results.values())
+        print(f'خروجی یکسان: {same}  (دسته‌ها: {len(results["soup"][0])}، محصولات: {len(results["soup"][1][0])})')
+        # مسیر JSON: فقط blob جاسازی‌شده decode می‌شود
+        page = with_next_data(html)
+        dom = bench(lambda: get_extractor('lxml').listing(page, BASE_URL, 'mobile-phone'), args.repeat)
+        nd = bench(lambda: get_extractor('next_data').listing(page, BASE_URL, 'mobile-phone'), args.repeat)
+        print(f'listing با __NEXT_DATA__: lxml={dom:7.2f}ms  next_data={nd:7.2f}ms (x{dom / nd:4.1f})')
+
+if __name__ == '__main__':
+    main()
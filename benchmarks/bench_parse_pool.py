@@ -0,0 +1,65 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_extractors import with_next_data
+from digikala_replay import ReplayRecorder
+
+FIXTURE = 'digikala_page_source.html'
+CATEGORY_URL = 'https://www.digikala.com/search/category-mobile-phone/'
+
+def write_pages(directory: str, count: int) -> None:
+    """صفحه دسته با count محصول و صفحه هر محصول (فایل نمونه بزرگ) برای replay بدون شبکه"""
+    with open(os.path.join(ROOT, FIXTURE), 'r', encoding='utf-8') as f:
+        html = f.read()
+    recorder = ReplayRecorder(directory)
+    recorder.save(CATEGORY_URL, with_next_data(html, count).encode('utf-8'))
+    for i in range(count):
+        recorder.save(f'https://www.digikala.com/product/dkp-{1000 + i}/', html.encode('utf-8'))
+    recorder.close()
+
+def stat(log: str, name: str) -> float:
+    match = re.search(rf"'{name}': ([\d.]+)", log)
+    if not match:
+        raise RuntimeError(f'{name} در آمار اسکرپی یافت نشد:\n{log[-2000:]}')
+    return float(match.group(1))
+
+def spider_rate(workers: int, pages_dir: str, workdir: str) -> float:
+    """پاسخ در ثانیه خود اسپایدر (scrapy runspider روی صفحات replay) با parse_workers=workers"""
+    command = [
+        sys.executable, '-m', 'scrapy', 'runspider', os.path.join(ROOT, 'digikala_crawler.py'),
+        '-a', f'category_url={CATEGORY_URL}', '-a', f'parse_workers={workers}',
+        '-s', f'DIGIKALA_REPLAY_HTML={pages_dir}', '-s', 'HTTPCACHE_ENABLED=False',
+        '-s', 'AUTOTHROTTLE_ENABLED=False', '-s', 'DOWNLOAD_DELAY=0', '-s', 'LOG_LEVEL=INFO',
+    ]
+    # هر اجرا digikala.db و خروجی‌های خودش را در پوشه جدا می‌سازد
+    cwd = tempfile.mkdtemp(dir=workdir)
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+    result = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return stat(result.stderr, 'response_received_count') / stat(result.stderr, 'elapsed_time_seconds')
+
+def main():
+    parser = argparse.ArgumentParser(description='پاسخ در ثانیه اسپایدر با پارس در همان thread و با ParsePool')
+    parser.add_argument('--pages', type=int, default=200, help='تعداد صفحه محصول')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        pages_dir = os.path.join(workdir, 'pages')
+        write_pages(pages_dir, args.pages)
+        baseline = spider_rate(0, pages_dir, workdir)
+        print(f'هسته‌ها: {os.cpu_count()}  صفحات محصول: {args.pages}')
+        print(f'  inline: {baseline:8.1f} پاسخ/ثانیه')
+        workers = 1
+        while workers <= args.max_workers:
+            rate = spider_rate(workers, pages_dir, workdir)
+            print(f'workers={workers:>3}: {rate:8.1f} پاسخ/ثانیه (x{rate / baseline:4.2f})')
+            workers *= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+import argparse
+import cProfile
+import gc
+import io
+import json
+import os
+import platform
+import pstats
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_extractors import BASE_URL, FIXTURES, with_next_data
+from digikala_api_engine import map_provider_product, map_search_product
+from digikala_extractors import EXTRACTORS, get_extractor, parse_price, parse_review_count
+from digikala_har import extract_har, iter_har_entries
+from digikala_prices import observation_from_api_item
+from digikala_seen import DkpBitmap
+from digikala_storage import BufferedWriter, create_db_engine
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+class Case(NamedTuple):
+    name: str
+    func: Callable[[], int]  # تعداد آیتم تولیدشده در هر فراخوانی را برمی‌گرداند
+    pages: int  # تعداد صفحه/پاسخ پردازش‌شده در هر فراخوانی
+
+def peak_rss_mb() -> float:
+    # ru_maxrss در لینوکس کیلوبایت و در macOS بایت است
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def api_product(i: int, category: str) -> Dict:
+    """محصول ساختگی با ساختار endpoint جستجوی API"""
+    price = random.randint(10, 5000) * 10000
+    return {
+        'id': 1000000 + i,
+        'title_fa': f'محصول آزمایشی شماره {i}',
+        'status': 'marketable',
+        'url': {'uri': f'/product/dkp-{1000000 + i}/'},
+        'brand': {'title_fa': 'برند'},
+        'rating': {'rate': round(random.uniform(1, 5), 1), 'count': random.randint(0, 900)},
+        'images': {'main': {'url': [f'https://dkstatics-public.digikala.com/{i}.jpg']}},
+        'default_variant': {'price': {'selling_price': price, 'rrp_price': price * 12 // 10}},
+        'is_ad': i % 25 == 0,
+        'category': category,
+    }
+
+def api_pages(count: int, per_page: int = 20) -> List[str]:
+    """صفحات JSON ساختگی endpoint جستجو (به صورت متن، مثل پاسخ HTTP)"""
+    return [
+        json.dumps({'status': 200, 'data': {
+            'products': [api_product(page * per_page + i, 'mobile-phone') for i in range(per_page)],
+            'pager': {'current_page': page + 1, 'total_pages': count},
+        }}, ensure_ascii=False)
+        for page in range(count)
+    ]
+
+def synthetic_har(pages: List[str], noise: int = 50) -> Dict:
+    """فایل HAR ساختگی شامل XHRهای محصولات و درخواست‌های بی‌ربط"""
+    entries = []
+    for i, body in enumerate(pages):
+        entries.append({
+            'request': {'method': 'GET', 'url': f'https://api.digikala.com/v1/categories/mobile-phone/search/?page={i + 1}',
+                        'headers': [{'name': 'accept', 'value': 'application/json'}],
+                        'queryString': [{'name': 'page', 'value': str(i + 1)}]},
+            'response': {'status': 200, 'content': {'mimeType': 'application/json', 'text': body}},
+        })
+    for i in range(noise):
+        entries.append({
+            'request': {'method': 'GET', 'url': f'https://dkstatics-public.digikala.com/static/{i}.js',
+                        'headers': [], 'queryString': []},
+            'response': {'status': 200, 'content': {'mimeType': 'application/javascript', 'text': 'x' * 2000}},
+        })
+    return {'log': {'version': '1.2', 'entries': entries}}
+
+def extractor_cases() -> List[Case]:
+    cases = []
+    for fixture in FIXTURES:
+        with open(os.path.join(ROOT, fixture), 'r', encoding='utf-8') as f:
+            html = f.read()
+        label = os.path.splitext(fixture)[0].replace('digikala_page_source', 'page')
+        for name in EXTRACTORS:
+            extractor = get_extractor(name)
+            cases.append(Case(f'extract/{name}/categories[{label}]',
+                              lambda e=extractor, h=html: len(e.categories(h, BASE_URL)), 1))
+            cases.append(Case(f'extract/{name}/listing[{label}]',
+                              lambda e=extractor, h=html: len(e.listing(h, BASE_URL, 'mobile-phone')[0]), 1))
+            cases.append(Case(f'extract/{name}/product_page[{label}]',
+                              lambda e=extractor, h=html: len(e.product_page(h)['reviews']), 1))
+        page = with_next_data(html)
+        cases.append(Case(f'extract/next_data/listing_json[{label}]',
+                          lambda p=page: len(get_extractor('next_data').listing(p, BASE_URL, 'mobile-phone')[0]), 1))
+    prices = ['۱۲,۳۴۵,۰۰۰ تومان', '12,345,000', 'ناموجود'] * 100
+    reviews = ['(۱۲۳ دیدگاه)', '45 نظر', ''] * 100
+    cases.append(Case('helpers/parse_price[x300]', lambda: sum(1 for p in prices if parse_price(p)), 0))
+    cases.append(Case('helpers/parse_review_count[x300]', lambda: sum(1 for r in reviews if parse_review_count(r)), 0))
+    return cases
+
+def api_cases() -> List[Case]:
+    pages = api_pages(20)
+
+    def search() -> int:
+        count = 0
+        for body in pages:
+            for p in json.loads(body)['data']['products']:
+                map_search_product(p, 'mobile-phone')
+                count += 1
+        return count
+
+    def providers() -> int:
+        count = 0
+        for body in pages:
+            for p in json.loads(body)['data']['products']:
+                map_provider_product(p)
+                count += 1
+        return count
+
+    return [
+        Case('api/search_page_map[20 pages]', search, len(pages)),
+        Case('api/providers_page_map[20 pages]', providers, len(pages)),
+    ]
+
+def har_cases(workdir: str) -> List[Case]:
+    pages = api_pages(20)
+    har_path = os.path.join(workdir, 'digikala_network.har')
+    with open(har_path, 'w', encoding='utf-8') as f:
+        json.dump(synthetic_har(pages), f, ensure_ascii=False)
+
+    def extract() -> int:
+        counts = extract_har(
+            har_path,
+            xhr_path=os.path.join(workdir, 'extracted_product_xhrs.json'),
+            bodies_dir=os.path.join(workdir, 'har_bodies'),
+            products_json=os.path.join(workdir, 'digikala_har_products.json'),
+            products_csv=None,
+        )
+        return counts['products']
+
+    def entries() -> int:
+        return sum(1 for _ in iter_har_entries(har_path))
+
+    return [
+        Case(f'har/extract_har[{len(pages)} xhr]', extract, len(pages)),
+        Case(f'har/iter_har_entries[{len(pages)} xhr]', entries, len(pages)),
+    ]
+
+def storage_cases(workdir: str) -> List[Case]:
+    engine = create_db_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    writer = BufferedWriter(engine, flush_size=500, flush_interval=1e9)
+    counter = {'next': 0}
+    batch = 1000
+
+    def products() -> int:
+        start = counter['next']
+        counter['next'] += batch
+        for i in range(start, start + batch):
+            writer.add_product({
+                'product_id': i, 'name': f'محصول {i}', 'price': 1000.0 + i, 'category': 'mobile-phone',
+                'url': f'https://www.digikala.com/product/dkp-{i}/', 'description': 'توضیحات ' * 20,
+                'rating': 4.1, 'review_count': 12, 'image_url': f'https://dkstatics-public.digikala.com/{i}.jpg',
+                'specs': json.dumps({'وزن': '200 گرم', 'رنگ': 'مشکی'}, ensure_ascii=False),
+            })
+        writer.flush()
+        return batch
+
+    def reviews() -> int:
+        start = counter['next']
+        counter['next'] += batch
+        for i in range(start, start + batch):
+            writer.add_review({'product_url': f'https://www.digikala.com/product/dkp-{i // 5}/',
+                               'comment': f'نظر شماره {i} ' * 5, 'rating': 4, 'date': '۱۴۰۳/۰۱/۰۱'})
+        writer.flush()
+        return batch
+
+    api_items = [map_search_product(api_product(i, 'mobile-phone'), 'mobile-phone') for i in range(batch)]
+    clock = {'ts': int(time.time())}
+
+    def prices() -> int:
+        # هر نوبت یک «روز» جدید؛ قیمت یک‌پنجم محصولات تغییر می‌کند
+        clock['ts'] += 86400
+        for i, item in enumerate(api_items):
+            if i % 5 == clock['ts'] % 5:
+                item['قیمت'] += 10000
+            writer.add_price(observation_from_api_item(item, clock['ts']))
+        writer.flush()
+        return batch
+
+    return [
+        Case(f'storage/add_product+flush[{batch}]', products, 0),
+        Case(f'storage/add_review+flush[{batch}]', reviews, 0),
+        Case(f'storage/add_price+flush[{batch}]', prices, 0),
+    ]
+
+def seen_cases(workdir: str) -> List[Case]:
+    bitmap = DkpBitmap(os.path.join(workdir, 'bench.seen'))
+    rng = random.Random(7)
+    # شناسه‌های dkp در بازه واقعی کاتالوگ (تا حدود 20 میلیون)
+    ids = [rng.randrange(20_000_000) for _ in range(100_000)]
+
+    def add() -> int:
+        bitmap.update(ids)
+        return len(ids)
+
+    def contains() -> int:
+        return sum(1 for dkp_id in ids if dkp_id in bitmap)
+
+    return [
+        Case(f'seen/dkp_bitmap.add[{len(ids)}]', add, 0),
+        Case(f'seen/dkp_bitmap.contains[{len(ids)}]', contains, 0),
+    ]
+
+def run_case(case: Case, repeat: int, profile: bool) -> Dict:
+    case.func()  # گرم کردن (cache سلکتورها، ساخت جدول‌ها و ...)
+    gc.collect()
+    timings = []
+    items = 0
+    profiler = cProfile.Profile() if profile else None
+    for _ in range(repeat):
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        items = case.func()
+        timings.append(time.perf_counter() - start)
+        if profiler:
+            profiler.disable()
+    median = statistics.median(timings)
+    result = {
+        'median_ms': median * 1000,
+        'min_ms': min(timings) * 1000,
+        'items': items,
+        'pages_per_sec': case.pages / median if case.pages else None,
+        'items_per_sec': items / median if items else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if profiler:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(8)
+        result['profile'] = stream.getvalue()
+    return result
+
+def compare(name: str, result: Dict, baseline: Optional[Dict], threshold: float) -> Tuple[Optional[float], bool]:
+    """نسبت median به baseline و پسرفت بودن آن؛ caseی که در baseline نیست مقایسه نمی‌شود"""
+    if not baseline or name not in baseline:
+        return None, False
+    ratio = result['median_ms'] / baseline[name]['median_ms']
+    return ratio, ratio > 1 + threshold
+
+def format_rate(value) -> str:
+    return f'{value:10.1f}' if value else f'{"-":>10}'
+
+def main():
+    parser = argparse.ArgumentParser(description='بنچمارک مسیرهای استخراج، API، HAR و ذخیره‌سازی روی داده نمونه آفلاین')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--filter', default='', help='فقط caseهایی که نامشان شامل این رشته است')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, default=None,
+                        help='ذخیره نتایج به عنوان baseline')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, default=None,
+                        help='مقایسه با baseline ذخیره‌شده')
+    parser.add_argument('--threshold', type=float, default=0.10, help='کندی بیش از این نسبت پسرفت حساب می‌شود')
+    parser.add_argument('--profile', action='store_true', help='نمایش پرهزینه‌ترین توابع هر case با cProfile')
+    args = parser.parse_args()
+    random.seed(42)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = (extractor_cases() + api_cases() + har_cases(workdir) + storage_cases(workdir)
+                 + seen_cases(workdir))
+        print(f"{'case':<52} {'median ms':>10} {'pages/s':>10} {'items/s':>10} {'RSS MB':>8}")
+        for case in cases:
+            if args.filter not in case.name:
+                continue
+            result = run_case(case, args.repeat, args.profile)
+            results[case.name] = result
+            line = (
+                f"{case.name:<52} {result['median_ms']:10.2f} {format_rate(result['pages_per_sec'])} "
+                f"{format_rate(result['items_per_sec'])} {result['peak_rss_mb']:8.1f}"
+            )
+            ratio, regressed = compare(case.name, result, baseline, args.threshold)
+            if ratio is not None:
+                line += f'  x{ratio:4.2f}'
+            if regressed:
+                line += '  پسرفت'
+                regressions.append(case.name)
+            print(line)
+            if args.profile:
+                print(result.pop('profile'))
+
+    print(f'بیشینه حافظه (peak RSS): {peak_rss_mb():.1f} MB')
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f'baseline ذخیره شد: {args.save_baseline}')
+    if regressions:
+        print(f'{len(regressions)} case کندتر از baseline: {", ".join(regressions)}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,33 @@
-import requests
+import asyncio
 import json
-import pandas as pd
-import time
+import logging
+import os
 
-with open('digikala_category_codes.json', 'r', encoding='utf-8') as f:
-    categories = json.load(f)
+from digikala_api_engine import HEADERS, StreamWriter, crawl, search_pages
+from digikala_categories import has_tree, leaf_categories, record_counts
+from digikala_parquet import AD_SCHEMA, PRODUCT_SCHEMA, ParquetDatasetWriter, from_api_item
+from digikala_images import ImageDownloader, ImageStore
+from digikala_prices import observation_from_api_item
+from digikala_replay import client_from_env
+from digikala_seen import DkpBitmap
+from digikala_storage import BufferedWriter, create_db_engine
 
-HEADERS = {
-    'accept': 'application/json, text/plain, */*',
-    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-    'origin': 'https://www.digikala.com',
-    'referer': 'https://www.digikala.com/',
-    'x-web-client': 'desktop',
-    'x-web-optimize-response': '1',
-}
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+
+MAX_PAGES = 5  # هر دسته 5 صفحه (قابل افزایش)
+CATEGORY_ORDER = 'size'  # ترتیب خزش برگ‌ها: size (بزرگ‌ترین اول) یا change (بیشترین تغییر تعداد اول)
+RATE = 4.0  # حداکثر درخواست در ثانیه (به جای sleep ثابت)
+CONCURRENCY = 8  # تعداد دسته‌هایی که همزمان خزیده می‌شوند
+DOWNLOAD_IMAGES = False  # دانلود همزمان تصاویر در digikala_images/ با نام hash محتوا
+# شناسه‌های dkp نوشته‌شده؛ ماندگار بین اجراها، پس اجرای بعد فقط محصولات جدید را در خروجی می‌نویسد
+SEEN_FILE = 'digikala_all_products.seen'
+# DIGIKALA_RESET_SEEN=1: شروع از صفر (خروجی کامل همه محصولات)
+RESET_SEEN = os.environ.get('DIGIKALA_RESET_SEEN', '').lower() in ('1', 'true', 'yes')
 COOKIES = {
     # کوکی‌های مهم را در صورت نیاز قرار دهید
 }
 
-all_products = []
-all_ads = []
-
-for cat in categories:
-    print(f'--- دسته‌بندی: {cat} ---')
-    for page in range(1, 6):  # هر دسته 5 صفحه (قابل افزایش)
-        url = f'https://api.digikala.com/v1/categories/{cat}/search/'
-        params = {'page': page}
-        resp = requests.get(url, headers=HEADERS, cookies=COOKIES, params=params)
-        if resp.status_code != 200:
-            print(f'خطا در {cat} صفحه {page}: {resp.status_code}')
-            break
-        data = resp.json()
-        products = data.get('data', {}).get('products', [])
-        if not products:
-            break
-        for p in products:
-            img_url = ''
-            images = p.get('images', {})
-            if isinstance(images, dict):
-                urls = images.get('main', {}).get('url', [])
-                img_url = urls[0] if urls else ''
-            item = {
-                'نام': p.get('title_fa', ''),
-                'قیمت': p.get('default_variant', {}).get('price', {}).get('selling_price', 0),
-                'برند': p.get('brand', {}).get('title_fa', ''),
-                'امتیاز': p.get('rating', {}).get('rate', 0),
-                'تعداد_نظرات': p.get('rating', {}).get('count', 0),
-                'آدرس': f"https://www.digikala.com{p.get('url', {}).get('uri', '')}",
-                'تصویر': img_url,
-                'دسته': cat,
-                'تبلیغاتی': p.get('is_ad', False)
-            }
-            if item['تبلیغاتی']:
-                all_ads.append(item)
-            else:
-                all_products.append(item)
-        time.sleep(1)
-
 # حذف خروجی‌های خالی قبلی
-import os
 for fname in [
     'digikala_products_full.json',
     'digikala_products_providers.json',
@@ -71,18 +40,68 @@ for fname in [
     if os.path.exists(fname) and os.path.getsize(fname) < 1000:
         os.remove(fname)
 
-# ذخیره محصولات واقعی
-with open('digikala_all_products.json', 'w', encoding='utf-8') as f:
-    json.dump(all_products, f, ensure_ascii=False, indent=4)
-if all_products:
-    pd.DataFrame(all_products).to_csv('digikala_all_products.csv', index=False, encoding='utf-8-sig')
+engine = create_db_engine()
+# فقط برگ‌های درخت (python digikala_categories.py fetch) تا محصولات از مسیر دسته‌های والد تکراری دریافت نشوند
+if has_tree(engine):
+    leaves = leaf_categories(engine, CATEGORY_ORDER)
+    categories = [leaf['code'] for leaf in leaves]
+    expected = {leaf['code']: leaf['product_count'] for leaf in leaves if leaf['product_count']}
+    logging.info(f'{len(categories)} دسته برگ از درخت دسته‌بندی (ترتیب: {CATEGORY_ORDER})')
+else:
+    with open('digikala_category_codes.json', 'r', encoding='utf-8') as f:
+        categories = json.load(f)
+    expected = {}
+
+async def main():
+    # محصولات واقعی و تبلیغاتی همزمان با رسیدن هر صفحه در فایل نوشته می‌شوند
+    products_out = StreamWriter('digikala_all_products.json', 'digikala_all_products.csv')
+    ads_out = StreamWriter('digikala_all_ads.json', 'digikala_all_ads.csv')
+    # نسخه ستونی برای تحلیل: Parquet با پارتیشن دسته و تاریخ خزش
+    products_parquet = ParquetDatasetWriter('digikala_parquet/api_products', PRODUCT_SCHEMA)
+    ads_parquet = ParquetDatasetWriter('digikala_parquet/api_ads', AD_SCHEMA)
+    # تاریخچه قیمت مشترک با اسپایدر در digikala.db
+    prices = BufferedWriter(engine)
+
+    def record_price(item):
+        prices.add_price(observation_from_api_item(item))
 
-# ذخیره تبلیغاتی‌ها
-with open('digikala_all_ads.json', 'w', encoding='utf-8') as f:
-    json.dump(all_ads, f, ensure_ascii=False, indent=4)
-if all_ads:
-    pd.DataFrame(all_ads).to_csv('digikala_all_ads.csv', index=False, encoding='utf-8-sig')
+    # تعداد محصولات هر دسته از pager برای اولویت‌بندی و توقف صفحه‌بندی اجرای بعد
+    totals = {}
+    # محصولی که در چند دسته برگ یا در اجرای قبل آمده فقط یک بار نوشته می‌شود
+    # (bitmap شناسه‌های dkp روی فایل mmap، حدود 2.5 مگابایت برای کل کاتالوگ)
+    seen = DkpBitmap(SEEN_FILE, reset=RESET_SEEN)
+    logging.info(f'{len(seen)} محصول از اجراهای قبل در {SEEN_FILE} (برای خروجی کامل: DIGIKALA_RESET_SEEN=1)')
+    # تصاویر با اتصال‌های جدا به CDN و سقف حجم در حال دانلود، همزمان با خزش دریافت می‌شوند
+    images = await ImageDownloader(ImageStore(engine)).__aenter__() if DOWNLOAD_IMAGES else None
+    try:
+        # با DIGIKALA_REPLAY_HAR یا DIGIKALA_REPLAY_HTML پاسخ‌ها از ترافیک ضبط‌شده خوانده می‌شوند
+        async with client_from_env(rate=RATE, cookies=COOKIES, headers=HEADERS) as client:
+            async for item in crawl(client, categories, MAX_PAGES, CONCURRENCY, pages=search_pages,
+                                    expected=expected, on_total=totals.__setitem__, seen=seen,
+                                    on_duplicate=record_price):
+                record_price(item)
+                if images:
+                    await images.add(item.get('تصویر'))
+                if item['تبلیغاتی']:
+                    ads_out.write(item)
+                    ads_parquet.write(from_api_item(item))
+                else:
+                    products_out.write(item)
+                    products_parquet.write(from_api_item(item))
+            print(f'تعداد درخواست‌ها: {client.requests_made}')
+    finally:
+        products_out.close()
+        ads_out.close()
+        products_parquet.close()
+        ads_parquet.close()
+        prices.close()
+        seen.close()
+        record_counts(engine, totals)
+        if images:
+            await images.close()
+            print(f'تصاویر: {images.counts}')
+    print(f'تعداد محصولات واقعی: {products_out.count}')
+    print(f'تعداد محصولات تبلیغاتی: {ads_out.count}')
+    print('خروجی‌ها با موفقیت ذخیره شدند.')
 
-print(f'تعداد محصولات واقعی: {len(all_products)}')
-print(f'تعداد محصولات تبلیغاتی: {len(all_ads)}')
-print('خروجی‌ها با موفقیت ذخیره شدند.') 
\ No newline at end of file
+asyncio.run(main())
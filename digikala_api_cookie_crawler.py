@@ -1,11 +1,23 @@
-import requests
-import json
-import pandas as pd
-import time
+import asyncio
+import logging
+import os
 
-CATEGORY = 'mobile-phone'
+from digikala_api_engine import StreamWriter, crawl, provider_pages
+from digikala_categories import category_counts
+from digikala_prices import observation_from_api_item
+from digikala_replay import client_from_env
+from digikala_seen import DkpBitmap
+from digikala_storage import BufferedWriter, create_db_engine
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+
+CATEGORIES = ['mobile-phone']
 MAX_PAGES = 20
-BASE_URL = 'https://api.digikala.com/v1/providers-products/'
+RATE = 4.0  # حداکثر درخواست در ثانیه (به جای sleep ثابت)
+# شناسه‌های dkp نوشته‌شده؛ ماندگار بین اجراها، پس اجرای بعد فقط محصولات جدید را در خروجی می‌نویسد
+SEEN_FILE = 'digikala_products_providers.seen'
+# DIGIKALA_RESET_SEEN=1: شروع از صفر (خروجی کامل همه محصولات)
+RESET_SEEN = os.environ.get('DIGIKALA_RESET_SEEN', '').lower() in ('1', 'true', 'yes')
 
 COOKIES = {
     'tracker_session': '7WWXNlo',
@@ -18,49 +30,32 @@ HEADERS = {
     'accept': 'application/json, text/plain, */*',
 }
 
-all_products = []
-all_ads = []
+async def main():
+    out = StreamWriter('digikala_products_providers.json', 'digikala_products_providers.csv', root_key='products')
+    # تاریخچه قیمت مشترک با اسپایدر در digikala.db
+    engine = create_db_engine()
+    prices = BufferedWriter(engine)
 
-for page in range(1, MAX_PAGES + 1):
-    params = {
-        'category_code': CATEGORY,
-        'page': page,
-    }
-    print(f'در حال دریافت صفحه {page}...')
-    resp = requests.get(BASE_URL, headers=HEADERS, cookies=COOKIES, params=params)
-    if resp.status_code != 200:
-        print(f'خطا در دریافت صفحه {page}: {resp.status_code}')
-        print(resp.text[:500])
-        break
-    try:
-        data = resp.json()
-    except Exception as e:
-        print(f'خطا در پارس JSON صفحه {page}: {e}')
-        print('پاسخ دریافتی:')
-        print(resp.text)
-        break
-    # محصولات واقعی
-    products = data.get('data', [])
-    print('ساختار data صفحه', page, ':', type(products), products if isinstance(products, (dict, list)) else str(products)[:500])
-    for p in products:
-        if not isinstance(p, dict):
-            continue
-        item = {
-            'نام': p.get('title_fa', ''),
-            'قیمت': p.get('default_variant', {}).get('price', {}).get('selling_price', 0),
-            'برند': p.get('brand', {}).get('title_fa', ''),
-            'امتیاز': p.get('rating', 0),
-            'تعداد_نظرات': p.get('review', {}).get('count', 0),
-            'آدرس': f"https://www.digikala.com/product/dkp-{p.get('id', '')}/",
-            'تبلیغاتی': False
-        }
-        all_products.append(item)
-    time.sleep(1)
+    def record_price(item):
+        prices.add_price(observation_from_api_item(item))
 
-with open('digikala_products_providers.json', 'w', encoding='utf-8') as f:
-    json.dump({'products': all_products}, f, ensure_ascii=False, indent=4)
-
-pd.DataFrame(all_products).to_csv('digikala_products_providers.csv', index=False, encoding='utf-8-sig')
+    # توقف صفحه‌بندی با رسیدن به تعداد شناخته‌شده محصولات دسته (جدول categories)
+    expected = category_counts(engine, CATEGORIES)
+    # محصولی که از دسته دیگری یا در اجرای قبل آمده فقط یک بار نوشته می‌شود (bitmap شناسه‌های dkp روی فایل)
+    seen = DkpBitmap(SEEN_FILE, reset=RESET_SEEN)
+    logging.info(f'{len(seen)} محصول از اجراهای قبل در {SEEN_FILE} (برای خروجی کامل: DIGIKALA_RESET_SEEN=1)')
+    try:
+        # با DIGIKALA_REPLAY_HAR یا DIGIKALA_REPLAY_HTML پاسخ‌ها از ترافیک ضبط‌شده خوانده می‌شوند
+        async with client_from_env(rate=RATE, cookies=COOKIES, headers=HEADERS) as client:
+            async for item in crawl(client, CATEGORIES, MAX_PAGES, pages=provider_pages, expected=expected,
+                                    seen=seen, on_duplicate=record_price):
+                out.write(item)
+                record_price(item)
+    finally:
+        out.close()
+        prices.close()
+        seen.close()
+    print(f'تعداد محصولات واقعی: {out.count}')
+    print('خروجی‌ها با موفقیت ذخیره شدند.')
 
-print(f'تعداد محصولات واقعی: {len(all_products)}')
-print('خروجی‌ها با موفقیت ذخیره شدند.') 
\ No newline at end of file
+asyncio.run(main())
@@ -0,0 +1,263 @@
+import asyncio
+import csv
+import json
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Union
+
+import aiohttp
+
+from digikala_seen import DkpBitmap
+from digikala_storage import parse_product_id
+
+logger = logging.getLogger(__name__)
+
+API_BASE = 'https://api.digikala.com/v1'
+SEARCH_URL = API_BASE + '/categories/{category}/search/'
+PROVIDERS_URL = API_BASE + '/providers-products/'
+
+HEADERS = {
+    'accept': 'application/json, text/plain, */*',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
+    'origin': 'https://www.digikala.com',
+    'referer': 'https://www.digikala.com/',
+    'x-web-client': 'desktop',
+    'x-web-optimize-response': '1',
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# فیلدهایی که فقط برای تاریخچه قیمت (digikala_prices) همراه محصول می‌آیند و در خروجی JSON/CSV نوشته نمی‌شوند
+HISTORY_FIELDS = ('_rrp', '_in_stock')
+
+def parse_retry_after(value: Union[str, bytes, None]) -> Optional[float]:
+    """تبدیل هدر Retry-After (ثانیه یا تاریخ HTTP) به ثانیه؛ هدر اسکرپی bytes و هدر aiohttp رشته است"""
+    if not value:
+        return None
+    value = value.decode('latin-1').strip() if isinstance(value, bytes) else value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """محدودکننده نرخ token bucket؛ جایگزین time.sleep ثابت بین درخواست‌ها"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class ApiClient:
+    """کلاینت async با اتصال‌های keep-alive مشترک و محدودیت نرخ برای API دیجی‌کالا"""
+
+    def __init__(self, rate: float = 4.0, max_connections: int = 16, cookies: Optional[Dict] = None,
+                 headers: Optional[Dict] = None, retries: int = 3, timeout: float = 30.0):
+        self.limiter = TokenBucket(rate)
+        self.max_connections = max_connections
+        self.cookies = cookies or {}
+        self.headers = headers or HEADERS
+        self.retries = retries
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.requests_made = 0
+
+    async def __aenter__(self) -> 'ApiClient':
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            cookies=self.cookies,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.session.close()
+
+    async def get_json(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """دریافت JSON با تلاش مجدد برای خطاهای موقت (429 و 5xx)"""
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            self.requests_made += 1
+            try:
+                async with self.session.get(url, params=params) as resp:
+                    if resp.status == 200:
+                        return await resp.json(content_type=None)
+                    if resp.status not in RETRY_STATUSES:
+                        logger.error(f"خطا در {url} {params or ''}: {resp.status}")
+                        return None
+                    retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                    delay = retry_after if retry_after is not None else 2 ** attempt
+                    logger.warning(f"وضعیت {resp.status} از {url}؛ تلاش مجدد پس از {delay} ثانیه")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                delay = 2 ** attempt
+                logger.warning(f"خطای شبکه در {url}: {str(e)}")
+            if attempt < self.retries:
+                await asyncio.sleep(delay)
+        logger.error(f"دریافت {url} {params or ''} پس از {self.retries + 1} تلاش ناموفق بود")
+        return None
+
+def map_search_product(p: Dict, category: str) -> Dict:
+    """نگاشت محصول endpoint جستجوی دسته به ساختار فارسی خروجی"""
+    img_url = ''
+    images = p.get('images', {})
+    if isinstance(images, dict):
+        urls = images.get('main', {}).get('url', [])
+        img_url = urls[0] if urls else ''
+    return {
+        'نام': p.get('title_fa', ''),
+        'قیمت': p.get('default_variant', {}).get('price', {}).get('selling_price', 0),
+        'برند': p.get('brand', {}).get('title_fa', ''),
+        'امتیاز': p.get('rating', {}).get('rate', 0),
+        'تعداد_نظرات': p.get('rating', {}).get('count', 0),
+        'آدرس': f"https://www.digikala.com{p.get('url', {}).get('uri', '')}",
+        'تصویر': img_url,
+        'دسته': category,
+        'تبلیغاتی': p.get('is_ad', False),
+        '_rrp': p.get('default_variant', {}).get('price', {}).get('rrp_price', 0),
+        '_in_stock': p.get('status') == 'marketable',
+    }
+
+def map_provider_product(p: Dict) -> Dict:
+    """نگاشت محصول endpoint providers-products به ساختار فارسی خروجی"""
+    return {
+        'نام': p.get('title_fa', ''),
+        'قیمت': p.get('default_variant', {}).get('price', {}).get('selling_price', 0),
+        'برند': p.get('brand', {}).get('title_fa', ''),
+        'امتیاز': p.get('rating', 0),
+        'تعداد_نظرات': p.get('review', {}).get('count', 0),
+        'آدرس': f"https://www.digikala.com/product/dkp-{p.get('id', '')}/",
+        'تبلیغاتی': False,
+        '_rrp': p.get('default_variant', {}).get('price', {}).get('rrp_price', 0),
+        '_in_stock': p.get('status') == 'marketable',
+    }
+
+async def search_pages(client: ApiClient, category: str, max_pages: int, expected: Optional[int] = None,
+                       on_total: Optional[Callable[[str, int], None]] = None) -> AsyncIterator[List[Dict]]:
+    """صفحات endpoint جستجوی یک دسته تا اولین صفحه خالی، آخرین صفحه pager یا رسیدن به تعداد محصولات دسته"""
+    url = SEARCH_URL.format(category=category)
+    seen = 0
+    for page in range(1, max_pages + 1):
+        data = await client.get_json(url, {'page': page})
+        body = (data or {}).get('data', {})
+        products = body.get('products', [])
+        if not products:
+            return
+        pager = body.get('pager') or {}
+        if page == 1 and pager.get('total_items') is not None:
+            # تعداد فعلی از pager به تعداد اجرای قبل ترجیح دارد
+            expected = int(pager['total_items'])
+            if on_total is not None:
+                on_total(category, expected)
+        yield [map_search_product(p, category) for p in products]
+        seen += len(products)
+        if (pager.get('total_pages') and page >= pager['total_pages']) or (expected and seen >= expected):
+            return
+
+async def provider_pages(client: ApiClient, category: str, max_pages: int, expected: Optional[int] = None,
+                         on_total: Optional[Callable[[str, int], None]] = None) -> AsyncIterator[List[Dict]]:
+    """صفحات endpoint providers-products یک دسته تا اولین صفحه خالی یا رسیدن به تعداد محصولات دسته"""
+    seen = 0
+    for page in range(1, max_pages + 1):
+        data = await client.get_json(PROVIDERS_URL, {'category_code': category, 'page': page})
+        products = [p for p in (data or {}).get('data', []) or [] if isinstance(p, dict)]
+        if not products:
+            return
+        yield [map_provider_product(p) for p in products]
+        seen += len(products)
+        if expected and seen >= expected:
+            return
+
+async def crawl(client: ApiClient, categories: Iterable[str], max_pages: int, concurrency: int = 8,
+                pages=search_pages, expected: Optional[Dict[str, int]] = None,
+                on_total: Optional[Callable[[str, int], None]] = None,
+                seen: Optional[DkpBitmap] = None,
+                on_duplicate: Optional[Callable[[Dict], None]] = None) -> AsyncIterator[Dict]:
+    """خزش همزمان چند دسته (حداکثر concurrency دسته در لحظه) و تحویل جریانی محصولات"""
+    # expected: تعداد شناخته‌شده محصولات هر دسته برای توقف صفحه‌بندی؛ on_total با تعداد pager هر دسته صدا زده می‌شود
+    # seen: محصولاتی که از دسته دیگری (یا با bitmap فایلی در اجرای قبل) تحویل شده‌اند دوباره تحویل نمی‌شوند
+    # (تبلیغات جدا شمرده می‌شوند)؛ on_duplicate با همین محصولات صدا زده می‌شود، مثلا برای ثبت قیمت
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+    semaphore = asyncio.Semaphore(concurrency)
+    done = object()
+
+    async def worker(category: str) -> None:
+        async with semaphore:
+            logger.info(f'--- دسته‌بندی: {category} ---')
+            try:
+                async for products in pages(client, category, max_pages, (expected or {}).get(category), on_total):
+                    for item in products:
+                        if seen is not None and not item.get('تبلیغاتی'):
+                            product_id = parse_product_id(item['آدرس'])
+                            if product_id is not None and not seen.add(product_id):
+                                if on_duplicate is not None:
+                                    on_duplicate(item)
+                                continue
+                        await queue.put(item)
+            except Exception as e:
+                logger.error(f"خطا در خزش دسته {category}: {str(e)}")
+
+    async def run_all() -> None:
+        await asyncio.gather(*(worker(c) for c in categories))
+        await queue.put(done)
+
+    runner = asyncio.create_task(run_all())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        runner.cancel()
+
+class StreamWriter:
+    """نوشتن تدریجی آرایه JSON و CSV (utf-8-sig) بدون نگه‌داشتن همه محصولات در حافظه"""
+
+    def __init__(self, json_path: str, csv_path: Optional[str] = None, root_key: Optional[str] = None):
+        self.json_path = json_path
+        self.csv_path = csv_path
+        # در صورت تعیین، آرایه داخل {"root_key": [...]} نوشته می‌شود
+        self.root_key = root_key
+        self.count = 0
+        self._json = open(json_path, 'w', encoding='utf-8')
+        self._json.write(f'{{"{root_key}": [' if root_key else '[')
+        self._csv_file = None
+        self._csv = None
+
+    def write(self, item: Dict) -> None:
+        item = {key: value for key, value in item.items() if key not in HISTORY_FIELDS}
+        self._json.write(',\n    ' if self.count else '\n    ')
+        self._json.write(json.dumps(item, ensure_ascii=False, indent=4).replace('\n', '\n    '))
+        if self.csv_path:
+            if self._csv is None:
+                self._csv_file = open(self.csv_path, 'w', encoding='utf-8-sig', newline='')
+                self._csv = csv.DictWriter(self._csv_file, fieldnames=list(item.keys()), extrasaction='ignore')
+                self._csv.writeheader()
+            self._csv.writerow(item)
+        self.count += 1
+
+    def close(self) -> None:
+        self._json.write('\n]' if self.count else ']')
+        if self.root_key:
+            self._json.write('}')
+        self._json.close()
+        if self._csv_file:
+            self._csv_file.close()
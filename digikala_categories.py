@@ -0,0 +1,183 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import case, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from digikala_api_engine import API_BASE, HEADERS
+from digikala_storage import Category, create_db_engine
+
+logger = logging.getLogger(__name__)
+
+DICTIONARIES_URL = API_BASE + '/dictionaries/'
+DICTIONARIES_PARAMS = {'types[0]': 'category_tree'}
+
+# کلیدهای احتمالی تعداد محصولات در گره‌های درخت
+COUNT_KEYS = ('product_count', 'products_count', 'count')
+
+# وزن آخرین مشاهده در میانگین نمایی نرخ تغییر
+CHANGE_RATE_ALPHA = 0.3
+
+ORDERS = ('size', 'change')
+
+def tree_from_dictionaries(data: Dict) -> List[Dict]:
+    """ریشه‌های درخت دسته‌بندی از پاسخ /v1/dictionaries/"""
+    for d in data.get('data', []):
+        if d.get('type') == 'category_tree':
+            return d['data']['tree']
+    return []
+
+def iter_nodes(tree: List[Dict]) -> Iterator[Tuple[Dict, Optional[str], int]]:
+    """پیمایش غیربازگشتی درخت: (گره، کد والد، عمق)"""
+    stack = [(node, None, 0) for node in reversed(tree)]
+    while stack:
+        node, parent, depth = stack.pop()
+        yield node, parent, depth
+        stack.extend((child, node.get('code'), depth + 1) for child in reversed(node.get('children') or []))
+
+def _node_count(node: Dict) -> Optional[int]:
+    for key in COUNT_KEYS:
+        if isinstance(node.get(key), int):
+            return node[key]
+    return None
+
+def save_tree(engine, data: Dict) -> int:
+    """ذخیره درخت در جدول categories؛ تعداد و نرخ تغییر اجراهای قبل حفظ می‌شود و گره‌های حذف‌شده پاک می‌شوند"""
+    now = datetime.utcnow()
+    rows = []
+    for node, parent, depth in iter_nodes(tree_from_dictionaries(data)):
+        if not node.get('code'):
+            continue
+        rows.append({
+            'code': node['code'],
+            'category_id': node.get('id'),
+            'parent_code': parent,
+            'title_fa': node.get('title_fa'),
+            'title_en': node.get('title_en'),
+            'depth': depth,
+            'is_leaf': not node.get('children'),
+            'product_count': _node_count(node),
+            'updated_at': now,
+        })
+    if not rows:
+        logger.error('درخت دسته‌بندی در پاسخ یافت نشد')
+        return 0
+    statement = sqlite_insert(Category.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['code'],
+        set_={
+            'category_id': statement.excluded.category_id,
+            'parent_code': statement.excluded.parent_code,
+            'title_fa': statement.excluded.title_fa,
+            'title_en': statement.excluded.title_en,
+            'depth': statement.excluded.depth,
+            'is_leaf': statement.excluded.is_leaf,
+            'product_count': func.coalesce(statement.excluded.product_count, Category.__table__.c.product_count),
+            'updated_at': statement.excluded.updated_at,
+        },
+    )
+    with engine.begin() as conn:
+        conn.execute(statement, rows)
+        conn.execute(Category.__table__.delete().where(Category.__table__.c.updated_at < now))
+    leaves = sum(1 for row in rows if row['is_leaf'])
+    logger.info(f"درخت دسته‌بندی ذخیره شد: {len(rows)} دسته، {leaves} برگ")
+    return len(rows)
+
+def has_tree(engine) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(select(Category.__table__.c.code).limit(1)).first() is not None
+
+def leaf_categories(engine, order: str = 'size', limit: Optional[int] = None) -> List[Dict]:
+    """برگ‌های درخت به ترتیب اولویت خزش؛ دسته‌های بدون تعداد شناخته‌شده اول می‌آیند تا اندازه‌شان معلوم شود"""
+    if order not in ORDERS:
+        raise ValueError(f"ترتیب نامعتبر: {order} (مجاز: {', '.join(ORDERS)})")
+    c = Category.__table__.c
+    unknown_first = case((c.product_count.is_(None), 0), else_=1)
+    if order == 'size':
+        ordering = [unknown_first, c.product_count.desc(), c.code]
+    else:
+        ordering = [unknown_first, func.coalesce(c.change_rate, 0.0).desc(), c.product_count.desc(), c.code]
+    statement = select(c.code, c.title_fa, c.product_count).where(c.is_leaf.is_(True)).order_by(*ordering)
+    if limit:
+        statement = statement.limit(limit)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(statement)]
+
+def category_counts(engine, codes: List[str]) -> Dict[str, int]:
+    """تعداد شناخته‌شده محصولات دسته‌های داده‌شده (دسته‌های بدون تعداد حذف می‌شوند)"""
+    c = Category.__table__.c
+    with engine.connect() as conn:
+        rows = conn.execute(select(c.code, c.product_count).where(c.code.in_(codes), c.product_count.is_not(None)))
+        return {row.code: row.product_count for row in rows}
+
+# تعداد جدید و به‌روزرسانی میانگین نمایی تغییر نسبی (اولین مشاهده تغییر حساب نمی‌شود)
+RECORD_COUNT_SQL = text(f"""
+UPDATE categories SET
+    change_rate = CASE WHEN product_count IS NULL THEN COALESCE(change_rate, 0.0)
+        ELSE {1 - CHANGE_RATE_ALPHA} * COALESCE(change_rate, 0.0)
+             + {CHANGE_RATE_ALPHA} * ABS(:count - product_count) * 1.0 / MAX(product_count, 1) END,
+    previous_count = product_count,
+    product_count = :count,
+    counted_at = :now
+WHERE code = :code
+""")
+
+def record_counts(engine, counts: Dict[str, int]) -> None:
+    """ثبت تعداد محصولات دسته‌ها (مثلا total_items از pager جستجو) در یک تراکنش"""
+    if not counts:
+        return
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(RECORD_COUNT_SQL, [{'code': code, 'count': count, 'now': now} for code, count in counts.items()])
+
+def fetch_dictionaries() -> Dict:
+    import requests
+
+    resp = requests.get(DICTIONARIES_URL, headers=HEADERS, params=DICTIONARIES_PARAMS, timeout=60)
+    resp.raise_for_status()
+    return resp.json()
+
+def print_tree(engine) -> None:
+    c = Category.__table__.c
+    with engine.connect() as conn:
+        rows = conn.execute(select(c.code, c.parent_code, c.title_fa, c.product_count).order_by(c.depth)).all()
+    children: Dict[Optional[str], list] = {}
+    for row in rows:
+        children.setdefault(row.parent_code, []).append(row)
+    stack = [(row, 0) for row in reversed(children.get(None, []))]
+    while stack:
+        row, level = stack.pop()
+        count = f" [{row.product_count}]" if row.product_count is not None else ''
+        print('  ' * level + f"- {row.title_fa} ({row.code}){count}")
+        stack.extend((child, level + 1) for child in reversed(children.get(row.code, [])))
+
+def main():
+    parser = argparse.ArgumentParser(description='درخت دسته‌بندی دیجی‌کالا و ترتیب خزش برگ‌ها')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    fetch = subparsers.add_parser('fetch', help='دریافت درخت از API (یا از فایل) و ذخیره در دیتابیس')
+    fetch.add_argument('--file', help='پاسخ ذخیره‌شده /v1/dictionaries/ (مثلا digikala_categories.json)')
+    leaves = subparsers.add_parser('leaves', help='برگ‌ها به ترتیب اولویت خزش')
+    leaves.add_argument('--order', choices=ORDERS, default='size')
+    leaves.add_argument('--limit', type=int, default=None)
+    subparsers.add_parser('tree', help='نمایش درخت ذخیره‌شده')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    engine = create_db_engine(args.db)
+    if args.command == 'fetch':
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            data = fetch_dictionaries()
+        save_tree(engine, data)
+    elif args.command == 'leaves':
+        print(json.dumps(leaf_categories(engine, args.order, args.limit), ensure_ascii=False, indent=4))
+    else:
+        print_tree(engine)
+
+if __name__ == '__main__':
+    main()
@@ -3,19 +3,23 @@ import json
 import logging
 import time
 import sqlite3
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
-import concurrent.futures
-import re
 import random
-import os
 from typing import Dict, List, Optional
 from scrapy.http import Response
-from scrapy.exceptions import CloseSpider
+from scrapy.exceptions import CloseSpider, IgnoreRequest
+from scrapy.utils.defer import maybe_deferred_to_future
+import digikala_export
+import digikala_parquet
+from digikala_categories import has_tree, leaf_categories, record_counts
+from digikala_extractors import get_extractor, parse_price, parse_review_count
+from digikala_metrics import timed_callback
+from digikala_parsepool import ParsePool
+import digikala_report
+from digikala_prices import observation_from_listing_item
+from digikala_reviews import comments_page, comments_url, new_reviews
+from digikala_seen import DkpBitmap
+from digikala_storage import BufferedWriter, create_db_engine, listing_fingerprint, make_review_key, parse_product_id
 
 # تنظیمات لاگینگ پیشرفته
 logging.basicConfig(
@@ -28,33 +32,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# تنظیمات پایگاه داده
-Base = declarative_base()
-
-class Product(Base):
-    __tablename__ = 'products'
-    
-    id = Column(Integer, primary_key=True)
-    name = Column(String(255))
-    price = Column(Float)
-    category = Column(String(100))
-    url = Column(Text)
-    description = Column(Text)
-    rating = Column(Float)
-    review_count = Column(Integer)
-    image_url = Column(Text)
-    specs = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-class Review(Base):
-    __tablename__ = 'reviews'
-    id = Column(Integer, primary_key=True)
-    product_id = Column(Integer)
-    product_url = Column(Text)
-    comment = Column(Text)
-    rating = Column(Float)
-    date = Column(String(50))
-    created_at = Column(DateTime, default=datetime.utcnow)
+CATEGORY_URL = 'https://www.digikala.com/search/category-{code}/'
 
 class DigikalaSpider(scrapy.Spider):
     name = 'digikala_spider'
@@ -62,7 +40,8 @@ class DigikalaSpider(scrapy.Spider):
     start_urls = ['https://www.digikala.com/']
     
     custom_settings = {
-        'DOWNLOAD_DELAY': 3.0,  # تاخیر 3 ثانیه بین درخواست‌ها
+        # تاخیر و همزمانی هر میزبان توسط AdaptiveThrottleMiddleware تنظیم می‌شود؛ این مقدار فقط نقطه شروع است
+        'DOWNLOAD_DELAY': 1.0,
         'CONCURRENT_REQUESTS': 32,
         'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
         'ROBOTSTXT_OBEY': True,
@@ -79,251 +58,354 @@ class DigikalaSpider(scrapy.Spider):
         },
         'DOWNLOADER_MIDDLEWARES': {
             'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
+            # پخش دوباره پاسخ‌های ضبط‌شده به جای شبکه (فقط با DIGIKALA_REPLAY_HAR/HTML فعال می‌شود)
+            'digikala_replay.ReplayMiddleware': 50,
             'scrapy.downloadermiddlewares.retry.RetryMiddleware': 90,
-        }
+            'digikala_throttle.AdaptiveThrottleMiddleware': 800,
+            # به‌روزرسانی زمان ذخیره cache پس از 304
+            'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+            'digikala_httpcache.DigikalaHttpCacheMiddleware': 900,
+        },
+        'SPIDER_MIDDLEWARES': {
+            # ack درخواست در frontier پس از پردازش کامل خروجی callback (بیرونی‌ترین middleware)
+            'digikala_frontier.FrontierAckMiddleware': 10,
+        },
+        # محدوده تاخیر (ثانیه) و همزمانی هر میزبان
+        'DIGIKALA_THROTTLE_HOSTS': {
+            'www.digikala.com': {'start_delay': 1.0, 'min_delay': 0.5, 'max_delay': 60.0, 'max_concurrency': 8, 'target_latency': 3.0},
+            'api.digikala.com': {'start_delay': 0.25, 'min_delay': 0.1, 'max_delay': 60.0, 'max_concurrency': 16, 'target_latency': 1.5},
+        },
+        # cache دائمی پاسخ‌ها با اعتبارسنجی شرطی (ETag/Last-Modified)
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': 'httpcache',
+        'HTTPCACHE_POLICY': 'digikala_httpcache.DigikalaCachePolicy',
+        'HTTPCACHE_STORAGE': 'digikala_httpcache.SqliteCacheStorage',
+        'DIGIKALA_CACHE_TTL': {'homepage': 6 * 3600, 'category': 3600, 'product': 24 * 3600, 'api': 1800},
+        'DIGIKALA_CACHE_MAX_BYTES': 2 * 1024 ** 3,
+        # ذخیره دسته‌ای محصولات و نظرات به جای commit برای هر ردیف
+        'ITEM_PIPELINES': {
+            'digikala_storage.DigikalaStoragePipeline': 300,
+            # دانلود تصاویر با نام hash محتوا (فقط با DIGIKALA_IMAGES_ENABLED)
+            'digikala_images.DigikalaImagesPipeline': 400,
+        },
+        'DIGIKALA_IMAGES_ENABLED': False,
+        'DIGIKALA_IMAGES_DIR': 'digikala_images',
+        'DIGIKALA_FLUSH_SIZE': 500,
+        'DIGIKALA_FLUSH_INTERVAL': 5.0,
+        # صف، درخواست‌های دیده‌شده، خطاها و شمارنده محصولات پیوسته در SQLite ذخیره می‌شوند
+        'SCHEDULER': 'digikala_frontier.FrontierScheduler',
+        'DIGIKALA_FRONTIER_PATH': 'crawl_state.sqlite',
+        # متریک‌های زمان callbackها، تاخیر دانلود، عمق صف و flush دیتابیس (لاگ دوره‌ای و crawl_metrics.prom)
+        'EXTENSIONS': {
+            'digikala_metrics.MetricsExtension': 500,
+        },
+        'DIGIKALA_METRICS_INTERVAL': 30.0,
+        'DIGIKALA_METRICS_FILE': 'crawl_metrics.prom',
     }
     
-    def __init__(self, category_url: Optional[str] = None, resume_failed: bool = False):
+    def __init__(self, category_url: Optional[str] = None, resume: bool = False, extractor: str = 'next_data',
+                 incremental: bool = False, parse_workers: int = 0, resume_failed: bool = False,
+                 category_tree: bool = True, category_order: str = 'size', review_pages: int = 0):
         super().__init__()
         self.items_scraped = 0
         self.max_items = 5000  # حداکثر تعداد محصول
         self.start_time = time.time()
         self.failed_urls = []
-        self.engine = create_engine('sqlite:///digikala.db')
-        Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self.engine = create_db_engine('sqlite:///digikala.db')
+        # در صورت فعال بودن pipeline، writer آن جایگزین این مقدار می‌شود
+        self.writer = BufferedWriter(self.engine)
         self.categories_scraped = set()
+        # شناسه dkp محصولاتی که صفحه‌شان در صف گذاشته شده؛ FrontierScheduler نسخه ماندگار (crawl_state.seen) را می‌گذارد
+        self.seen_products = DkpBitmap()
+        # موتور استخراج: next_data (JSON جاسازی‌شده، پیش‌فرض)، lxml یا soup
+        self.extractor = get_extractor(extractor)
+        # پارس در پروسس‌های جدا (-a parse_workers=N) تا دانلودها هنگام پارس صفحات بزرگ متوقف نشوند
+        self.parse_pool = ParsePool(extractor, int(parse_workers)) if int(parse_workers) else None
         self.category_url = category_url
-        self.resume_failed = resume_failed
+        # خزش فقط برگ‌های درخت دسته‌بندی (python digikala_categories.py fetch) به جای لینک‌های صفحه اصلی
+        self.category_tree = str(category_tree).lower() in ('1', 'true', 'yes')
+        self.category_order = category_order
+        # تعداد محصولات دیده‌شده هر دسته برای توقف صفحه‌بندی در total_items فعلی pager
+        self.category_seen: Dict[str, int] = {}
+        # حداکثر صفحات نظر هر محصول از API نظرات (0: فقط نظرهای صفحه محصول)
+        self.review_pages = int(review_pages)
+        # ادامه خزش قبلی از crawl_state.sqlite (resume_failed نام قدیمی همین گزینه است)
+        self.resume = any(str(flag).lower() in ('1', 'true', 'yes') for flag in (resume, resume_failed))
+        # حالت افزایشی: فقط محصولات جدید یا تغییرکرده صفحه جزئیات دارند
+        self.incremental = str(incremental).lower() in ('1', 'true', 'yes')
+        # توسط FrontierScheduler مقداردهی می‌شود (صف، خطاها و بودجه max_items ماندگار و مشترک)
+        self.frontier = None
+        self.frontier_workers_left = 0
+        # توسط MetricsExtension مقداردهی می‌شود
+        self.metrics = None
 
     def start_requests(self):
-        """شروع خزیدن با توجه به پارامتر ورودی یا ادامه از خطاها"""
-        if self.resume_failed and os.path.exists('failed_urls.txt'):
-            with open('failed_urls.txt', 'r', encoding='utf-8') as f:
-                urls = [line.strip() for line in f if line.strip()]
-            logger.info(f"Resume mode: خزیدن از {len(urls)} آدرس ناموفق قبلی")
-            for url in urls:
-                yield scrapy.Request(url=url, callback=self.parse)
-        elif self.category_url:
+        """شروع خزیدن با توجه به پارامتر ورودی؛ در حالت resume درخواست‌های دیده‌شده توسط frontier حذف می‌شوند"""
+        if self.category_url:
             logger.info(f"خزیدن فقط از دسته‌بندی: {self.category_url}")
-            yield scrapy.Request(url=self.category_url, callback=self.parse_category, meta={'category': 'Custom'})
+            yield scrapy.Request(url=self.category_url, callback=self.parse_category, meta={'category': 'Custom'},
+                                 errback=self.request_failed)
+        elif self.category_tree and has_tree(self.engine):
+            leaves = leaf_categories(self.engine, self.category_order)
+            logger.info(f"خزیدن {len(leaves)} دسته برگ از درخت دسته‌بندی (ترتیب: {self.category_order})")
+            for rank, leaf in enumerate(leaves):
+                yield scrapy.Request(
+                    url=CATEGORY_URL.format(code=leaf['code']),
+                    callback=self.parse_category,
+                    errback=self.request_failed,
+                    # تعداد درخت فقط ترتیب را تعیین می‌کند؛ توقف صفحه‌بندی با total_items فعلی pager است
+                    meta={'category': leaf['title_fa'] or leaf['code'], 'category_code': leaf['code']},
+                    # دسته‌های پراولویت‌تر زودتر؛ صفحات محصول (priority=10) همچنان جلوترند
+                    priority=-rank,
+                )
         else:
             for url in self.start_urls:
-                yield scrapy.Request(url=url, callback=self.parse)
+                yield scrapy.Request(url=url, callback=self.parse, errback=self.request_failed)
+
+    async def start(self):
+        """اسکرپی 2.13 به بعد start() را به جای start_requests() فراخوانی می‌کند"""
+        for request in self.start_requests():
+            yield request
+
+    def record_failure(self, request: scrapy.Request, error: str) -> None:
+        """ثبت خطا همراه با callback و تعداد تلاش در crawl_state.sqlite برای ادامه خزش"""
+        self.failed_urls.append(request.url)
+        if self.frontier is not None:
+            self.frontier.fail(self.crawler.request_fingerprinter.fingerprint(request), error)
+
+    def request_failed(self, failure) -> None:
+        """errback درخواست‌ها: خطای دانلود پس از پایان تلاش‌های مجدد"""
+        if failure.check(IgnoreRequest):
+            # robots.txt، offsite یا replay بدون ضبط: خطا نیست و درخواست انجام‌شده علامت می‌خورد
+            if self.frontier is not None:
+                self.frontier.ack(self.crawler.request_fingerprinter.fingerprint(failure.request))
+            return
+        logger.error(f"خطا در دریافت {failure.request.url}: {repr(failure.value)}")
+        self.record_failure(failure.request, repr(failure.value))
             
-    def parse(self, response: Response) -> None:
+    async def extract(self, method: str, *args):
+        """اجرای متد extractor در همین thread یا در ParsePool (نتیجه به صورت Deferred)"""
+        if self.parse_pool is None:
+            return getattr(self.extractor, method)(*args)
+        return await maybe_deferred_to_future(self.parse_pool.submit(method, *args))
+
+    @timed_callback
+    async def parse(self, response: Response) -> None:
         """پارس کردن صفحه اصلی برای یافتن دسته‌بندی‌ها"""
         try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # سلکتور جدید دسته‌بندی‌ها (بر اساس ساختار فعلی سایت)
-            category_links = soup.select('a[data-testid="category-list-item"]')
-            if not category_links:
-                # fallback: جستجو برای لینک‌های دسته‌بندی در منوی اصلی
-                category_links = soup.select('a[href*="/search/category-"]')
-            for link in category_links:
-                href = link.get('href')
-                if href and '/search/category-' in href:
-                    full_url = urljoin(response.url, href)
-                    if full_url not in self.categories_scraped:
-                        self.categories_scraped.add(full_url)
-                        logger.info(f"دسته‌بندی جدید یافت شد: {full_url}")
-                        yield scrapy.Request(
-                            url=full_url,
-                            callback=self.parse_category,
-                            meta={'category': link.text.strip()}
-                        )
+            for full_url, title in await self.extract('categories', response.text, response.url):
+                if full_url not in self.categories_scraped:
+                    self.categories_scraped.add(full_url)
+                    logger.info(f"دسته‌بندی جدید یافت شد: {full_url}")
+                    yield scrapy.Request(
+                        url=full_url,
+                        callback=self.parse_category,
+                        errback=self.request_failed,
+                        meta={'category': title}
+                    )
         except Exception as e:
             logger.error(f"خطا در پارس صفحه اصلی: {str(e)}")
-            self.failed_urls.append(response.url)
+            self.record_failure(response.request, str(e))
             
-    def parse_category(self, response: Response) -> None:
+    @timed_callback
+    async def parse_category(self, response: Response) -> None:
         """پارس کردن صفحات دسته‌بندی برای یافتن محصولات"""
         try:
             category = response.meta.get('category', 'Unknown')
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # سلکتور جدید کارت محصول (بر اساس ساختار فعلی سایت)
-            products = soup.select('div[data-testid="product-card"]')
-            if not products:
-                # fallback: جستجو برای divهایی با لینک محصول
-                products = soup.select('div.c-product-box')
-            for product in products:
-                if self.items_scraped >= self.max_items:
-                    logger.info(f"به حداکثر تعداد محصول ({self.max_items}) رسیدیم")
-                    raise CloseSpider('max_items_reached')
-                item = self.parse_product(product, response.url, category)
-                if item:
-                    self.items_scraped += 1
-                    yield scrapy.Request(
-                        url=item['url'],
-                        callback=self.parse_product_page,
-                        meta={'item': item},
-                        priority=10
-                    )
-            # یافتن صفحه بعدی
-            next_page = soup.select_one('a[aria-label="صفحه بعد"]')
-            if not next_page:
-                next_page = soup.select_one('a[rel="next"]')
-            if next_page and next_page.get('href'):
-                next_page_url = urljoin(response.url, next_page['href'])
+            items, next_page_url = await self.extract('listing', response.text, response.url, category)
+            fresh = []
+            for item in items:
+                item['product_id'] = item.get('product_id') or parse_product_id(item['url'])
+                # تاریخچه قیمت از کارت لیست (فقط تغییرات ذخیره می‌شوند)
+                self.writer.add_price(observation_from_listing_item(item))
+                # محصولی که از دسته دیگری در صف گذاشته شده دوباره درخواست نمی‌شود و از بودجه max_items کم نمی‌کند
+                if item['product_id'] is None or self.seen_products.add(item['product_id']):
+                    fresh.append(item)
+            if len(fresh) < len(items):
+                self.crawler.stats.inc_value('digikala/duplicate_products', len(items) - len(fresh))
+            unchanged = self.unchanged_products(fresh) if self.incremental else set()
+            queued = []
+            budget_reached = False
+            for item in fresh:
+                if item['product_id'] in unchanged:
+                    continue
+                if not self.reserve_item():
+                    budget_reached = True
+                    break
+                self.items_scraped += 1
+                queued.append(item)
+            # فیلدهای کارت پیش از صف‌گذاری درخواست‌ها در crawl_state.sqlite نوشته می‌شوند
+            self.stage_items(queued)
+            for item in queued:
+                yield scrapy.Request(
+                    url=item['url'],
+                    callback=self.parse_product_page,
+                    errback=self.request_failed,
+                    meta=self.product_meta(item),
+                    priority=10
+                )
+            if budget_reached:
+                logger.info(f"به حداکثر تعداد محصول ({self.max_items}) رسیدیم")
+                raise CloseSpider('max_items_reached')
+            # یافتن صفحه بعدی؛ با رسیدن به تعداد فعلی محصولات دسته (total_items در pager) صفحه‌بندی متوقف می‌شود
+            code = response.meta.get('category_code')
+            total = response.meta.get('total')
+            if code and 'total' not in response.meta:
+                # صفحه اول دسته: تعداد فعلی از __NEXT_DATA__، مثل total_items مسیر API
+                total = await self.category_total(code, response)
+            if code:
+                self.category_seen[code] = self.category_seen.get(code, 0) + len(items)
+            if next_page_url and total and self.category_seen[code] >= total:
+                logger.info(f"همه {total} محصول دسته {code} دیده شد؛ صفحه بعد دریافت نمی‌شود")
+                self.crawler.stats.inc_value('digikala/category_pages_skipped')
+            elif next_page_url:
                 logger.info(f"رفتن به صفحه بعدی: {next_page_url}")
                 yield scrapy.Request(
                     url=next_page_url,
                     callback=self.parse_category,
-                    meta={'category': category}
+                    errback=self.request_failed,
+                    meta={'category': category, 'category_code': code, 'total': total},
+                    priority=response.request.priority,
                 )
+            elif code and total is None:
+                # بدون pager: پایان صفحه‌بندی یعنی همه محصولات دسته دیده شده‌اند
+                record_counts(self.engine, {code: self.category_seen[code]})
         except Exception as e:
             logger.error(f"خطا در پارس دسته‌بندی {response.url}: {str(e)}")
-            self.failed_urls.append(response.url)
+            self.record_failure(response.request, str(e))
             
-    def parse_product(self, product, base_url: str, category: str) -> Dict:
-        """استخراج اطلاعات اولیه محصول با سلکتورهای جدید"""
-        item = {}
-        try:
-            # نام محصول
-            name = product.select_one('[data-testid="product-title"]')
-            if not name:
-                name = product.select_one('h3')
-            item['name'] = name.text.strip() if name else 'N/A'
-            # قیمت
-            price = product.select_one('[data-testid="price-main"]')
-            if not price:
-                price = product.select_one('div.c-price__value')
-            item['price'] = self.parse_price(price.text.strip()) if price else 0.0
-            # لینک محصول
-            link = product.select_one('a[href*="/product/"]')
-            item['url'] = urljoin(base_url, link['href']) if link else 'N/A'
-            item['category'] = category
-            # تصویر
-            img = product.select_one('img')
-            item['image_url'] = img['src'] if img and img.get('src') else 'N/A'
-            return item
-        except Exception as e:
-            logger.error(f"خطا در پارس محصول: {str(e)}")
+    async def category_total(self, code: str, response: Response) -> Optional[int]:
+        """تعداد فعلی محصولات دسته از pager صفحه اول؛ تعداد و change_rate دسته در جدول categories ثبت می‌شود"""
+        pager = await self.extract('pager', response.text)
+        if not pager or pager.get('total_items') is None:
             return None
-            
-    def parse_product_page(self, response: Response) -> None:
+        total = int(pager['total_items'])
+        record_counts(self.engine, {code: total})
+        return total
+
+    def stage_items(self, items: List[Dict]) -> None:
+        """نوشتن دسته‌ای فیلدهای کارت لیست در جدول staged_items تا درخواست‌های صف فقط شناسه محصول را حمل کنند"""
+        if self.frontier is not None:
+            self.frontier.stage({item['product_id']: item for item in items if item['product_id'] is not None})
+
+    def product_meta(self, item: Dict) -> Dict:
+        # بدون frontier (یا بدون شناسه) کل آیتم مثل قبل در meta می‌ماند
+        if self.frontier is not None and item['product_id'] is not None:
+            return {'product_id': item['product_id']}
+        return {'item': item}
+
+    def listing_item(self, response: Response) -> Optional[Dict]:
+        """آیتم کارت لیست درخواست صفحه محصول (از meta یا از جدول staged_items)"""
+        if 'item' in response.meta:
+            return response.meta['item']
+        return self.frontier.staged(response.meta['product_id'])
+
+    def unstage_item(self, response: Response) -> None:
+        """حذف فیلدهای کارت از staged_items پس از پردازش موفق صفحه محصول"""
+        if 'item' not in response.meta:
+            self.frontier.unstage(response.meta['product_id'])
+
+    def reserve_item(self) -> bool:
+        """رزرو یک محصول از بودجه max_items؛ در اجرای چند worker بودجه بین همه مشترک است"""
+        if self.frontier is not None:
+            return self.frontier.reserve('items_scraped', self.max_items)
+        return self.items_scraped < self.max_items
+
+    def unchanged_products(self, items: List[Dict]) -> set:
+        """محصولاتی که اثر انگشت کارتشان با دیتابیس یکی است؛ زمانشان دسته‌ای به‌روز می‌شود"""
+        stored = self.writer.stored_fingerprints([item['product_id'] for item in items])
+        unchanged = [
+            item['product_id'] for item in items
+            if item['product_id'] in stored and stored[item['product_id']] == listing_fingerprint(item)
+        ]
+        if unchanged:
+            self.writer.touch_products(unchanged)
+            self.crawler.stats.inc_value('digikala/listing_unchanged', len(unchanged))
+        return set(unchanged)
+
+    @timed_callback
+    async def parse_product_page(self, response: Response) -> None:
         """پارس کردن صفحه محصول برای اطلاعات اضافی"""
         try:
-            item = response.meta['item']
-            soup = BeautifulSoup(response.text, 'html.parser')
+            item = self.listing_item(response)
+            if item is None:
+                raise ValueError(f"اطلاعات کارت محصول {response.meta.get('product_id')} در staged_items یافت نشد")
+            if 'cached' in response.flags and self.writer.has_product(item.get('product_id')):
+                # صفحه از آخرین خزش تغییری نکرده (cache تازه یا پاسخ 304): فقط قیمت و زمان به‌روز می‌شود
+                self.writer.refresh_product(item)
+                self.crawler.stats.inc_value('digikala/product_page_unchanged')
+                self.unstage_item(response)
+                return
+            details = await self.extract('product_page', response.text)
+            reviews = [{'product_url': item['url'], **review} for review in details.pop('reviews')]
+            # نظرهای همین صفحه که پیش از این ذخیره نشده‌اند، تا API نظرات به خاطر آن‌ها در صفحه اول متوقف نشود
+            fresh_reviews = set()
+            if self.review_pages:
+                fresh_reviews = {make_review_key(review) for review in reviews}
+                fresh_reviews -= self.writer.stored_review_keys(item.get('product_id'))
+            item.update(details)
+            item['specs'] = json.dumps(details['specs'], ensure_ascii=False)
             
-            # استخراج توضیحات
-            description = soup.select_one('div.c-product__description')
-            item['description'] = description.text.strip() if description else 'N/A'
-            
-            # استخراج امتیاز و تعداد نظرات
-            rating = soup.select_one('span.c-product__rating-score')
-            item['rating'] = float(rating.text.strip()) if rating else 0.0
-            
-            review_count = soup.select_one('span.c-product__review-count')
-            item['review_count'] = self.parse_review_count(review_count.text.strip()) if review_count else 0
-            
-            # استخراج مشخصات فنی
-            specs = self.parse_specifications(soup)
-            item['specs'] = json.dumps(specs, ensure_ascii=False)
-            
-            # ذخیره در پایگاه داده
-            self.save_to_db(item)
-            
-            # استخراج نظرات کاربران
-            yield from self.parse_reviews(soup, item)
+            # نظرات کاربران (ذخیره در دیتابیس توسط DigikalaStoragePipeline)
+            for review in reviews:
+                yield review
             
             logger.info(f"محصول پردازش شد: {item['name']} (URL: {item['url']})")
             yield item
+            self.unstage_item(response)
+            if self.review_pages and item.get('product_id'):
+                # صفحات نظر روی میزبان api.digikala.com با throttle جدا، همزمان با صفحات محصول خوانده می‌شوند
+                yield scrapy.Request(
+                    url=comments_url(item['product_id']),
+                    callback=self.parse_comments,
+                    errback=self.request_failed,
+                    meta={'product_id': item['product_id'], 'product_url': item['url'], 'page': 1,
+                          'fresh_reviews': sorted(fresh_reviews)},
+                    priority=5,
+                )
         except Exception as e:
             logger.error(f"خطا در پارس صفحه محصول {response.url}: {str(e)}")
-            self.failed_urls.append(response.url)
+            self.record_failure(response.request, str(e))
             
+    @timed_callback
+    async def parse_comments(self, response: Response) -> None:
+        """پارس صفحه JSON نظرات و رفتن به صفحه بعد تا رسیدن به نظرهای ذخیره‌شده"""
+        try:
+            product_id = response.meta['product_id']
+            page = response.meta['page']
+            comments, total_pages = comments_page(json.loads(response.text))
+            known = self.writer.stored_review_keys(product_id) - set(response.meta['fresh_reviews'])
+            reviews, reached_known = new_reviews(comments, product_id, response.meta['product_url'], known)
+            for review in reviews:
+                yield review
+            self.crawler.stats.inc_value('digikala/api_reviews', len(reviews))
+            if comments and not reached_known and page < min(total_pages or page + 1, self.review_pages):
+                yield scrapy.Request(
+                    url=comments_url(product_id, page + 1),
+                    callback=self.parse_comments,
+                    errback=self.request_failed,
+                    meta={**response.meta, 'page': page + 1},
+                    priority=response.request.priority,
+                )
+        except Exception as e:
+            logger.error(f"خطا در پارس نظرات {response.url}: {str(e)}")
+            self.record_failure(response.request, str(e))
+
     def parse_price(self, price_text: str) -> float:
         """پارس کردن قیمت به عدد اعشاری"""
-        try:
-            price = re.sub(r'[^\d]', '', price_text)
-            return float(price) / 10 if price else 0.0
-        except ValueError:
-            return 0.0
+        return parse_price(price_text)
             
     def parse_review_count(self, review_text: str) -> int:
         """پارس کردن تعداد نظرات"""
-        try:
-            return int(re.sub(r'[^\d]', '', review_text))
-        except ValueError:
-            return 0
-            
-    def get_image_url(self, product) -> str:
-        """استخراج URL تصویر محصول"""
-        try:
-            img = product.select_one('img.c-product-box__img')
-            return img['src'] if img and img['src'] else 'N/A'
-        except Exception:
-            return 'N/A'
-            
-    def parse_specifications(self, soup: BeautifulSoup) -> Dict:
-        """استخراج مشخصات فنی محصول"""
-        specs = {}
-        try:
-            spec_table = soup.select('div.c-product__specifications tr')
-            for row in spec_table:
-                key = row.select_one('th').text.strip()
-                value = row.select_one('td').text.strip()
-                specs[key] = value
-        except Exception as e:
-            logger.error(f"خطا در پارس مشخصات فنی: {str(e)}")
-        return specs
-        
-    def parse_reviews(self, soup: BeautifulSoup, item: Dict) -> List[Dict]:
-        """استخراج نظرات کاربران و ذخیره در دیتابیس"""
-        try:
-            reviews = soup.select('div.c-comment__item')
-            for review in reviews:
-                review_item = {
-                    'product_url': item['url'],
-                    'comment': review.select_one('p.c-comment__text').text.strip() if review.select_one('p.c-comment__text') else 'N/A',
-                    'rating': float(review.select_one('span.c-comment__rating').text.strip()) if review.select_one('span.c-comment__rating') else 0.0,
-                    'date': review.select_one('span.c-comment__date').text.strip() if review.select_one('span.c-comment__date') else 'N/A'
-                }
-                # ذخیره در دیتابیس
-                self.save_review_to_db(review_item)
-                yield review_item
-        except Exception as e:
-            logger.error(f"خطا در پارس نظرات: {str(e)}")
+        return parse_review_count(review_text)
             
     def save_to_db(self, item: Dict) -> None:
-        """ذخیره محصول در پایگاه داده"""
-        try:
-            product = Product(
-                name=item['name'],
-                price=item['price'],
-                category=item['category'],
-                url=item['url'],
-                description=item['description'],
-                rating=item['rating'],
-                review_count=item['review_count'],
-                image_url=item['image_url'],
-                specs=item['specs']
-            )
-            self.session.add(product)
-            self.session.commit()
-            logger.info(f"محصول ذخیره شد در دیتابیس: {item['name']}")
-        except Exception as e:
-            self.session.rollback()
-            logger.error(f"خطا در ذخیره محصول در دیتابیس: {str(e)}")
+        """افزودن محصول به بافر ذخیره دسته‌ای"""
+        self.writer.add_product(item)
 
     def save_review_to_db(self, review_item: Dict) -> None:
-        """ذخیره نظر کاربر در پایگاه داده"""
-        try:
-            review = Review(
-                product_url=review_item['product_url'],
-                comment=review_item['comment'],
-                rating=review_item['rating'],
-                date=review_item['date']
-            )
-            self.session.add(review)
-            self.session.commit()
-            logger.info(f"نظر ذخیره شد در دیتابیس برای محصول: {review_item['product_url']}")
-        except Exception as e:
-            self.session.rollback()
-            logger.error(f"خطا در ذخیره نظر در دیتابیس: {str(e)}")
+        """افزودن نظر کاربر به بافر ذخیره دسته‌ای"""
+        self.writer.add_review(review_item)
             
     def closed(self, reason: str) -> None:
         """اجرای عملیات پایانی"""
@@ -332,123 +414,67 @@ class DigikalaSpider(scrapy.Spider):
         logger.info(f"تعداد محصولات خزیده شده: {self.items_scraped}")
         logger.info(f"زمان کل: {elapsed_time:.2f} ثانیه")
         logger.info(f"تعداد خطاها: {len(self.failed_urls)}")
-        
-        # ذخیره خطاها در فایل
         if self.failed_urls:
-            with open('failed_urls.txt', 'w', encoding='utf-8') as f:
-                f.write('\n'.join(self.failed_urls))
+            # خطاها با callback و تعداد تلاش در crawl_state.sqlite مانده‌اند
+            logger.info("برای تلاش دوباره: scrapy runspider digikala_crawler.py -a resume=True")
         
-        self.session.close()
+        # نوشتن باقیمانده بافر قبل از گزارش و خروجی‌ها
+        self.writer.flush()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+        if self.frontier_workers_left:
+            # گزارش و خروجی‌ها را آخرین worker فعال از دیتابیس مشترک می‌سازد
+            logger.info(f"{self.frontier_workers_left} worker دیگر هنوز فعال است؛ گزارش ساخته نمی‌شود")
+            return
         self.generate_report()
         self.export_structured_json()
         self.export_csv()
+        self.export_parquet()
         
     def generate_report(self) -> None:
         """تولید گزارش آماری و تحلیل هوشمند"""
         try:
             total_items = self.items_scraped
-            categories = list(self.categories_scraped)
             failed_count = len(self.failed_urls)
-            execution_time = time.time() - self.start_time
-            timestamp = datetime.now().isoformat()
-            # تحلیل آماری محصولات
-            products = self.session.query(Product).all()
-            prices = [p.price for p in products if p.price > 0]
-            ratings = [p.rating for p in products if p.rating > 0]
-            avg_price = sum(prices) / len(prices) if prices else 0
-            max_price = max(prices) if prices else 0
-            min_price = min(prices) if prices else 0
-            avg_rating = sum(ratings) / len(ratings) if ratings else 0
-            max_rating = max(ratings) if ratings else 0
-            min_rating = min(ratings) if ratings else 0
-            # سیستم هشدار
-            warnings = []
-            if total_items < 100:
-                warnings.append('تعداد محصولات بسیار کم است!')
-            if failed_count > 50:
-                warnings.append('تعداد خطاها زیاد است!')
+            if self.frontier is not None:
+                # مجموع همه workerها و اجراهای ادامه‌یافته
+                total_items = self.frontier.counter('items_scraped')
+                failed_count = len(self.frontier.failures())
             report = {
                 'total_items': total_items,
-                'categories': categories,
+                'categories': list(self.categories_scraped),
                 'failed_urls': failed_count,
-                'execution_time': execution_time,
-                'timestamp': timestamp,
-                'avg_price': avg_price,
-                'max_price': max_price,
-                'min_price': min_price,
-                'avg_rating': avg_rating,
-                'max_rating': max_rating,
-                'min_rating': min_rating,
-                'warnings': warnings
+                'execution_time': time.time() - self.start_time,
+                'timestamp': datetime.now().isoformat(),
+                # تحلیل آماری محصولات با تجمیع سمت SQL
+                **digikala_report.build_report(self.engine),
+                'warnings': digikala_report.build_warnings(total_items, failed_count),
             }
-            with open('crawler_report.json', 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=4)
-            logger.info("گزارش آماری و تحلیلی تولید شد: crawler_report.json")
-            if warnings:
-                logger.warning(f"هشدارها: {' | '.join(warnings)}")
+            digikala_report.write_report(report, 'crawler_report.json')
         except Exception as e:
             logger.error(f"خطا در تولید گزارش: {str(e)}")
 
     def export_structured_json(self):
         """خروجی JSON ساختارمند: محصولات و نظرات هر محصول به صورت تو در تو"""
         try:
-            products = self.session.query(Product).all()
-            reviews = self.session.query(Review).all()
-            reviews_by_url = {}
-            for r in reviews:
-                reviews_by_url.setdefault(r.product_url, []).append({
-                    'comment': r.comment,
-                    'rating': r.rating,
-                    'date': r.date
-                })
-            data = []
-            for p in products:
-                item = {
-                    'name': p.name,
-                    'price': p.price,
-                    'category': p.category,
-                    'url': p.url,
-                    'description': p.description,
-                    'rating': p.rating,
-                    'review_count': p.review_count,
-                    'image_url': p.image_url,
-                    'specs': json.loads(p.specs) if p.specs else {},
-                    'created_at': p.created_at.isoformat() if p.created_at else None,
-                    'reviews': reviews_by_url.get(p.url, [])
-                }
-                data.append(item)
-            with open('digikala_products_structured.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            logger.info("خروجی JSON ساختارمند تولید شد: digikala_products_structured.json")
+            digikala_export.export_structured_json(self.engine, 'digikala_products_structured.json')
         except Exception as e:
             logger.error(f"خطا در تولید خروجی JSON ساختارمند: {str(e)}")
 
     def export_csv(self):
         """خروجی CSV برای محصولات و نظرات"""
-        import csv
         try:
-            # محصولات
-            products = self.session.query(Product).all()
-            with open('digikala_products.csv', 'w', encoding='utf-8', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['name', 'price', 'category', 'url', 'description', 'rating', 'review_count', 'image_url', 'created_at'])
-                for p in products:
-                    writer.writerow([
-                        p.name, p.price, p.category, p.url, p.description, p.rating, p.review_count, p.image_url, p.created_at.isoformat() if p.created_at else ''
-                    ])
-            # نظرات
-            reviews = self.session.query(Review).all()
-            with open('digikala_reviews.csv', 'w', encoding='utf-8', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['product_url', 'comment', 'rating', 'date', 'created_at'])
-                for r in reviews:
-                    writer.writerow([
-                        r.product_url, r.comment, r.rating, r.date, r.created_at.isoformat() if r.created_at else ''
-                    ])
-            logger.info("خروجی CSV تولید شد: digikala_products.csv و digikala_reviews.csv")
+            digikala_export.export_csv(self.engine, 'digikala_products.csv', 'digikala_reviews.csv')
         except Exception as e:
             logger.error(f"خطا در تولید خروجی CSV: {str(e)}")
 
+    def export_parquet(self):
+        """خروجی Parquet محصولات و نظرات با پارتیشن دسته و تاریخ خزش"""
+        try:
+            digikala_parquet.export_parquet(self.engine, 'digikala_parquet')
+        except Exception as e:
+            logger.error(f"خطا در تولید خروجی Parquet: {str(e)}")
+
 def run_spider():
     """تابع برای اجرای خزنده به صورت مستقل"""
     from scrapy.crawler import CrawlerProcess
@@ -469,18 +495,32 @@ if __name__ == '__main__':
 ## ویژگی‌ها
 - **پشتیبانی از robots.txt**: رعایت سیاست‌های سایت.
 - **ذخیره‌سازی دوگانه**: ذخیره داده‌ها در فایل JSON و پایگاه داده SQLite.
+- **ذخیره دسته‌ای**: محصولات و نظرات در `DigikalaStoragePipeline` بافر و با درج دسته‌ای (حالت WAL) ذخیره می‌شوند (`DIGIKALA_FLUSH_SIZE` و `DIGIKALA_FLUSH_INTERVAL`).
 - **مدیریت خطاها**: لاگینگ پیشرفته و ذخیره URLهای ناموفق.
 - **چندنخی**: استفاده از Scrapy برای مدیریت درخواست‌های همزمان.
+- **پارس چندپروسسی**: با `-a parse_workers=N` استخراج صفحات در `ProcessPoolExecutor` انجام می‌شود و نتیجه به صورت Deferred به callback برمی‌گردد (پاسخ در ثانیه خود اسپایدر روی صفحات replay با و بدون pool: `python benchmarks/bench_parse_pool.py`؛ پروسس‌ها با spawn ساخته می‌شوند).
+- **اجرای آفلاین (replay)**: `ReplayMiddleware` پاسخ‌ها را بر اساس آدرس از فایل‌های HAR و HTML ذخیره‌شده برمی‌گرداند تا خزنده با سرعت CPU روی داده ثابت اجرا شود؛ آدرس ضبط‌نشده رد می‌شود (`DIGIKALA_REPLAY_STRICT=False` برای ارسال به شبکه).
+- **خزش توزیع‌شده**: چند پروسس (یا چند سیستم با فایل مشترک) با `FrontierScheduler` یک صف اولویت‌دار، dedup درخواست‌ها و بودجه max_items مشترک در `crawl_state.sqlite` دارند؛ درخواست worker از کار افتاده پس از `DIGIKALA_FRONTIER_LEASE_TIMEOUT` به صف برمی‌گردد و workerی که `DIGIKALA_FRONTIER_WORKER_TIMEOUT` ثانیه (پیش‌فرض 60) heartbeat نداشته در انتخاب آخرین worker برای ساخت گزارش شمرده نمی‌شود.
 - **گزارش‌گیری**: تولید گزارش آماری و تحلیلی از فرآیند خزیدن.
+- **متریک و پروفایل**: `MetricsExtension` هیستوگرام زمان هر callback (`parse`، `parse_category`، `parse_product_page`)، تاخیر دانلود هر میزبان، عمق صف، مدت flush دیتابیس و آیتم در ثانیه را هر `DIGIKALA_METRICS_INTERVAL` ثانیه لاگ می‌کند (با سهم parse و flush از زمان بازه) و در `crawl_metrics.prom` با قالب Prometheus می‌نویسد؛ endpoint محلی با `DIGIKALA_METRICS_PORT` و پروفایل هر callback با `DIGIKALA_PROFILE_CALLBACKS`.
 - **استخراج پیشرفته**: استخراج نظرات کاربران و مشخصات فنی.
+- **نظرات کامل از API**: با `-a review_pages=N` صفحات endpoint نظرات (`/v1/product/<id>/comments/`) هر محصول تا N صفحه خوانده می‌شود و با رسیدن به اولین نظر ذخیره‌شده (کلید شناسه نظر) متوقف می‌شود؛ برای محصولات پرنظر موجود در دیتابیس: `python digikala_reviews.py --top 100`.
+- **موتور استخراج قابل تعویض**: استخراج مستقیم از JSON جاسازی‌شده `__NEXT_DATA__` (پیش‌فرض، با orjson در صورت نصب)، و در صورت نبود آن استخراج با lxml و سلکتورهای کامپایل‌شده یا BeautifulSoup (`-a extractor=lxml|soup`)؛ مقایسه سرعت با `python benchmarks/bench_extractors.py`.
 - **خروجی ساختارمند**: خروجی JSON تو در تو و CSV برای محصولات و نظرات.
-- **resume و ادامه از خطاها**: قابلیت ادامه خزیدن از URLهای ناموفق قبلی.
+- **تاریخچه قیمت**: قیمت، قیمت قبل از تخفیف و موجودی هر محصول در هر خزش (اسپایدر و خزنده‌های API) فقط در صورت تغییر در جدول `price_history` ذخیره می‌شود (`python digikala_prices.py series dkp-123` و `python digikala_prices.py drops --hours 24 --threshold 0.1`).
+- **خروجی Parquet**: محصولات و نظرات با schema تایپ‌شده Arrow در `digikala_parquet/` با پارتیشن‌بندی Hive بر اساس دسته و تاریخ خزش (`python digikala_parquet.py` بدون خزیدن؛ نیازمند pyarrow).
+- **خروجی جریانی**: خروجی‌ها با cursor و به صورت ردیف به ردیف نوشته می‌شوند و مصرف حافظه به اندازه دیتابیس وابسته نیست (`python digikala_export.py --jsonl`).
+- **resume و ادامه از خطاها**: صف درخواست‌ها، درخواست‌های دیده‌شده، خطاها (با callback و تعداد تلاش) و شمارنده محصولات پیوسته در `crawl_state.sqlite` ذخیره می‌شوند؛ پس از توقف ناگهانی (kill یا کمبود حافظه) خزش از همان نقطه ادامه می‌یابد.
+- **حافظه ثابت در دسته‌های بزرگ**: درخواست‌های در صف روی دیسک‌اند و درخواست صفحه محصول فقط شناسه dkp را در meta حمل می‌کند. فیلدهای کارت لیست تا دانلود صفحه محصول در جدول `staged_items` همان `crawl_state.sqlite` می‌مانند و پس از پردازش حذف می‌شوند. بنابراین حافظه خزنده به اندازه دسته بستگی ندارد.
 - **انتخاب دسته‌بندی خاص**: امکان خزیدن فقط یک دسته‌بندی خاص با پارامتر ورودی.
-- **تحلیل هوشمند**: میانگین قیمت، امتیاز و هشدارهای هوشمند در گزارش.
+- **درخت دسته‌بندی**: با وجود جدول `categories` (`python digikala_categories.py fetch`) فقط دسته‌های برگ خزیده می‌شوند تا محصولات از مسیر دسته‌های والد تکراری دانلود نشوند؛ ترتیب بر اساس تعداد محصولات یا نرخ تغییر آن (`-a category_order=size|change`) و صفحه‌بندی هر دسته با رسیدن به total_items فعلی pager صفحه اول متوقف می‌شود؛ این تعداد پس از هر برگ در `categories` ثبت می‌شود تا ترتیب و `change_rate` اجرای بعد به‌روز باشد (`-a category_tree=False` برای شروع از صفحه اصلی).
+- **حذف محصولات تکراری**: شناسه dkp محصولات در صف‌گذاشته‌شده در یک bitmap فشرده (یک بیت برای هر شناسه، حدود 2.5 مگابایت برای کل کاتالوگ) روی فایل mmap `crawl_state.seen` نگه داشته می‌شود؛ محصولی که از دسته دیگری آمده دوباره درخواست نمی‌شود، با `-a resume=True` حفظ می‌شود و بین workerها مشترک است.
+- **دانلود تصاویر**: با `-s DIGIKALA_IMAGES_ENABLED=True` تصویر محصولات همزمان با خزش با نام hash محتوا در `digikala_images/ab/cd/` ذخیره می‌شود؛ نسخه‌های resize یک تصویر و تصاویر یکسان محصولات مختلف یک بار ذخیره می‌شوند و آدرس‌های ذخیره‌شده با نمایه جدول `images` دوباره دانلود نمی‌شوند.
+- **تحلیل هوشمند**: میانگین قیمت، امتیاز، صدک‌های قیمت و آمار هر دسته‌بندی با تجمیع SQL و هشدارهای هوشمند در گزارش (`python digikala_report.py` بدون خزیدن).
 
 ## پیش‌نیازها
 ```bash
-pip install scrapy beautifulsoup4 sqlalchemy
+pip install scrapy beautifulsoup4 lxml sqlalchemy
 ```
 
 ## نحوه اجرا
@@ -493,9 +533,56 @@ scrapy runspider digikala_crawler.py
 ```bash
 scrapy runspider digikala_crawler.py -a category_url=https://www.digikala.com/search/category-mobile-phone/
 ```
-4. ادامه خزیدن از URLهای ناموفق قبلی:
+4. ادامه خزش متوقف‌شده و تلاش دوباره برای URLهای ناموفق:
+```bash
+scrapy runspider digikala_crawler.py -a resume=True
+python digikala_frontier.py --workers 4 --resume
+```
+5. خزش افزایشی (فقط صفحه محصولاتی که قیمت، نام یا تصویرشان در لیست تغییر کرده یا جدیدند):
+```bash
+scrapy runspider digikala_crawler.py -a incremental=True
+```
+6. خزش با چند worker و صف مشترک (گزارش و خروجی‌ها را آخرین worker می‌سازد):
+```bash
+python digikala_frontier.py --workers 4
+python digikala_frontier.py --workers 4 -a category_url=https://www.digikala.com/search/category-mobile-phone/
+```
+7. پارس صفحات در ۴ پروسس جدا:
+```bash
+scrapy runspider digikala_crawler.py -a parse_workers=4
+```
+8. اجرای آفلاین روی ترافیک ضبط‌شده (HAR یا پوشه HTML با index.json)، بدون ارسال درخواست به سایت:
+```bash
+scrapy runspider digikala_crawler.py -s DIGIKALA_REPLAY_RECORD=replay_corpus   # ضبط پاسخ‌ها هنگام خزش عادی
+scrapy runspider digikala_crawler.py -s DIGIKALA_REPLAY_HTML=replay_corpus -s DIGIKALA_REPLAY_HAR=digikala_network.har
+```
+9. دریافت درخت دسته‌بندی و خزش برگ‌ها به ترتیب نرخ تغییر تعداد محصولات:
+```bash
+python digikala_categories.py fetch
+python digikala_categories.py leaves --order change --limit 20
+scrapy runspider digikala_crawler.py -a category_order=change
+```
+10. دریافت نظرات از API نظرات (تا ۲۰ صفحه برای هر محصول) یا فقط برای ۲۰۰ محصول پرنظر دیتابیس با نرخ ۶ درخواست در ثانیه:
+```bash
+scrapy runspider digikala_crawler.py -a review_pages=20
+python digikala_reviews.py --top 200 --rate 6 --concurrency 8
+```
+11. دانلود تصاویر همراه خزش یا بعدا از دیتابیس / خروجی JSON کراولر API (حداکثر ۳۲ مگابایت در حال دانلود):
+```bash
+scrapy runspider digikala_crawler.py -s DIGIKALA_IMAGES_ENABLED=True
+python digikala_images.py --json digikala_all_products.json --concurrency 16 --max-mb-in-flight 32
+```
+12. جستجوی متنی (FTS5) در محصولات و نظرات دیتابیس، با نتایج مرتب‌شده بر اساس ارتباط:
+```bash
+python digikala_search.py "گوشی سامسونگ ۱۲۸ گیگ"
+python digikala_search.py "کیفیت ساخت" --reviews --limit 50
+python digikala_search.py 'name:اپل OR name:سامسونگ' --raw
+```
+13. متریک‌ها روی http://127.0.0.1:9410/metrics و پروفایل callbackها (cProfile، یا pyinstrument در صورت نصب) در `profiles/`:
 ```bash
-scrapy runspider digikala_crawler.py -a resume_failed=True
+scrapy runspider digikala_crawler.py -s DIGIKALA_METRICS_PORT=9410 -s DIGIKALA_METRICS_INTERVAL=10
+scrapy runspider digikala_crawler.py -s DIGIKALA_PROFILE_CALLBACKS=parse_category,parse_product_page
+scrapy runspider digikala_crawler.py -s DIGIKALA_PROFILE_CALLBACKS=all -s DIGIKALA_PROFILER=pyinstrument
 ```
 
 ## خروجی‌ها
@@ -503,20 +590,27 @@ scrapy runspider digikala_crawler.py -a resume_failed=True
 - **digikala_products_structured.json**: داده‌های محصولات و نظرات به صورت تو در تو.
 - **digikala_products.csv**: محصولات به صورت CSV.
 - **digikala_reviews.csv**: نظرات کاربران به صورت CSV.
+- **digikala_parquet/**: dataset پارکت محصولات و نظرات (`products/category=.../crawl_date=.../*.parquet`).
 - **digikala.db**: پایگاه داده SQLite حاوی محصولات و نظرات.
 - **crawler_report.json**: گزارش آماری و تحلیلی.
-- **failed_urls.txt**: لیست URLهای ناموفق.
+- **crawl_state.sqlite**: وضعیت قابل ادامه خزش (صف، درخواست‌های دیده‌شده، خطاها، شمارنده‌ها و فیلدهای کارت محصولات در صف در جدول `staged_items`).
+- **crawl_state.seen**: bitmap شناسه‌های dkp محصولات در صف‌گذاشته‌شده (همراه crawl_state.sqlite پاک یا حفظ می‌شود).
+- **crawl_metrics.prom**: آخرین متریک‌های خزش با قالب متنی Prometheus (قابل خواندن با textfile collector در node_exporter).
+- **profiles/**: خروجی پروفایل callbackها (`<callback>.prof` و `<callback>.txt`، یا `<callback>.html` برای pyinstrument) در صورت فعال بودن.
+- **digikala_images/**: تصاویر محصولات با نام hash محتوا (SHA-256) در پوشه‌های دو سطحی، در صورت فعال بودن.
 - **digikala_crawler.log**: لاگ اجرای برنامه.
 
 ## نکات
+- پاسخ‌ها در `httpcache/` ذخیره می‌شوند و پس از پایان TTL هر نوع صفحه (`DIGIKALA_CACHE_TTL`) با ETag/Last-Modified اعتبارسنجی می‌شوند؛ صفحه محصولی که تغییر نکرده دوباره پارس نمی‌شود. حجم cache به `DIGIKALA_CACHE_MAX_BYTES` محدود است (غیرفعال‌سازی: `-s HTTPCACHE_ENABLED=False`).
 - حداکثر تعداد محصولات قابل تنظیم است (پیش‌فرض: 5000).
-- تاخیر 3 ثانیه‌ای برای جلوگیری از مسدود شدن IP تنظیم شده است.
+- تاخیر و همزمانی هر میزبان (`www.digikala.com` و `api.digikala.com`) بر اساس زمان پاسخ و نرخ 429/503 به صورت خودکار و در محدوده `DIGIKALA_THROTTLE_HOSTS` تنظیم می‌شود و هدر Retry-After رعایت می‌شود.
 - قبل از خزیدن، فایل robots.txt سایت را بررسی کنید.
 - برای استفاده تجاری، با دیجی‌کالا هماهنگی کنید.
 
 ## ساختار پایگاه داده
-- جدول `products`:
+- جدول `products` (یک ردیف برای هر محصول، upsert بر اساس product_id):
   - id: شناسه یکتا
+  - product_id: شناسه دیجی‌کالا (dkp-...) با ایندکس یکتا
   - name: نام محصول
   - price: قیمت (ریال)
   - category: دسته‌بندی
@@ -527,8 +621,34 @@ scrapy runspider digikala_crawler.py -a resume_failed=True
   - image_url: آدرس تصویر
   - specs: مشخصات فنی (JSON)
   - created_at: زمان ثبت
-- جدول `reviews`:
+  - listing_fingerprint: اثر انگشت کارت محصول (قیمت، نام، تصویر) برای خزش افزایشی
+  - updated_at: زمان آخرین به‌روزرسانی
+- جدول `price_history` (WITHOUT ROWID با کلید product_id و ts؛ فقط تغییرات):
+  - product_id: شناسه دیجی‌کالا
+  - ts: زمان مشاهده (unix)
+  - selling_price: قیمت فروش (ریال)
+  - rrp: قیمت قبل از تخفیف (ریال)
+  - is_ad: تبلیغاتی
+  - in_stock: موجود
+- جدول `price_latest`: آخرین مشاهده هر محصول با همان ستون‌ها
+- جدول `categories` (درخت دسته‌بندی):
+  - code: کد دسته (category-...)
+  - parent_code: کد دسته والد
+  - title_fa / title_en: عنوان
+  - depth: عمق در درخت
+  - is_leaf: برگ بودن (فقط برگ‌ها خزیده می‌شوند)
+  - product_count / previous_count: تعداد محصولات در آخرین و یک اجرای قبل
+  - change_rate: میانگین نمایی تغییر نسبی تعداد محصولات
+- جدول `images` (نمایه تصاویر دانلودشده):
+  - url: آدرس تصویر بدون پارامترهای resize
+  - sha256: hash محتوای فایل
+  - path: مسیر فایل نسبت به `digikala_images/`
+  - size / content_type: حجم و نوع فایل
+- جدول‌های `products_fts` (name، description، specs) و `reviews_fts` (comment): نمایه FTS5 با متن نرمال‌شده (ی/ک عربی، نیم‌فاصله، ارقام فارسی) و rowid برابر id ردیف اصلی؛ همراه هر ذخیره دسته‌ای به‌روز می‌شوند
+- جدول `reviews` (نظرات تکراری نادیده گرفته می‌شوند):
   - id: شناسه یکتا
+  - product_id: شناسه دیجی‌کالا
+  - review_key: کلید یکتای نظر
   - product_url: آدرس محصول
   - comment: متن نظر
   - rating: امتیاز نظر
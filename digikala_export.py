@@ -0,0 +1,127 @@
+import argparse
+import csv
+import json
+import logging
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import select
+
+from digikala_storage import Product, Review, create_db_engine
+
+logger = logging.getLogger(__name__)
+
+# تعداد ردیف‌هایی که در هر نوبت از دیتابیس خوانده می‌شود
+BATCH_SIZE = 1000
+
+PRODUCT_CSV_COLUMNS = ['name', 'price', 'category', 'url', 'description', 'rating', 'review_count', 'image_url', 'created_at']
+REVIEW_CSV_COLUMNS = ['product_url', 'comment', 'rating', 'date', 'created_at']
+
+def _stream(engine, statement, batch_size: int = BATCH_SIZE):
+    """اجرای کوئری با cursor سمت سرور و برگرداندن ردیف‌ها به صورت تکه‌تکه"""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for row in result:
+            yield row
+
+def _sort_key(product_id: Optional[int]) -> int:
+    # NULL در مرتب‌سازی SQLite اول می‌آید؛ شناسه‌های dkp مثبت‌اند
+    return -1 if product_id is None else product_id
+
+def iter_structured_products(engine, batch_size: int = BATCH_SIZE) -> Iterator[Dict]:
+    """تولید محصولات همراه با نظراتشان با merge-join دو cursor مرتب بر اساس product_id"""
+    # url محصول با هر upsert به آخرین نسخه تغییر می‌کند؛ نظرهای ذخیره‌شده با آدرس قدیمی همان product_id را دارند
+    products = _stream(engine, select(Product.__table__).order_by(Product.product_id, Product.id), batch_size)
+    reviews = _stream(
+        engine,
+        select(Review.product_id, Review.comment, Review.rating, Review.date).order_by(Review.product_id, Review.id),
+        batch_size,
+    )
+    review = next(reviews, None)
+    for p in products:
+        product_reviews = []
+        # محصول قدیمی بدون شناسه dkp به هیچ نظری وصل نمی‌شود
+        if p.product_id is not None:
+            # رد کردن نظراتی که محصولی با شناسه آن‌ها وجود ندارد
+            while review is not None and _sort_key(review.product_id) < p.product_id:
+                review = next(reviews, None)
+            while review is not None and review.product_id == p.product_id:
+                product_reviews.append({'comment': review.comment, 'rating': review.rating, 'date': review.date})
+                review = next(reviews, None)
+        yield {
+            'name': p.name,
+            'price': p.price,
+            'category': p.category,
+            'url': p.url,
+            'description': p.description,
+            'rating': p.rating,
+            'review_count': p.review_count,
+            'image_url': p.image_url,
+            'specs': json.loads(p.specs) if p.specs else {},
+            'created_at': p.created_at.isoformat() if p.created_at else None,
+            'reviews': product_reviews,
+        }
+    reviews.close()
+
+def write_json_array(items: Iterator[Dict], path: str) -> int:
+    """نوشتن آرایه JSON به صورت تدریجی، هر بار یک عنصر"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for item in items:
+            f.write(',\n    ' if count else '\n    ')
+            f.write(json.dumps(item, ensure_ascii=False, indent=4).replace('\n', '\n    '))
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+def write_jsonl(items: Iterator[Dict], path: str) -> int:
+    """نوشتن خروجی JSON Lines (هر محصول در یک خط)"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False))
+            f.write('\n')
+            count += 1
+    return count
+
+def export_structured_json(engine, path: str = 'digikala_products_structured.json', jsonl: bool = False) -> int:
+    """خروجی JSON ساختارمند (یا JSON Lines) بدون بارگذاری کل دیتابیس در حافظه"""
+    items = iter_structured_products(engine)
+    count = write_jsonl(items, path) if jsonl else write_json_array(items, path)
+    logger.info(f"خروجی JSON ساختارمند تولید شد: {path} ({count} محصول)")
+    return count
+
+def export_csv(engine, products_path: str = 'digikala_products.csv', reviews_path: str = 'digikala_reviews.csv') -> None:
+    """خروجی CSV محصولات و نظرات به صورت ردیف به ردیف"""
+    with open(products_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PRODUCT_CSV_COLUMNS)
+        for p in _stream(engine, select(Product.__table__).order_by(Product.id)):
+            writer.writerow([
+                p.name, p.price, p.category, p.url, p.description, p.rating, p.review_count, p.image_url,
+                p.created_at.isoformat() if p.created_at else ''
+            ])
+    with open(reviews_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(REVIEW_CSV_COLUMNS)
+        for r in _stream(engine, select(Review.__table__).order_by(Review.id)):
+            writer.writerow([
+                r.product_url, r.comment, r.rating, r.date, r.created_at.isoformat() if r.created_at else ''
+            ])
+    logger.info(f"خروجی CSV تولید شد: {products_path} و {reviews_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description='خروجی گرفتن از digikala.db بدون اجرای خزنده')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    parser.add_argument('--jsonl', action='store_true', help='خروجی JSON Lines به جای آرایه JSON')
+    parser.add_argument('--no-csv', action='store_true', help='عدم تولید خروجی CSV')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    engine = create_db_engine(args.db)
+    path = 'digikala_products_structured.jsonl' if args.jsonl else 'digikala_products_structured.json'
+    export_structured_json(engine, path, jsonl=args.jsonl)
+    if not args.no_csv:
+        export_csv(engine)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,433 @@
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson اختیاری است
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# خروجی استخراج‌کننده‌ها دیکشنری ساده است تا در پروسس‌های دیگر هم قابل استفاده باشد
+
+def parse_price(price_text: str) -> float:
+    """پارس کردن قیمت به عدد اعشاری"""
+    try:
+        price = re.sub(r'[^\d]', '', price_text)
+        return float(price) / 10 if price else 0.0
+    except ValueError:
+        return 0.0
+
+def parse_review_count(review_text: str) -> int:
+    """پارس کردن تعداد نظرات"""
+    try:
+        return int(re.sub(r'[^\d]', '', review_text))
+    except ValueError:
+        return 0
+
+class SoupExtractor:
+    """استخراج با BeautifulSoup و html.parser (رفتار اولیه خزنده)"""
+
+    name = 'soup'
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def _parse(self, html: str):
+        return self._soup(html, 'html.parser')
+
+    def categories(self, html: str, base_url: str) -> List[Tuple[str, str]]:
+        """لینک‌های دسته‌بندی صفحه اصلی به صورت (آدرس، عنوان)"""
+        soup = self._parse(html)
+        # سلکتور جدید دسته‌بندی‌ها (بر اساس ساختار فعلی سایت)
+        links = soup.select('a[data-testid="category-list-item"]')
+        if not links:
+            # fallback: جستجو برای لینک‌های دسته‌بندی در منوی اصلی
+            links = soup.select('a[href*="/search/category-"]')
+        result = []
+        for link in links:
+            href = link.get('href')
+            if href and '/search/category-' in href:
+                result.append((urljoin(base_url, href), link.text.strip()))
+        return result
+
+    def listing(self, html: str, base_url: str, category: str) -> Tuple[List[Dict], Optional[str]]:
+        """کارت‌های محصول صفحه دسته‌بندی و آدرس صفحه بعد"""
+        soup = self._parse(html)
+        # سلکتور جدید کارت محصول (بر اساس ساختار فعلی سایت)
+        cards = soup.select('div[data-testid="product-card"]')
+        if not cards:
+            # fallback: جستجو برای divهایی با لینک محصول
+            cards = soup.select('div.c-product-box')
+        items = []
+        for card in cards:
+            item = self._card(card, base_url, category)
+            if item:
+                items.append(item)
+        next_page = soup.select_one('a[aria-label="صفحه بعد"]')
+        if not next_page:
+            next_page = soup.select_one('a[rel="next"]')
+        next_url = urljoin(base_url, next_page['href']) if next_page and next_page.get('href') else None
+        return items, next_url
+
+    def _card(self, product, base_url: str, category: str) -> Optional[Dict]:
+        item = {}
+        try:
+            name = product.select_one('[data-testid="product-title"]')
+            if not name:
+                name = product.select_one('h3')
+            item['name'] = name.text.strip() if name else 'N/A'
+            price = product.select_one('[data-testid="price-main"]')
+            if not price:
+                price = product.select_one('div.c-price__value')
+            item['price'] = parse_price(price.text.strip()) if price else 0.0
+            link = product.select_one('a[href*="/product/"]')
+            if not link:
+                # کارت‌های فعلی داخل خود لینک محصول قرار دارند
+                link = product.find_parent('a', href=lambda href: href and '/product/' in href)
+            item['url'] = urljoin(base_url, link['href']) if link else 'N/A'
+            item['category'] = category
+            img = product.select_one('img')
+            item['image_url'] = img['src'] if img and img.get('src') else 'N/A'
+            return item
+        except Exception as e:
+            logger.error(f"خطا در پارس محصول: {str(e)}")
+            return None
+
+    def pager(self, html: str) -> Optional[Dict]:
+        """pager صفحه دسته‌بندی (total_items و total_pages)؛ در HTML صفحه تعداد کل محصولات نیست"""
+        return None
+
+    def product_page(self, html: str) -> Dict:
+        """توضیحات، امتیاز، مشخصات فنی و نظرات صفحه محصول"""
+        soup = self._parse(html)
+        description = soup.select_one('div.c-product__description')
+        rating = soup.select_one('span.c-product__rating-score')
+        review_count = soup.select_one('span.c-product__review-count')
+        specs = {}
+        try:
+            for row in soup.select('div.c-product__specifications tr'):
+                specs[row.select_one('th').text.strip()] = row.select_one('td').text.strip()
+        except Exception as e:
+            logger.error(f"خطا در پارس مشخصات فنی: {str(e)}")
+        reviews = []
+        try:
+            for review in soup.select('div.c-comment__item'):
+                comment = review.select_one('p.c-comment__text')
+                review_rating = review.select_one('span.c-comment__rating')
+                date = review.select_one('span.c-comment__date')
+                reviews.append({
+                    'comment': comment.text.strip() if comment else 'N/A',
+                    'rating': float(review_rating.text.strip()) if review_rating else 0.0,
+                    'date': date.text.strip() if date else 'N/A',
+                })
+        except Exception as e:
+            logger.error(f"خطا در پارس نظرات: {str(e)}")
+        return {
+            'description': description.text.strip() if description else 'N/A',
+            'rating': float(rating.text.strip()) if rating else 0.0,
+            'review_count': parse_review_count(review_count.text.strip()) if review_count else 0,
+            'specs': specs,
+            'reviews': reviews,
+        }
+
+class LxmlExtractor(SoupExtractor):
+    """استخراج با lxml و سلکتورهای CSS از پیش کامپایل‌شده (XPath)"""
+
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+        self._fromstring = lxml.html.fromstring
+        # هر سلکتور یک بار به XPath ترجمه و کامپایل می‌شود
+        self._sel = {key: CSSSelector(css) for key, css in {
+            'category_item': 'a[data-testid="category-list-item"]',
+            'category_link': 'a[href*="/search/category-"]',
+            'card': 'div[data-testid="product-card"]',
+            'card_fallback': 'div.c-product-box',
+            'title': '[data-testid="product-title"]',
+            'h3': 'h3',
+            'price': '[data-testid="price-main"]',
+            'price_fallback': 'div.c-price__value',
+            'product_link': 'a[href*="/product/"]',
+            'img': 'img',
+            'next': 'a[aria-label="صفحه بعد"]',
+            'next_fallback': 'a[rel="next"]',
+            'description': 'div.c-product__description',
+            'rating': 'span.c-product__rating-score',
+            'review_count': 'span.c-product__review-count',
+            'spec_row': 'div.c-product__specifications tr',
+            'th': 'th',
+            'td': 'td',
+            'comment': 'div.c-comment__item',
+            'comment_text': 'p.c-comment__text',
+            'comment_rating': 'span.c-comment__rating',
+            'comment_date': 'span.c-comment__date',
+        }.items()}
+
+    def _parse(self, html: str):
+        return self._fromstring(html)
+
+    def _all(self, node, key: str):
+        return self._sel[key](node)
+
+    def _one(self, node, key: str):
+        found = self._sel[key](node)
+        return found[0] if found else None
+
+    @staticmethod
+    def _text(node) -> str:
+        return node.text_content().strip()
+
+    def categories(self, html: str, base_url: str) -> List[Tuple[str, str]]:
+        root = self._parse(html)
+        links = self._all(root, 'category_item') or self._all(root, 'category_link')
+        result = []
+        for link in links:
+            href = link.get('href')
+            if href and '/search/category-' in href:
+                result.append((urljoin(base_url, href), self._text(link)))
+        return result
+
+    def listing(self, html: str, base_url: str, category: str) -> Tuple[List[Dict], Optional[str]]:
+        root = self._parse(html)
+        cards = self._all(root, 'card') or self._all(root, 'card_fallback')
+        items = []
+        for card in cards:
+            item = self._card(card, base_url, category)
+            if item:
+                items.append(item)
+        next_page = self._one(root, 'next')
+        if next_page is None:
+            next_page = self._one(root, 'next_fallback')
+        next_url = urljoin(base_url, next_page.get('href')) if next_page is not None and next_page.get('href') else None
+        return items, next_url
+
+    def _card(self, product, base_url: str, category: str) -> Optional[Dict]:
+        item = {}
+        try:
+            name = self._one(product, 'title')
+            if name is None:
+                name = self._one(product, 'h3')
+            item['name'] = self._text(name) if name is not None else 'N/A'
+            price = self._one(product, 'price')
+            if price is None:
+                price = self._one(product, 'price_fallback')
+            item['price'] = parse_price(self._text(price)) if price is not None else 0.0
+            link = self._one(product, 'product_link')
+            if link is None:
+                # کارت‌های فعلی داخل خود لینک محصول قرار دارند
+                link = next((a for a in product.iterancestors('a') if '/product/' in (a.get('href') or '')), None)
+            item['url'] = urljoin(base_url, link.get('href')) if link is not None else 'N/A'
+            item['category'] = category
+            img = self._one(product, 'img')
+            item['image_url'] = img.get('src') if img is not None and img.get('src') else 'N/A'
+            return item
+        except Exception as e:
+            logger.error(f"خطا در پارس محصول: {str(e)}")
+            return None
+
+    def product_page(self, html: str) -> Dict:
+        root = self._parse(html)
+        description = self._one(root, 'description')
+        rating = self._one(root, 'rating')
+        review_count = self._one(root, 'review_count')
+        specs = {}
+        try:
+            for row in self._all(root, 'spec_row'):
+                specs[self._text(self._one(row, 'th'))] = self._text(self._one(row, 'td'))
+        except Exception as e:
+            logger.error(f"خطا در پارس مشخصات فنی: {str(e)}")
+        reviews = []
+        try:
+            for review in self._all(root, 'comment'):
+                # هر فیلد فقط یک بار جستجو می‌شود
+                comment = self._one(review, 'comment_text')
+                review_rating = self._one(review, 'comment_rating')
+                date = self._one(review, 'comment_date')
+                reviews.append({
+                    'comment': self._text(comment) if comment is not None else 'N/A',
+                    'rating': float(self._text(review_rating)) if review_rating is not None else 0.0,
+                    'date': self._text(date) if date is not None else 'N/A',
+                })
+        except Exception as e:
+            logger.error(f"خطا در پارس نظرات: {str(e)}")
+        return {
+            'description': self._text(description) if description is not None else 'N/A',
+            'rating': float(self._text(rating)) if rating is not None else 0.0,
+            'review_count': parse_review_count(self._text(review_count)) if review_count is not None else 0,
+            'specs': specs,
+            'reviews': reviews,
+        }
+
+NEXT_DATA_START = '<script id="__NEXT_DATA__" type="application/json">'
+SITE_URL = 'https://www.digikala.com'
+
+def extract_next_data(html: str) -> Optional[Dict]:
+    """پیدا کردن و decode کردن فقط JSON جاسازی‌شده __NEXT_DATA__ (بدون ساخت DOM)"""
+    start = html.find(NEXT_DATA_START)
+    if start == -1:
+        return None
+    start += len(NEXT_DATA_START)
+    end = html.find('</script>', start)
+    if end == -1:
+        return None
+    try:
+        return _json_loads(html[start:end])
+    except ValueError as e:
+        logger.error(f"خطا در decode کردن __NEXT_DATA__: {str(e)}")
+        return None
+
+def _find(node: Any, predicate: Callable[[Any], bool]) -> Any:
+    """جستجوی عمقی اولین مقدار منطبق در ساختار JSON"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if predicate(current):
+            return current
+        if isinstance(current, dict):
+            stack.extend(reversed(list(current.values())))
+        elif isinstance(current, list):
+            stack.extend(reversed(current))
+    return None
+
+def _is_pager(value: Any) -> bool:
+    return isinstance(value, dict) and 'current_page' in value and 'total_pages' in value
+
+def _is_product(value: Any) -> bool:
+    return isinstance(value, dict) and 'title_fa' in value and 'id' in value
+
+def _is_product_list(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(_is_product(p) for p in value)
+
+def _product_url(product: Dict) -> str:
+    url = product.get('url')
+    uri = url.get('uri') if isinstance(url, dict) else url
+    return urljoin(SITE_URL, uri) if uri else f"{SITE_URL}/product/dkp-{product['id']}/"
+
+def _selling_price(product: Dict) -> float:
+    variant = product.get('default_variant') or {}
+    price = (variant.get('price') or {}).get('selling_price') if isinstance(variant, dict) else None
+    # قیمت API به ریال است؛ مثل parse_price بر ۱۰ تقسیم می‌شود
+    return float(price) / 10 if price else 0.0
+
+def _rrp_price(product: Dict) -> float:
+    variant = product.get('default_variant') or {}
+    price = (variant.get('price') or {}).get('rrp_price') if isinstance(variant, dict) else None
+    return float(price) / 10 if price else 0.0
+
+def _image_url(product: Dict) -> str:
+    images = product.get('images') or {}
+    urls = (images.get('main') or {}).get('url') if isinstance(images, dict) else None
+    return urls[0] if urls else 'N/A'
+
+def _rating(product: Dict) -> Tuple[float, int]:
+    rating = product.get('rating')
+    if isinstance(rating, dict):
+        return float(rating.get('rate') or 0.0), int(rating.get('count') or 0)
+    # ساختار providers-products: امتیاز عددی و تعداد در review
+    review = product.get('review')
+    count = review.get('count') if isinstance(review, dict) else 0
+    return float(rating or 0.0), int(count or 0)
+
+def product_from_json(product: Dict, category: str) -> Dict:
+    """نگاشت محصول با ساختار API دیجی‌کالا به فیلدهای آیتم"""
+    return {
+        'name': product.get('title_fa') or 'N/A',
+        'price': _selling_price(product),
+        'rrp': _rrp_price(product),
+        'in_stock': product.get('status') == 'marketable' if product.get('status') else None,
+        'url': _product_url(product),
+        'product_id': product['id'],
+        'category': category,
+        'image_url': _image_url(product),
+    }
+
+class NextDataExtractor:
+    """استخراج از JSON جاسازی‌شده صفحات Next.js با بازگشت به استخراج DOM در صورت نبود داده"""
+
+    name = 'next_data'
+
+    def __init__(self, fallback: Optional[SoupExtractor] = None):
+        self.fallback = fallback or LxmlExtractor()
+
+    def categories(self, html: str, base_url: str) -> List[Tuple[str, str]]:
+        data = extract_next_data(html)
+        tree = _find(data, lambda v: isinstance(v, dict) and isinstance(v.get('category_tree'), list)) if data else None
+        if not tree:
+            return self.fallback.categories(html, base_url)
+        result = []
+        for node in tree['category_tree']:
+            if isinstance(node, dict) and node.get('code'):
+                result.append((f"{SITE_URL}/search/category-{node['code']}/", node.get('title_fa') or node['code']))
+        return result
+
+    def listing(self, html: str, base_url: str, category: str) -> Tuple[List[Dict], Optional[str]]:
+        data = extract_next_data(html)
+        products = _find(data, _is_product_list) if data else None
+        if not products:
+            return self.fallback.listing(html, base_url, category)
+        items = [product_from_json(p, category) for p in products]
+        pager = _find(data, _is_pager)
+        next_url = None
+        if pager and pager['current_page'] < pager['total_pages']:
+            next_url = re.sub(r'([?&])page=\d+&?', r'\1', base_url).rstrip('?&')
+            next_url += ('&' if '?' in next_url else '?') + f"page={pager['current_page'] + 1}"
+        return items, next_url
+
+    def pager(self, html: str) -> Optional[Dict]:
+        """pager جاسازی‌شده صفحه دسته‌بندی (همان pager پاسخ API جستجو با total_items)"""
+        data = extract_next_data(html)
+        return _find(data, _is_pager) if data else None
+
+    def product_page(self, html: str) -> Dict:
+        data = extract_next_data(html)
+        product = _find(data, lambda v: isinstance(v, dict) and _is_product(v.get('product'))) if data else None
+        if not product:
+            return self.fallback.product_page(html)
+        product = product['product']
+        rating, review_count = _rating(product)
+        specs = {}
+        for group in product.get('specifications') or []:
+            for attribute in group.get('attributes') or []:
+                if attribute.get('title'):
+                    specs[attribute['title']] = '، '.join(str(v) for v in attribute.get('values') or [])
+        reviews = []
+        for comment in product.get('last_comments') or product.get('comments') or []:
+            reviews.append({
+                'review_id': comment.get('id'),
+                'comment': comment.get('body') or 'N/A',
+                'rating': float(comment.get('rate') or 0.0),
+                'date': comment.get('created_at') or 'N/A',
+            })
+        review = product.get('review') if isinstance(product.get('review'), dict) else {}
+        expert = product.get('expert_reviews') if isinstance(product.get('expert_reviews'), dict) else {}
+        return {
+            'description': review.get('description') or expert.get('description') or 'N/A',
+            'rating': rating,
+            'review_count': int(product.get('comments_count') or review_count),
+            'specs': specs,
+            'reviews': reviews,
+        }
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+    NextDataExtractor.name: NextDataExtractor,
+}
+
+_instances: Dict[str, Any] = {}
+
+def get_extractor(name: str = 'next_data'):
+    """نمونه (cache شده) استخراج‌کننده با نام داده‌شده"""
+    if name not in EXTRACTORS:
+        raise ValueError(f"استخراج‌کننده ناشناخته: {name} (گزینه‌ها: {', '.join(EXTRACTORS)})")
+    if name not in _instances:
+        _instances[name] = EXTRACTORS[name]()
+    return _instances[name]
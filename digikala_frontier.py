@@ -0,0 +1,387 @@
+import argparse
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.utils.request import request_from_dict
+
+from digikala_seen import DkpBitmap
+
+logger = logging.getLogger(__name__)
+
+# فاصله به‌روزرسانی seen_at هر worker در جدول workers (ثانیه)
+HEARTBEAT_INTERVAL = 10.0
+
+# state: 0 در صف، 1 اجاره‌شده توسط یک worker، 2 انجام‌شده، 3 ناموفق (خطای دانلود/پارس یا max_attempts)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    fingerprint BLOB NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    callback TEXT,
+    payload BLOB NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    leased_at REAL,
+    done_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_requests_pending ON requests (state, priority DESC, id);
+CREATE INDEX IF NOT EXISTS ix_requests_done_at ON requests (done_at);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, started_at REAL, seen_at REAL);
+CREATE TABLE IF NOT EXISTS staged_items (product_id INTEGER PRIMARY KEY, payload BLOB NOT NULL);
+"""
+
+def seen_path(frontier_path: str) -> str:
+    """فایل bitmap محصولات دیده‌شده کنار فایل frontier (crawl_state.sqlite -> crawl_state.seen)"""
+    return os.path.splitext(frontier_path)[0] + '.seen'
+
+class SqliteFrontier:
+    """صف درخواست، dedup و وضعیت قابل ادامه خزش روی یک فایل SQLite (مشترک بین چند پروسس)"""
+
+    def __init__(self, path: str = 'crawl_state.sqlite', lease_timeout: float = 600.0, max_attempts: int = 3,
+                 idle_grace: float = 10.0, worker_timeout: float = 60.0):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        # workerی که این مدت heartbeat نداشته از کار افتاده است و در شمارش workerهای فعال نمی‌آید
+        self.worker_timeout = worker_timeout
+        # درخواستی که تازه دانلود شده ممکن است هنوز در callback درخواست جدید بسازد
+        self.idle_grace = idle_grace
+        self.max_attempts = max_attempts
+        self.worker = f'{socket.gethostname()}-{os.getpid()}'
+        # autocommit؛ هر دستور یک تراکنش کوتاه است و قفل نوشتن زود آزاد می‌شود
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def reset(self) -> None:
+        """پاک کردن وضعیت خزش قبلی برای شروع از صفر"""
+        self.conn.execute('DELETE FROM requests')
+        self.conn.execute('DELETE FROM counters')
+        self.conn.execute('DELETE FROM workers')
+        self.conn.execute('DELETE FROM staged_items')
+        if os.path.exists(seen_path(self.path)):
+            os.remove(seen_path(self.path))
+
+    def release(self) -> int:
+        """برای ادامه خزش متوقف‌شده: درخواست‌های اجاره‌ای و ناموفق دوباره در صف قرار می‌گیرند"""
+        self.conn.execute('DELETE FROM workers')
+        return self.conn.execute(
+            'UPDATE requests SET state = 0, worker = NULL, leased_at = NULL, done_at = NULL WHERE state IN (1, 3)'
+        ).rowcount
+
+    def register(self) -> None:
+        now = time.time()
+        self.conn.execute('INSERT OR REPLACE INTO workers VALUES (?, ?, ?)', (self.worker, now, now))
+
+    def heartbeat(self) -> None:
+        self.conn.execute('UPDATE workers SET seen_at = ? WHERE worker = ?', (time.time(), self.worker))
+
+    def unregister(self) -> int:
+        """حذف این پروسس و workerهای بدون heartbeat از فهرست و برگرداندن تعداد workerهای فعال باقیمانده"""
+        self.conn.execute('DELETE FROM workers WHERE worker = ?', (self.worker,))
+        # ردیف worker از کار افتاده هیچ‌وقت حذف نمی‌شد و گزارش آخرین worker ساخته نمی‌شد
+        stale = self.conn.execute(
+            'DELETE FROM workers WHERE seen_at < ?', (time.time() - self.worker_timeout,)
+        ).rowcount
+        if stale:
+            logger.warning(f"{stale} worker بدون heartbeat در {self.worker_timeout:.0f} ثانیه اخیر حذف شد")
+        return self.conn.execute('SELECT COUNT(*) FROM workers').fetchone()[0]
+
+    def push(self, fingerprint: bytes, url: str, callback: str, payload: bytes, priority: int,
+             force: bool = False) -> bool:
+        """افزودن درخواست؛ درخواست تکراری (در هر worker) رد می‌شود مگر force (مثلاً retry)"""
+        if force:
+            self.conn.execute(
+                'INSERT INTO requests (fingerprint, url, callback, payload, priority) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(fingerprint) DO UPDATE SET payload = excluded.payload, '
+                'priority = excluded.priority, state = 0, worker = NULL, leased_at = NULL, done_at = NULL',
+                (fingerprint, url, callback, payload, priority),
+            )
+            return True
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO requests (fingerprint, url, callback, payload, priority) VALUES (?, ?, ?, ?, ?)',
+            (fingerprint, url, callback, payload, priority),
+        )
+        return cursor.rowcount == 1
+
+    def pop(self) -> Optional[tuple]:
+        """اجاره اتمیک درخواست بعدی با بالاترین اولویت"""
+        row = self.conn.execute(
+            'UPDATE requests SET state = 1, worker = ?, leased_at = ?, attempts = attempts + 1 '
+            'WHERE id = (SELECT id FROM requests WHERE state = 0 ORDER BY priority DESC, id LIMIT 1) '
+            'RETURNING fingerprint, payload',
+            (self.worker, time.time()),
+        ).fetchone()
+        return row
+
+    def ack(self, fingerprint: bytes) -> None:
+        self.conn.execute(
+            'UPDATE requests SET state = 2, done_at = ? WHERE fingerprint = ? AND state = 1 AND worker = ?',
+            (time.time(), fingerprint, self.worker),
+        )
+
+    def fail(self, fingerprint: bytes, error: str) -> None:
+        """ثبت خطای دانلود یا پارس؛ با ادامه خزش (release) دوباره تلاش می‌شود"""
+        self.conn.execute(
+            'UPDATE requests SET state = 3, done_at = ?, error = ? WHERE fingerprint = ?',
+            (time.time(), error[:500], fingerprint),
+        )
+
+    def stage(self, items: Dict[int, Dict]) -> None:
+        """نگه‌داشتن فیلدهای کارت لیست محصولات تا دانلود صفحه محصول (درخواست فقط شناسه را حمل می‌کند)"""
+        if not items:
+            return
+        rows = [(product_id, pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)) for product_id, item in items.items()]
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.executemany('INSERT OR REPLACE INTO staged_items (product_id, payload) VALUES (?, ?)', rows)
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def staged(self, product_id: int) -> Optional[Dict]:
+        row = self.conn.execute('SELECT payload FROM staged_items WHERE product_id = ?', (product_id,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def unstage(self, product_id: int) -> None:
+        self.conn.execute('DELETE FROM staged_items WHERE product_id = ?', (product_id,))
+
+    def failures(self) -> list:
+        """درخواست‌های ناموفق: (url، callback، تعداد تلاش، خطا)"""
+        return self.conn.execute(
+            'SELECT url, callback, attempts, error FROM requests WHERE state = 3 ORDER BY id'
+        ).fetchall()
+
+    def requeue_expired(self) -> int:
+        """برگرداندن درخواست‌های اجاره‌ای workerهای از کار افتاده به صف"""
+        deadline = time.time() - self.lease_timeout
+        self.conn.execute(
+            'UPDATE requests SET state = 3 WHERE state = 1 AND leased_at < ? AND attempts >= ?',
+            (deadline, self.max_attempts),
+        )
+        return self.conn.execute(
+            'UPDATE requests SET state = 0, worker = NULL, leased_at = NULL WHERE state = 1 AND leased_at < ?',
+            (deadline,),
+        ).rowcount
+
+    def pending(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM requests WHERE state = 0').fetchone()[0]
+
+    def in_flight(self) -> int:
+        """درخواست‌های اجاره‌شده و درخواست‌هایی که worker دیگری کمتر از idle_grace ثانیه پیش تمام کرده"""
+        leased = self.conn.execute('SELECT COUNT(*) FROM requests WHERE state = 1').fetchone()[0]
+        recent = self.conn.execute(
+            'SELECT COUNT(*) FROM requests WHERE done_at > ? AND worker != ?',
+            (time.time() - self.idle_grace, self.worker),
+        ).fetchone()[0]
+        return leased + recent
+
+    def reserve(self, name: str, limit: int) -> bool:
+        """افزایش اتمیک شمارنده مشترک فقط اگر به سقف نرسیده باشد (مثلاً بودجه max_items)"""
+        self.conn.execute('INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)', (name,))
+        cursor = self.conn.execute(
+            'UPDATE counters SET value = value + 1 WHERE name = ? AND value < ?', (name, limit)
+        )
+        return cursor.rowcount == 1
+
+    def counter(self, name: str) -> int:
+        row = self.conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def close(self) -> None:
+        self.conn.close()
+
+class FrontierScheduler(BaseScheduler):
+    """scheduler اسکرپی که درخواست‌ها را از SqliteFrontier مشترک می‌گیرد و در آن می‌گذارد"""
+
+    def __init__(self, crawler, path: str, lease_timeout: float, idle_grace: float, managed: bool = False,
+                 worker_timeout: float = 60.0):
+        self.crawler = crawler
+        self.path = path
+        # در اجرای چند worker، پاک‌سازی یا آزادسازی وضعیت را run_workers انجام می‌دهد
+        self.managed = managed
+        self.lease_timeout = lease_timeout
+        self.idle_grace = idle_grace
+        self.worker_timeout = worker_timeout
+        self.frontier: Optional[SqliteFrontier] = None
+        self.spider = None
+        self.last_heartbeat = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = cls(
+            crawler,
+            path=crawler.settings.get('DIGIKALA_FRONTIER_PATH', 'crawl_state.sqlite'),
+            lease_timeout=crawler.settings.getfloat('DIGIKALA_FRONTIER_LEASE_TIMEOUT', 600.0),
+            idle_grace=crawler.settings.getfloat('DIGIKALA_FRONTIER_IDLE_GRACE', 10.0),
+            managed=crawler.settings.getbool('DIGIKALA_FRONTIER_MANAGED', False),
+            worker_timeout=crawler.settings.getfloat('DIGIKALA_FRONTIER_WORKER_TIMEOUT', 60.0),
+        )
+        # اتصال بعد از spider_closed خزنده بسته می‌شود تا closed() بتواند خطاها را بخواند
+        crawler.signals.connect(scheduler._close_frontier, signal=signals.spider_closed)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.frontier = SqliteFrontier(
+            self.path, self.lease_timeout, idle_grace=self.idle_grace, worker_timeout=self.worker_timeout
+        )
+        if not self.managed:
+            if getattr(spider, 'resume', False):
+                released = self.frontier.release()
+                logger.info(
+                    f"ادامه خزش از {self.path}: {self.frontier.pending()} درخواست در صف "
+                    f"({released} درخواست ناتمام یا ناموفق)، {self.frontier.counter('items_scraped')} محصول"
+                )
+            else:
+                self.frontier.reset()
+        self.frontier.register()
+        # خزنده بودجه مشترک max_items را از همین frontier می‌گیرد
+        spider.frontier = self.frontier
+        # محصولات دیده‌شده همراه صف ماندگارند و بین workerها (mmap مشترک) به اشتراک گذاشته می‌شوند
+        spider.seen_products = DkpBitmap(seen_path(self.path))
+        logger.info(f"frontier مشترک: {self.path} (worker: {self.frontier.worker})")
+
+    def close(self, reason):
+        remaining = self.frontier.unregister()
+        self.spider.frontier_workers_left = remaining
+        logger.info(f"worker {self.frontier.worker} خارج شد؛ {remaining} worker دیگر فعال است")
+
+    def _close_frontier(self, spider, reason):
+        self.frontier.close()
+        spider.seen_products.close()
+
+    def _fingerprint(self, request) -> bytes:
+        return self.crawler.request_fingerprinter.fingerprint(request)
+
+    def _heartbeat(self) -> None:
+        now = time.monotonic()
+        if now - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+            self.last_heartbeat = now
+            self.frontier.heartbeat()
+
+    def has_pending_requests(self) -> bool:
+        self._heartbeat()
+        # تا وقتی worker دیگری درخواست در جریان دارد ممکن است درخواست جدید تولید کند
+        return self.frontier.pending() > 0 or self.frontier.in_flight() > 0
+
+    def enqueue_request(self, request) -> bool:
+        payload = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        # فقط retry (که dont_filter دارد) درخواست انجام‌شده را دوباره به صف برمی‌گرداند؛
+        # درخواست‌های شروع هر worker مثل بقیه dedup می‌شوند
+        retry = request.dont_filter and 'retry_times' in request.meta
+        callback = getattr(request.callback, '__name__', None) or 'parse'
+        added = self.frontier.push(
+            self._fingerprint(request), request.url, callback, payload, request.priority, force=retry
+        )
+        stats = self.crawler.stats
+        stats.inc_value('frontier/enqueued' if added else 'frontier/duplicate')
+        return added
+
+    def next_request(self):
+        self._heartbeat()
+        row = self.frontier.pop()
+        if row is None:
+            if self.frontier.requeue_expired():
+                row = self.frontier.pop()
+            if row is None:
+                return None
+        self.crawler.stats.inc_value('frontier/dequeued')
+        request = request_from_dict(pickle.loads(row[1]), spider=self.spider)
+        # درخواست redirect شده meta را نگه می‌دارد؛ FrontierAckMiddleware درخواست اجاره‌شده اصلی را هم ack می‌کند
+        request.meta.setdefault('frontier_fingerprint', row[0])
+        return request
+
+    def __len__(self) -> int:
+        return self.frontier.pending()
+
+class FrontierAckMiddleware:
+    """spider middleware: درخواست وقتی انجام‌شده علامت می‌خورد که همه خروجی callback آن در صف و pipeline رفته باشد"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _frontier(self) -> Optional[SqliteFrontier]:
+        return getattr(self.crawler.spider, 'frontier', None)
+
+    def _ack(self, response) -> None:
+        frontier = self._frontier()
+        if frontier is None:
+            return
+        fingerprints = {self.crawler.request_fingerprinter.fingerprint(response.request)}
+        if response.meta.get('frontier_fingerprint'):
+            fingerprints.add(response.meta['frontier_fingerprint'])
+        for fingerprint in fingerprints:
+            frontier.ack(fingerprint)
+
+    def process_spider_output(self, response, result, spider=None):
+        yield from result
+        self._ack(response)
+
+    async def process_spider_output_async(self, response, result, spider=None):
+        async for item_or_request in result:
+            yield item_or_request
+        self._ack(response)
+
+    def process_spider_exception(self, response, exception, spider=None):
+        # خطای پیش‌بینی‌نشده callback؛ درخواست با resume دوباره اجرا می‌شود
+        frontier = self._frontier()
+        if frontier is not None:
+            frontier.fail(self.crawler.request_fingerprinter.fingerprint(response.request), repr(exception))
+        return None
+
+def run_workers(workers: int, spider_file: str, frontier_path: str, spider_args: list, resume: bool = False) -> int:
+    """اجرای چند پروسس خزنده که یک frontier و یک دیتابیس مشترک دارند"""
+    frontier = SqliteFrontier(frontier_path)
+    if resume:
+        frontier.release()
+    else:
+        frontier.reset()
+    frontier.close()
+    command = [
+        sys.executable, '-m', 'scrapy', 'runspider', spider_file,
+        '-s', 'SCHEDULER=digikala_frontier.FrontierScheduler',
+        '-s', f'DIGIKALA_FRONTIER_PATH={frontier_path}',
+        '-s', 'DIGIKALA_FRONTIER_MANAGED=True',
+        # چند پروسس نمی‌توانند در یک فایل feed بنویسند؛ خروجی‌ها از دیتابیس مشترک ساخته می‌شوند
+        '-s', 'FEEDS={}',
+    ]
+    for arg in spider_args:
+        command += ['-a', arg]
+    processes = []
+    for i in range(workers):
+        processes.append(subprocess.Popen(command))
+        # فاصله کوتاه تا worker اول درخواست‌های شروع را در صف بگذارد
+        time.sleep(1.0 if i == 0 else 0.1)
+    return max(p.wait() for p in processes)
+
+def main():
+    parser = argparse.ArgumentParser(description='اجرای چند worker خزنده دیجی‌کالا با صف مشترک')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--frontier', default='crawl_state.sqlite', help='مسیر فایل صف مشترک')
+    parser.add_argument('--resume', action='store_true', help='ادامه خزش متوقف‌شده به جای شروع از صفر')
+    parser.add_argument('--spider-file', default='digikala_crawler.py')
+    parser.add_argument('-a', dest='spider_args', action='append', default=[], help='آرگومان خزنده (name=value)')
+    args = parser.parse_args()
+    sys.exit(run_workers(args.workers, args.spider_file, args.frontier, args.spider_args, args.resume))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from digikala_api_engine import StreamWriter, map_provider_product, map_search_product
+
+logger = logging.getLogger(__name__)
+
+# کلیدواژه‌های endpoint محصولات
+PRODUCT_ENDPOINTS = [
+    'product-list',
+    'providers-products',
+    'search',
+    'category',
+]
+
+# اندازه هر بار خواندن از فایل HAR
+CHUNK_SIZE = 1 << 20
+
+CATEGORY_RE = re.compile(r'/categories/([^/?#]+)')
+ENTRIES_RE = re.compile(r'(?<!\\)"entries"\s*:\s*\[')
+
+def iter_entries(f) -> Iterator[Dict]:
+    """پیمایش آرایه log.entries با raw_decode روی بافر تکه‌ای؛ هر entry جداگانه ساخته و رها می‌شود"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def fill(size: int = CHUNK_SIZE) -> bool:
+        nonlocal buffer, eof
+        chunk = f.read(size)
+        if not chunk:
+            eof = True
+            return False
+        buffer += chunk
+        return True
+
+    # پیدا کردن شروع آرایه entries ("entries" داخل رشته‌ها escape شده است)
+    while True:
+        match = ENTRIES_RE.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if not fill():
+            return
+    pos = 0
+    size = CHUNK_SIZE
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buffer):
+            buffer, pos = '', 0
+            if not fill():
+                return
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            entry, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # entry کامل در بافر نیست؛ اندازه خواندن دو برابر می‌شود تا entryهای بزرگ چندبار پارس نشوند
+            buffer, pos = buffer[pos:], 0
+            fill(size)
+            size *= 2
+            continue
+        size = CHUNK_SIZE
+        yield entry
+        pos = end
+        if pos > CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+def iter_har_entries(path: str) -> Iterator[Dict]:
+    """entryهای یک فایل HAR به صورت جریانی (حافظه به اندازه بزرگ‌ترین entry، نه کل فایل)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_entries(f)
+
+def har_body(content: Dict) -> bytes:
+    text = content.get('text') or ''
+    if content.get('encoding') == 'base64':
+        return base64.b64decode(text)
+    return text.encode('utf-8')
+
+def is_product_xhr(url: str, endpoints: Sequence[str] = PRODUCT_ENDPOINTS) -> bool:
+    return any(ep in url for ep in endpoints)
+
+def save_body(directory: str, body: bytes) -> str:
+    """ذخیره بدنه با نام برابر hash محتوا؛ پاسخ‌های تکراری یک بار نوشته می‌شوند"""
+    path = os.path.join(directory, hashlib.sha1(body).hexdigest() + '.json')
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(body)
+    return path
+
+def products_from_body(url: str, data: Dict) -> List[Dict]:
+    """نگاشت محصولات یک پاسخ JSON به ساختار فارسی خروجی (همان ساختار digikala_api_engine)"""
+    body = data.get('data') if isinstance(data, dict) else None
+    if isinstance(body, list):
+        # providers-products: خود data فهرست محصولات است (مثل provider_pages)
+        products, mapper = body, map_provider_product
+    else:
+        products = body.get('products') if isinstance(body, dict) else None
+        if not isinstance(products, list):
+            return []
+        if 'providers-products' in url:
+            mapper = map_provider_product
+        else:
+            match = CATEGORY_RE.search(url)
+            category = match.group(1) if match else ''
+            mapper = partial(map_search_product, category=category)
+    items = []
+    for product in products:
+        if not isinstance(product, dict):
+            continue
+        # یک محصول با ساختار غیرمنتظره کل استخراج HAR را متوقف نمی‌کند
+        try:
+            items.append(mapper(product))
+        except (AttributeError, TypeError, ValueError, KeyError) as e:
+            logger.warning(f"محصول {product.get('id')} در پاسخ {url} نگاشت نشد: {str(e)}")
+    return items
+
+def extract_har(har_path: str, xhr_path: str = 'extracted_product_xhrs.json', bodies_dir: str = 'har_bodies',
+                products_json: str = 'digikala_har_products.json',
+                products_csv: Optional[str] = 'digikala_har_products.csv') -> Dict[str, int]:
+    """XHRهای محصولات یک HAR: نمونه درخواست‌ها، بدنه هر پاسخ در فایل جدا و محصولات با ساختار استاندارد"""
+    os.makedirs(bodies_dir, exist_ok=True)
+    xhrs = StreamWriter(xhr_path)
+    products = StreamWriter(products_json, products_csv)
+    seen = set()
+    entries = 0
+    for entry in iter_har_entries(har_path):
+        entries += 1
+        req = entry.get('request', {})
+        url = req.get('url', '')
+        # فیلتر آدرس پیش از decode بدنه؛ بدنه entryهای بی‌ربط هرگز پارس نمی‌شود
+        if not is_product_xhr(url):
+            continue
+        resp = entry.get('response', {})
+        content = resp.get('content', {})
+        if resp.get('status', 0) != 200 or 'json' not in content.get('mimeType', ''):
+            continue
+        body = har_body(content)
+        if len(body) <= 100:
+            continue
+        body_file = save_body(bodies_dir, body)
+        xhrs.write({
+            'url': url,
+            'method': req.get('method', ''),
+            'headers': {h['name']: h['value'] for h in req.get('headers', [])},
+            'params': {q['name']: q['value'] for q in req.get('queryString', [])},
+            'sample_response': body[:1000].decode('utf-8', 'ignore'),
+            'body_file': body_file,
+        })
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            logger.error(f"خطا در پارس پاسخ {url}: {str(e)}")
+            continue
+        for product in products_from_body(url, data):
+            if product['آدرس'] in seen:
+                continue
+            seen.add(product['آدرس'])
+            products.write(product)
+    xhrs.close()
+    products.close()
+    return {'entries': entries, 'xhrs': xhrs.count, 'products': products.count}
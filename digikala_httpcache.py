@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Optional
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.request import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# هدرهای پاسخ 304 که در پاسخ ذخیره‌شده جایگزین می‌شوند
+REVALIDATION_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Date')
+# هر چند بار ذخیره، حجم کل از دیتابیس خوانده می‌شود تا نوشته‌های پروسس‌های دیگر هم دیده شوند
+SYNC_EVERY = 200
+
+# مدت اعتبار (ثانیه) هر نوع صفحه پیش از اعتبارسنجی شرطی دوباره
+DEFAULT_TTL = {
+    'homepage': 6 * 3600,
+    'category': 3600,
+    'product': 24 * 3600,
+    'api': 1800,
+    'other': 24 * 3600,
+}
+
+def page_type(url: str) -> str:
+    """تشخیص نوع صفحه از روی آدرس"""
+    if '://api.digikala.com/' in url:
+        return 'api'
+    if '/product/dkp-' in url:
+        return 'product'
+    if '/search/category-' in url or '/search/' in url:
+        return 'category'
+    if url.rstrip('/').endswith('digikala.com'):
+        return 'homepage'
+    return 'other'
+
+class DigikalaCachePolicy(RFC2616Policy):
+    """سیاست cache با TTL جداگانه برای هر نوع صفحه و اعتبارسنجی شرطی با ETag/Last-Modified"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ttl = {**DEFAULT_TTL, **settings.getdict('DIGIKALA_CACHE_TTL')}
+
+    def should_cache_response(self, response, request) -> bool:
+        cc = self._parse_cachecontrol(response)
+        # عمر پاسخ با TTL خودمان تعیین می‌شود، پس نبود max-age یا validator مانع ذخیره نیست
+        return response.status == 200 and b'no-store' not in cc
+
+    def is_cached_response_fresh(self, cachedresponse, request) -> bool:
+        stored_at = request.meta.get('cache_stored_at', 0)
+        if time.time() - stored_at < self.ttl[page_type(request.url)]:
+            return True
+        # منقضی شده: ارسال If-None-Match / If-Modified-Since در صورت وجود
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+class DigikalaHttpCacheMiddleware(HttpCacheMiddleware):
+    """پس از پاسخ 304 فقط زمان ذخیره و validatorهای پاسخ cache به‌روز می‌شوند و بدنه دوباره ذخیره نمی‌شود"""
+
+    def process_response(self, request, response, *args):
+        cachedresponse = request.meta.get('cached_response')
+        if (
+            response.status == 304 and cachedresponse is not None
+            and hasattr(self.storage, 'touch')
+            and not request.meta.get('dont_cache') and '_dont_cache' not in request.meta
+        ):
+            del request.meta['cached_response']
+            self.stats.inc_value('httpcache/revalidate')
+            for name in REVALIDATION_HEADERS:
+                if name in response.headers:
+                    cachedresponse.headers[name] = response.headers[name]
+            self.storage.touch(self.storage.key(request), response.headers)
+            return cachedresponse
+        return super().process_response(request, response, *args)
+
+class SqliteCacheStorage:
+    """ذخیره پاسخ‌ها در SQLite با بدنه فشرده و حذف کم‌استفاده‌ترین‌ها پس از رسیدن به سقف حجم"""
+
+    def __init__(self, settings):
+        self.cachedir = settings.get('HTTPCACHE_DIR') or 'httpcache'
+        self.max_bytes = settings.getint('DIGIKALA_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+        # هدرهایی که در کلید cache لحاظ می‌شوند (مثلاً نسخه موبایل و دسکتاپ API)
+        self.key_headers = settings.getlist('DIGIKALA_CACHE_KEY_HEADERS', ['Accept', 'x-web-client'])
+        self.conn: Optional[sqlite3.Connection] = None
+        self.total_bytes = 0
+        self.stores = 0
+
+    def open_spider(self, spider) -> None:
+        os.makedirs(self.cachedir, exist_ok=True)
+        path = os.path.join(self.cachedir, f'{spider.name}.sqlite')
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key BLOB PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB,'
+            ' size INTEGER, stored_at REAL, accessed_at REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)')
+        self._sync_total_bytes()
+        logger.info(f"cache پاسخ‌ها: {path} ({self.total_bytes // (1024 * 1024)} MB)")
+
+    def close_spider(self, spider) -> None:
+        self.conn.close()
+
+    def key(self, request) -> bytes:
+        return fingerprint(request, include_headers=self.key_headers)
+
+    def _sync_total_bytes(self) -> None:
+        # total_bytes فقط نوشته‌های همین پروسس را می‌شمارد؛ چند worker در یک فایل cache می‌نویسند
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def retrieve_response(self, spider, request):
+        key = self.key(request)
+        row = self.conn.execute(
+            'SELECT url, status, headers, body, stored_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, stored_at = row
+        self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        request.meta['cache_stored_at'] = stored_at
+        headers = Headers({k.encode('latin-1'): [v.encode('latin-1') for v in vs] for k, vs in json.loads(headers).items()})
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response) -> None:
+        headers: Dict[str, list] = {
+            k.decode('latin-1'): [v.decode('latin-1') for v in vs] for k, vs in response.headers.items()
+        }
+        body = zlib.compress(response.body, 6)
+        key = self.key(request)
+        now = time.time()
+        old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses (key, url, status, headers, body, size, stored_at, accessed_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, response.url, response.status, json.dumps(headers), body, len(body), now, now),
+        )
+        self.total_bytes += len(body) - (old[0] if old else 0)
+        self.stores += 1
+        if self.total_bytes > self.max_bytes or self.stores % SYNC_EVERY == 0:
+            self._sync_total_bytes()
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def touch(self, key: bytes, headers: Headers) -> None:
+        """پاسخ ذخیره‌شده پس از 304 دوباره تازه است؛ validatorهای جدید سرور هم ذخیره می‌شوند"""
+        row = self.conn.execute('SELECT headers FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return
+        stored = json.loads(row[0])
+        for name in REVALIDATION_HEADERS:
+            values = headers.getlist(name)
+            if values:
+                stored = {k: v for k, v in stored.items() if k.lower() != name.lower()}
+                stored[name] = [v.decode('latin-1') for v in values]
+        now = time.time()
+        self.conn.execute(
+            'UPDATE responses SET headers = ?, stored_at = ?, accessed_at = ? WHERE key = ?',
+            (json.dumps(stored), now, now, key),
+        )
+
+    def _evict(self) -> None:
+        """حذف پاسخ‌هایی که دیرتر از همه استفاده شده‌اند تا ۹۰٪ سقف حجم"""
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        while self.total_bytes > target:
+            rows = self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at LIMIT 200').fetchall()
+            if not rows:
+                break
+            self.conn.executemany('DELETE FROM responses WHERE key = ?', [(key,) for key, _ in rows])
+            self.total_bytes -= sum(size for _, size in rows)
+            removed += len(rows)
+        logger.info(f"cache پاسخ‌ها: {removed} پاسخ قدیمی حذف شد")
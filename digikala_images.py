@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from digikala_api_engine import HEADERS, ApiClient
+from digikala_storage import ImageFile, Product, create_db_engine
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = 'digikala_images'
+
+# اندازه یکسان برای همه نسخه‌های یک تصویر روی CDN دیجی‌کالا (پارامتر x-oss-process)
+DEFAULT_RESIZE = 'image/resize,m_lfit,h_800,w_800/quality,q_90'
+
+IMAGE_HEADERS = {**HEADERS, 'accept': 'image/avif,image/webp,image/*,*/*;q=0.8'}
+
+MAX_IMAGE_BYTES = 5 * 1024 ** 2
+MAX_BYTES_IN_FLIGHT = 32 * 1024 ** 2
+CHUNK_SIZE = 64 * 1024
+# سقف صف آدرس‌ها؛ وقتی دانلود عقب بماند add منتظر می‌ماند
+QUEUE_SIZE = 1000
+
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp', 'image/gif': '.gif', 'image/avif': '.avif'}
+
+def canonical_url(url: str) -> str:
+    """آدرس تصویر بدون پارامترهای resize و fragment؛ کلید نمایه URL→hash"""
+    parts = urlsplit(url.strip())
+    return urlunsplit(('https', parts.netloc.lower(), parts.path, '', ''))
+
+def fetch_url(url: str, resize: Optional[str] = DEFAULT_RESIZE) -> str:
+    """آدرس دانلود: تصاویر CDN دیجی‌کالا با یک اندازه ثابت، بقیه همان آدرس اصلی"""
+    canonical = canonical_url(url)
+    if resize and urlsplit(canonical).netloc.endswith('digikala.com'):
+        return f'{canonical}?x-oss-process={resize}'
+    return url
+
+def image_extension(content_type: Optional[str], url: str) -> str:
+    ext = EXTENSIONS.get((content_type or '').split(';')[0].strip())
+    if ext:
+        return ext
+    guessed = os.path.splitext(urlsplit(url).path)[1].lower()
+    return guessed if guessed in EXTENSIONS.values() or guessed == '.jpeg' else '.bin'
+
+class ByteBudget:
+    """سقف بایت‌های در حال دانلود؛ هر دانلود پیش از خواندن بدنه اندازه‌اش را رزرو می‌کند"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int) -> None:
+        async with self._condition:
+            # یک دانلود بزرگ‌تر از سقف فقط وقتی شروع می‌شود که دانلود دیگری در جریان نباشد
+            await self._condition.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+
+    async def release(self, size: int) -> None:
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+class ImageStore:
+    """ذخیره تصاویر با نام hash محتوا در پوشه‌های دو سطحی و نمایه URL→hash در جدول images"""
+
+    def __init__(self, engine, root: str = IMAGES_DIR, flush_size: int = 200):
+        self.engine = engine
+        self.root = root
+        self.flush_size = flush_size
+        self.pending: List[Dict] = []
+
+    def relative_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(sha256[:2], sha256[2:4], sha256 + ext)
+
+    def lookup(self, url: str) -> Optional[str]:
+        """hash تصویر ذخیره‌شده برای آدرس (نرمال‌شده) یا None"""
+        url = canonical_url(url)
+        for row in self.pending:
+            if row['url'] == url:
+                return row['sha256']
+        with self.engine.connect() as conn:
+            return conn.execute(select(ImageFile.sha256).where(ImageFile.url == url)).scalar()
+
+    def put(self, url: str, data: bytes, content_type: Optional[str]) -> bool:
+        """ذخیره محتوا (اگر همین محتوا قبلا ذخیره نشده) و ثبت آدرس؛ True یعنی فایل جدید نوشته شد"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        relative = self.relative_path(sha256, image_extension(content_type, url))
+        path = os.path.join(self.root, relative)
+        created = not os.path.exists(path)
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self.pending.append({
+            'url': canonical_url(url),
+            'sha256': sha256,
+            'path': relative,
+            'size': len(data),
+            'content_type': content_type,
+            'fetched_at': datetime.utcnow(),
+        })
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+        return created
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        statement = sqlite_insert(ImageFile.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['url'],
+            set_={column: statement.excluded[column] for column in ('sha256', 'path', 'size', 'content_type', 'fetched_at')},
+        )
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(statement, self.pending)
+            self.pending = []
+        except Exception as e:
+            logger.error(f"خطا در ذخیره نمایه تصاویر: {str(e)}")
+
+class ImageDownloader:
+    """دانلود همزمان تصاویر با اتصال‌های مشترک؛ آدرس‌ها در طول خزش با add اضافه می‌شوند"""
+
+    def __init__(self, store: ImageStore, rate: float = 20.0, concurrency: int = 16,
+                 max_bytes_in_flight: int = MAX_BYTES_IN_FLIGHT, max_image_bytes: int = MAX_IMAGE_BYTES,
+                 resize: Optional[str] = DEFAULT_RESIZE, queue_size: int = QUEUE_SIZE):
+        self.store = store
+        self.client = ApiClient(rate=rate, max_connections=concurrency, headers=IMAGE_HEADERS)
+        self.concurrency = concurrency
+        self.budget = ByteBudget(max_bytes_in_flight)
+        self.max_image_bytes = min(max_image_bytes, max_bytes_in_flight)
+        self.resize = resize
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # فقط آدرس‌های داخل صف یا در حال دانلود؛ آدرس‌های تمام‌شده از نمایه images (ImageStore.lookup) شناخته می‌شوند
+        self.active = set()
+        self.workers: List[asyncio.Task] = []
+        self.counts = {'urls': 0, 'skipped': 0, 'downloaded': 0, 'deduplicated': 0, 'failed': 0, 'bytes': 0}
+
+    async def __aenter__(self) -> 'ImageDownloader':
+        await self.client.__aenter__()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def add(self, url: Optional[str]) -> None:
+        """افزودن آدرس تصویر به صف؛ با صف پر منتظر می‌ماند (آدرس‌های خالی و در جریان نادیده گرفته می‌شوند)"""
+        if not url or not url.startswith(('http://', 'https://')):
+            return
+        key = canonical_url(url)
+        if key in self.active:
+            return
+        self.active.add(key)
+        self.counts['urls'] += 1
+        await self.queue.put(url)
+
+    async def close(self) -> None:
+        """منتظر ماندن برای صف، توقف workerها و ثبت نمایه"""
+        if self.workers:
+            await self.queue.join()
+            for task in self.workers:
+                task.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+            self.workers = []
+            await self.client.__aexit__()
+        self.store.flush()
+
+    async def worker(self) -> None:
+        while True:
+            url = await self.queue.get()
+            try:
+                await self.download(url)
+            except Exception as e:
+                self.counts['failed'] += 1
+                logger.error(f"خطا در دانلود تصویر {url}: {str(e)}")
+            finally:
+                # آدرس ذخیره‌شده از این پس با lookup (pending یا جدول images) رد می‌شود
+                self.active.discard(canonical_url(url))
+                self.queue.task_done()
+
+    async def download(self, url: str) -> None:
+        if self.store.lookup(url):
+            self.counts['skipped'] += 1
+            return
+        target = fetch_url(url, self.resize)
+        await self.client.limiter.acquire()
+        self.client.requests_made += 1
+        async with self.client.session.get(target) as resp:
+            if resp.status != 200:
+                self.counts['failed'] += 1
+                logger.warning(f"وضعیت {resp.status} برای تصویر {target}")
+                return
+            if resp.content_length and resp.content_length > self.max_image_bytes:
+                self.counts['failed'] += 1
+                logger.warning(f"تصویر {target} بزرگ‌تر از سقف است ({resp.content_length} بایت)")
+                return
+            # بدون Content-Length سقف اندازه تصویر رزرو می‌شود
+            reserved = resp.content_length or self.max_image_bytes
+            await self.budget.acquire(reserved)
+            try:
+                data = bytearray()
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    data.extend(chunk)
+                    if len(data) > reserved:
+                        self.counts['failed'] += 1
+                        logger.warning(f"تصویر {target} بزرگ‌تر از اندازه رزروشده است")
+                        return
+                created = self.store.put(url, bytes(data), resp.content_type)
+            finally:
+                await self.budget.release(reserved)
+        self.counts['downloaded' if created else 'deduplicated'] += 1
+        if created:
+            self.counts['bytes'] += len(data)
+
+async def download_images(store: ImageStore, urls: Iterable[str], **options) -> Dict[str, int]:
+    """دانلود یک فهرست آدرس تصویر؛ options همان پارامترهای ImageDownloader است"""
+    async with ImageDownloader(store, **options) as downloader:
+        for url in urls:
+            await downloader.add(url)
+    return downloader.counts
+
+def product_image_urls(engine) -> List[str]:
+    with engine.connect() as conn:
+        return list(conn.execute(select(Product.image_url).where(Product.image_url.like('http%'))).scalars())
+
+def json_image_urls(path: str) -> List[str]:
+    """آدرس تصاویر خروجی JSON کراولرهای API (فیلد تصویر) یا اسپایدر (image_url)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [item.get('تصویر') or item.get('image_url') for item in data if isinstance(item, dict)]
+
+class DigikalaImagesPipeline:
+    """مرحله pipeline اسکرپی برای دانلود تصویر محصولات همزمان با خزش (با DIGIKALA_IMAGES_ENABLED)"""
+
+    def __init__(self, root: str, options: Dict):
+        self.root = root
+        self.options = options
+        self.downloader: Optional[ImageDownloader] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from scrapy.exceptions import NotConfigured
+
+        settings = crawler.settings
+        if not settings.getbool('DIGIKALA_IMAGES_ENABLED', False):
+            raise NotConfigured
+        return cls(settings.get('DIGIKALA_IMAGES_DIR', IMAGES_DIR), {
+            'rate': settings.getfloat('DIGIKALA_IMAGES_RATE', 20.0),
+            'concurrency': settings.getint('DIGIKALA_IMAGES_CONCURRENCY', 16),
+            'max_bytes_in_flight': settings.getint('DIGIKALA_IMAGES_MAX_BYTES_IN_FLIGHT', MAX_BYTES_IN_FLIGHT),
+        })
+
+    async def open_spider(self, spider):
+        engine = getattr(spider, 'engine', None) or create_db_engine()
+        self.downloader = await ImageDownloader(ImageStore(engine, self.root), **self.options).__aenter__()
+
+    async def process_item(self, item, spider):
+        # با صف پر، item تا آزاد شدن جا منتظر می‌ماند و خزش هم‌پای دانلود تصاویر پیش می‌رود
+        if 'product_url' not in item:
+            await self.downloader.add(item.get('image_url'))
+        return item
+
+    async def close_spider(self, spider):
+        await self.downloader.close()
+        logger.info(f"تصاویر: {self.downloader.counts}")
+
+def main():
+    parser = argparse.ArgumentParser(description='دانلود تصاویر محصولات با نام hash محتوا و حذف تکراری‌ها')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده (نمایه تصاویر و منبع آدرس‌ها)')
+    parser.add_argument('--json', help='خواندن آدرس‌ها از خروجی JSON (مثلا digikala_all_products.json)')
+    parser.add_argument('--dir', default=IMAGES_DIR, help='پوشه تصاویر')
+    parser.add_argument('--rate', type=float, default=20.0, help='حداکثر درخواست در ثانیه')
+    parser.add_argument('--concurrency', type=int, default=16, help='تعداد دانلود همزمان')
+    parser.add_argument('--max-mb-in-flight', type=int, default=MAX_BYTES_IN_FLIGHT // 1024 ** 2,
+                        help='سقف حجم تصاویر در حال دانلود (مگابایت)')
+    parser.add_argument('--original', action='store_true', help='دانلود آدرس اصلی بدون اندازه ثابت')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    engine = create_db_engine(args.db)
+    urls = json_image_urls(args.json) if args.json else product_image_urls(engine)
+    counts = asyncio.run(download_images(
+        ImageStore(engine, args.dir), urls,
+        rate=args.rate,
+        concurrency=args.concurrency,
+        max_bytes_in_flight=args.max_mb_in_flight * 1024 ** 2,
+        resize=None if args.original else DEFAULT_RESIZE,
+    ))
+    logger.info(f"{counts['urls']} آدرس: {counts['downloaded']} تصویر جدید، {counts['deduplicated']} تکراری، "
+                f"{counts['skipped']} از قبل ذخیره‌شده، {counts['failed']} ناموفق ({counts['bytes']} بایت)")
+
+if __name__ == '__main__':
+    main()
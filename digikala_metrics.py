@@ -0,0 +1,386 @@
+import bisect
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import time
+from typing import Dict, Sequence, Tuple
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+logger = logging.getLogger(__name__)
+
+# مرز bucketها به ثانیه (مثل پیش‌فرض کلاینت‌های Prometheus با چند مرز بیشتر برای صفحات کند)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'digikala_callback_seconds': 'زمان اجرای بخش‌های همگام هر فراخوانی callback (بدون انتظار await، پردازش خروجی‌ها در اسکرپی و flush دیتابیس)',
+    'digikala_download_latency_seconds': 'تاخیر دانلود هر پاسخ شبکه به تفکیک میزبان',
+    'digikala_db_flush_seconds': 'مدت هر flush دسته‌ای BufferedWriter',
+    'digikala_db_flush_rows_total': 'تعداد ردیف‌های نوشته‌شده در flushها',
+    'digikala_responses_total': 'تعداد پاسخ‌ها به تفکیک میزبان و منبع (network، cache یا replay)',
+    'digikala_items_scraped_total': 'تعداد آیتم‌های خروجی خزنده',
+    'digikala_items_per_second': 'نرخ آیتم در آخرین بازه گزارش',
+    'digikala_scheduler_queue_depth': 'تعداد درخواست‌های منتظر در scheduler',
+    'digikala_downloader_active': 'درخواست‌های در حال دانلود',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """هیستوگرام با bucketهای ثابت (تجمعی در خروجی Prometheus)"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """تخمین چندک با درون‌یابی خطی داخل bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+class CrawlMetrics:
+    """متریک‌های مسیر داغ خزنده: هیستوگرام‌ها، شمارنده‌ها و gaugeها با برچسب"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        # مجموع زمان flush تا الان؛ timed_callback آن را از زمان callback کم می‌کند
+        self.flush_seconds = 0.0
+        self.profilers: Dict[str, object] = {}
+        # فقط یک profiler در هر لحظه فعال است (cProfile هم‌پوشان روی یک thread خطا می‌دهد)
+        self.profiling = False
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = _labels(**labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        series = self.counters.setdefault(name, {})
+        key = _labels(**labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges.setdefault(name, {})[_labels(**labels)] = value
+
+    def on_flush(self, seconds: float, rows: int) -> None:
+        self.flush_seconds += seconds
+        self.observe('digikala_db_flush_seconds', seconds)
+        self.inc('digikala_db_flush_rows_total', rows)
+
+    def profiler(self, callback: str):
+        return self.profilers.get(callback)
+
+    def histogram_sums(self, name: str) -> Dict[Labels, float]:
+        return {labels: h.sum for labels, h in self.histograms.get(name, {}).items()}
+
+    def render(self) -> str:
+        """خروجی متنی با قالب exposition پرومتئوس"""
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} counter']
+            lines += [f'{name}{_format_labels(labels)} {value}' for labels, value in sorted(series.items())]
+        for name, series in sorted(self.gauges.items()):
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} gauge']
+            lines += [f'{name}{_format_labels(labels)} {value}' for labels, value in sorted(series.items())]
+        for name, series in sorted(self.histograms.items()):
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+            for labels, h in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float('inf'),), h.counts):
+                    cumulative += n
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                    lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {h.sum:.6f}')
+                lines.append(f'{name}_count{_format_labels(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+class _SyncSlices:
+    """اجرای awaitable و اندازه‌گیری فقط بخش‌های همگام آن؛ انتظار await (مثلا ParsePool) و callbackهای هم‌زمان شمرده نمی‌شوند"""
+
+    __slots__ = ('awaitable', 'metrics', 'profiler', 'busy')
+
+    def __init__(self, awaitable, metrics: CrawlMetrics, profiler=None):
+        self.awaitable = awaitable
+        self.metrics = metrics
+        self.profiler = profiler
+        self.busy = 0.0
+
+    def __await__(self):
+        steps = self.awaitable.__await__()
+        send, value = steps.send, None
+        while True:
+            flushed = self.metrics.flush_seconds
+            profiling = self.profiler is not None and not self.metrics.profiling
+            if profiling:
+                self.metrics.profiling = True
+                self.profiler.enable()
+            started = time.perf_counter()
+            try:
+                yielded = send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.busy += time.perf_counter() - started - (self.metrics.flush_seconds - flushed)
+                if profiling:
+                    self.profiler.disable()
+                    self.metrics.profiling = False
+            try:
+                value = yield yielded
+                send = steps.send
+            except GeneratorExit:
+                steps.close()
+                raise
+            except BaseException as e:
+                # خطا یا لغو future مورد انتظار به خود callback برگردانده می‌شود
+                send, value = steps.throw, e
+
+def timed_callback(func):
+    """اندازه‌گیری زمان callbackهای async generator خزنده در spider.metrics (و پروفایل در صورت فعال بودن)"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(spider, response, *args, **kwargs):
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            async for output in func(spider, response, *args, **kwargs):
+                yield output
+            return
+        profiler = metrics.profiler(name)
+        outputs = func(spider, response, *args, **kwargs)
+        busy = 0.0
+        while True:
+            # فقط زمان اجرای خود callback بین دو yield شمرده می‌شود، نه پردازش خروجی‌ها در اسکرپی
+            step = _SyncSlices(outputs.__anext__(), metrics, profiler)
+            try:
+                output = await step
+            except StopAsyncIteration:
+                break
+            finally:
+                busy += step.busy
+            yield output
+        metrics.observe('digikala_callback_seconds', busy, callback=name)
+
+    return wrapper
+
+class _PyinstrumentProfiler:
+    """رابط enable/disable مثل cProfile برای pyinstrument (نمونه‌برداری، سربار کمتر)"""
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler(async_mode='disabled')
+
+    def enable(self) -> None:
+        self.profiler.start()
+
+    def disable(self) -> None:
+        self.profiler.stop()
+
+    def dump(self, path: str) -> str:
+        path += '.html'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.profiler.output_html())
+        return path
+
+class _CProfileProfiler(cProfile.Profile):
+
+    def dump(self, path: str) -> str:
+        self.dump_stats(path + '.prof')
+        with open(path + '.txt', 'w', encoding='utf-8') as f:
+            pstats.Stats(self, stream=f).sort_stats('cumulative').print_stats(40)
+        return path + '.prof'
+
+def make_profiler(kind: str):
+    if kind == 'pyinstrument':
+        try:
+            return _PyinstrumentProfiler()
+        except ImportError:
+            logger.warning('pyinstrument نصب نیست؛ از cProfile استفاده می‌شود')
+    return _CProfileProfiler()
+
+class MetricsResource(Resource):
+    """endpoint محلی متریک‌ها روی twisted.web (هر مسیری همان متن را برمی‌گرداند)"""
+    isLeaf = True
+
+    def __init__(self, metrics: CrawlMetrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.metrics.render().encode('utf-8')
+
+class MetricsExtension:
+    """extension اسکرپی: جمع‌آوری متریک‌ها، لاگ دوره‌ای، فایل/endpoint پرومتئوس و پروفایل callbackها"""
+
+    def __init__(self, crawler, interval: float, path: str, port: int, profile: Sequence[str],
+                 profiler: str, profile_dir: str):
+        self.crawler = crawler
+        self.interval = interval
+        self.path = path
+        self.port = port
+        self.profile = profile
+        self.profiler_kind = profiler
+        self.profile_dir = profile_dir
+        self.metrics = CrawlMetrics()
+        self.task = None
+        self.listener = None
+        self.items = 0
+        self.last_items = 0
+        self.last_time = time.monotonic()
+        self.last_sums: Dict[str, Dict[Labels, float]] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DIGIKALA_METRICS_ENABLED', True):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            interval=settings.getfloat('DIGIKALA_METRICS_INTERVAL', 30.0),
+            path=settings.get('DIGIKALA_METRICS_FILE', 'crawl_metrics.prom'),
+            port=settings.getint('DIGIKALA_METRICS_PORT', 0),
+            profile=settings.getlist('DIGIKALA_PROFILE_CALLBACKS'),
+            profiler=settings.get('DIGIKALA_PROFILER', 'cprofile'),
+            profile_dir=settings.get('DIGIKALA_PROFILE_DIR', 'profiles'),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        spider.metrics = self.metrics
+        writer = getattr(spider, 'writer', None)
+        if writer is not None:
+            writer.on_flush = self.metrics.on_flush
+        callbacks = self.profile
+        if 'all' in callbacks:
+            callbacks = ['parse', 'parse_category', 'parse_product_page', 'parse_comments']
+        for callback in callbacks:
+            self.metrics.profilers[callback] = make_profiler(self.profiler_kind)
+        if self.port:
+            from twisted.internet import reactor
+
+            self.listener = reactor.listenTCP(self.port, Site(MetricsResource(self.metrics)), interface='127.0.0.1')
+            logger.info(f"متریک‌ها در http://127.0.0.1:{self.port}/metrics")
+        self.task = task.LoopingCall(self.report, spider)
+        self.task.start(self.interval, now=False)
+
+    def response_received(self, response, request, spider):
+        host = urlparse(response.url).hostname or ''
+        source = 'replay' if 'replay' in response.flags else 'cache' if 'cached' in response.flags else 'network'
+        self.metrics.inc('digikala_responses_total', host=host, source=source)
+        latency = request.meta.get('download_latency')
+        if source == 'network' and latency is not None:
+            self.metrics.observe('digikala_download_latency_seconds', latency, host=host)
+
+    def item_scraped(self, item, response, spider):
+        self.items += 1
+
+    def sample(self) -> float:
+        """به‌روزرسانی gaugeها (عمق صف، دانلودهای فعال و نرخ آیتم)؛ طول بازه را برمی‌گرداند"""
+        engine = self.crawler.engine
+        slot = getattr(engine, '_slot', None) or getattr(engine, 'slot', None)
+        scheduler = getattr(slot, 'scheduler', None)
+        if scheduler is not None:
+            try:
+                self.metrics.set('digikala_scheduler_queue_depth', len(scheduler))
+            except Exception as e:
+                logger.debug(f"خطا در خواندن طول صف: {str(e)}")
+        self.metrics.set('digikala_downloader_active', len(engine.downloader.active))
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-9)
+        self.metrics.set('digikala_items_per_second', round((self.items - self.last_items) / elapsed, 3))
+        self.metrics.counters['digikala_items_scraped_total'] = {(): self.items}
+        self.last_items, self.last_time = self.items, now
+        return elapsed
+
+    def _delta(self, name: str) -> Dict[Labels, float]:
+        sums = self.metrics.histogram_sums(name)
+        last = self.last_sums.get(name, {})
+        self.last_sums[name] = sums
+        return {labels: value - last.get(labels, 0.0) for labels, value in sums.items()}
+
+    def report(self, spider) -> None:
+        elapsed = self.sample()
+        callbacks = self._delta('digikala_callback_seconds')
+        downloads = self._delta('digikala_download_latency_seconds')
+        flushes = self._delta('digikala_db_flush_seconds')
+        # سهم هر بخش از زمان دیواری بازه: parse و flush روی thread اصلی اجرا می‌شوند
+        parse_share = sum(callbacks.values()) / elapsed
+        flush_share = sum(flushes.values()) / elapsed
+        gauges = self.metrics.gauges
+        parts = [
+            f"{gauges['digikala_items_per_second'][()]:.1f} آیتم/ثانیه",
+            f"صف {int(gauges.get('digikala_scheduler_queue_depth', {}).get((), 0))}",
+            f"دانلود فعال {int(gauges['digikala_downloader_active'][()])}",
+            f"parse {parse_share:.0%}",
+            f"flush دیتابیس {flush_share:.0%}",
+        ]
+        for labels, h in sorted(self.metrics.histograms.get('digikala_callback_seconds', {}).items()):
+            parts.append(f"{dict(labels)['callback']} p50={h.quantile(0.5) * 1000:.1f}ms p95={h.quantile(0.95) * 1000:.1f}ms")
+        for labels, h in sorted(self.metrics.histograms.get('digikala_download_latency_seconds', {}).items()):
+            if downloads.get(labels):
+                parts.append(f"{dict(labels)['host']} p50={h.quantile(0.5):.2f}s")
+        logger.info('متریک‌ها: ' + '، '.join(parts))
+        self.write_file()
+
+    def write_file(self) -> None:
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp, self.path)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.report(spider)
+        if self.listener is not None:
+            self.listener.stopListening()
+        if self.metrics.profilers:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            called = {dict(labels)['callback'] for labels in self.metrics.histograms.get('digikala_callback_seconds', {})}
+            for callback, profiler in self.metrics.profilers.items():
+                if callback not in called:
+                    continue
+                path = profiler.dump(os.path.join(self.profile_dir, callback))
+                logger.info(f"پروفایل {callback}: {path}")
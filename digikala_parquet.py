@@ -0,0 +1,212 @@
+import argparse
+import logging
+import os
+import uuid
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Sequence
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+from digikala_storage import Product, Review, create_db_engine, parse_product_id
+
+logger = logging.getLogger(__name__)
+
+# تعداد ردیف هر row group؛ ردیف‌های هر پارتیشن تا این اندازه بافر می‌شوند
+BATCH_SIZE = 10000
+
+PARTITION_COLUMNS = ('category', 'crawl_date')
+
+# نام پوشه پارتیشن برای مقدار null؛ open_dataset آن را دوباره null می‌خواند
+HIVE_NULL = '__HIVE_DEFAULT_PARTITION__'
+
+PRODUCT_SCHEMA = pa.schema([
+    ('product_id', pa.int64()),
+    ('name', pa.string()),
+    ('price', pa.float64()),
+    ('category', pa.string()),
+    ('url', pa.string()),
+    ('description', pa.string()),
+    ('rating', pa.float64()),
+    ('review_count', pa.int64()),
+    ('image_url', pa.string()),
+    ('specs', pa.string()),  # JSON
+    ('is_ad', pa.bool_()),
+    ('crawled_at', pa.timestamp('s')),
+    ('crawl_date', pa.date32()),
+])
+# محصولات تبلیغاتی همان ستون‌های محصول را دارند و در dataset جدا نوشته می‌شوند
+AD_SCHEMA = PRODUCT_SCHEMA
+REVIEW_SCHEMA = pa.schema([
+    ('product_id', pa.int64()),
+    ('review_key', pa.string()),
+    ('product_url', pa.string()),
+    ('comment', pa.string()),
+    ('rating', pa.float64()),
+    ('date', pa.string()),  # تاریخ شمسی همان‌طور که در سایت نمایش داده می‌شود
+    ('category', pa.string()),
+    ('crawled_at', pa.timestamp('s')),
+    ('crawl_date', pa.date32()),
+])
+
+def _partition_dir(value) -> str:
+    # کدگذاری URI و مقدار null مثل پیش‌فرض HivePartitioning در pyarrow (نام دسته ممکن است / داشته باشد)
+    if value is None or value == '':
+        return HIVE_NULL
+    return quote(value.isoformat() if isinstance(value, date) else str(value), safe='')
+
+class ParquetDatasetWriter:
+    """نوشتن جریانی dataset پارکت با پارتیشن‌بندی Hive (category=.../crawl_date=...)"""
+
+    def __init__(self, root: str, schema, partition_cols: Sequence[str] = PARTITION_COLUMNS,
+                 batch_size: int = BATCH_SIZE, compression: str = 'zstd'):
+        self.root = root
+        self.partition_cols = tuple(partition_cols)
+        self.schema = schema
+        # ستون‌های پارتیشن در مسیر فایل هستند و داخل فایل تکرار نمی‌شوند
+        self.file_schema = pa.schema([f for f in schema if f.name not in self.partition_cols])
+        self.batch_size = batch_size
+        self.compression = compression
+        self.count = 0
+        # سقف کل ردیف‌های بافرشده در همه پارتیشن‌ها (وقتی دسته‌ها زیادند)
+        self.max_buffered = batch_size * 4
+        self._buffered = 0
+        self._buffers: Dict[tuple, list] = {}
+        self._writers: Dict[tuple, 'pq.ParquetWriter'] = {}
+        # نام یکتای فایل‌های این اجرا تا اجراهای بعدی روی آن‌ها ننویسند
+        self._run_id = uuid.uuid4().hex[:12]
+
+    def write(self, row: Dict) -> None:
+        key = tuple(row.get(col) for col in self.partition_cols)
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(row)
+        self.count += 1
+        self._buffered += 1
+        if len(buffer) >= self.batch_size:
+            self._flush_partition(key)
+        elif self._buffered >= self.max_buffered:
+            self._flush_partition(max(self._buffers, key=lambda k: len(self._buffers[k])))
+
+    def write_many(self, rows: Iterable[Dict]) -> None:
+        for row in rows:
+            self.write(row)
+
+    def _flush_partition(self, key: tuple) -> None:
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        self._buffered -= len(rows)
+        writer = self._writers.get(key)
+        if writer is None:
+            directory = os.path.join(
+                self.root, *(f'{col}={_partition_dir(value)}' for col, value in zip(self.partition_cols, key))
+            )
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'part-{self._run_id}.parquet')
+            writer = pq.ParquetWriter(path, self.file_schema, compression=self.compression)
+            self._writers[key] = writer
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.file_schema))
+
+    def close(self) -> None:
+        for key in list(self._buffers):
+            self._flush_partition(key)
+        for writer in self._writers.values():
+            writer.close()
+        logger.info(f"خروجی Parquet: {self.root} ({self.count} ردیف در {len(self._writers)} پارتیشن)")
+        self._writers = {}
+
+def open_dataset(root: str, schema):
+    """خواندن dataset با نوع درست ستون‌های پارتیشن (crawl_date به صورت date)"""
+    import pyarrow.dataset as ds
+
+    partitioning = ds.HivePartitioning(pa.schema([schema.field(col) for col in PARTITION_COLUMNS]), null_fallback=HIVE_NULL)
+    return ds.dataset(root, schema=schema, format='parquet', partitioning=partitioning)
+
+def _crawl_time(value: Optional[datetime]) -> datetime:
+    return (value or datetime.utcnow()).replace(microsecond=0)
+
+def from_api_item(item: Dict, crawled_at: Optional[datetime] = None) -> Dict:
+    """تبدیل محصول خروجی digikala_api_engine (کلیدهای فارسی) به ستون‌های PRODUCT_SCHEMA"""
+    crawled_at = _crawl_time(crawled_at)
+    url = item.get('آدرس', '')
+    return {
+        'product_id': parse_product_id(url),
+        'name': item.get('نام'),
+        'price': float(item['قیمت']) if item.get('قیمت') is not None else None,
+        'category': item.get('دسته'),
+        'url': url,
+        'description': None,
+        'rating': float(item['امتیاز']) if item.get('امتیاز') is not None else None,
+        'review_count': int(item['تعداد_نظرات']) if item.get('تعداد_نظرات') is not None else None,
+        'image_url': item.get('تصویر'),
+        'specs': None,
+        'is_ad': bool(item.get('تبلیغاتی', False)),
+        'crawled_at': crawled_at,
+        'crawl_date': crawled_at.date(),
+    }
+
+def export_parquet(engine, root: str = 'digikala_parquet', batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """خروجی Parquet محصولات و نظرات دیتابیس با خواندن جریانی (پارتیشن بر اساس دسته و تاریخ خزش)"""
+    counts = {}
+    products = ParquetDatasetWriter(os.path.join(root, 'products'), PRODUCT_SCHEMA, batch_size=batch_size)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            select(Product.__table__).order_by(Product.id)
+        )
+        for p in result:
+            crawled_at = _crawl_time(p.updated_at or p.created_at)
+            products.write({
+                'product_id': p.product_id,
+                'name': p.name,
+                'price': p.price,
+                'category': p.category,
+                'url': p.url,
+                'description': p.description,
+                'rating': p.rating,
+                'review_count': p.review_count,
+                'image_url': p.image_url,
+                'specs': p.specs,
+                'is_ad': False,
+                'crawled_at': crawled_at,
+                'crawl_date': crawled_at.date(),
+            })
+    products.close()
+    counts['products'] = products.count
+
+    reviews = ParquetDatasetWriter(os.path.join(root, 'reviews'), REVIEW_SCHEMA, batch_size=batch_size)
+    statement = (
+        select(Review.__table__, Product.category)
+        .outerjoin(Product, Product.product_id == Review.product_id)
+        .order_by(Review.id)
+    )
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for r in result:
+            crawled_at = _crawl_time(r.created_at)
+            reviews.write({
+                'product_id': r.product_id,
+                'review_key': r.review_key,
+                'product_url': r.product_url,
+                'comment': r.comment,
+                'rating': r.rating,
+                'date': r.date,
+                'category': r.category,
+                'crawled_at': crawled_at,
+                'crawl_date': crawled_at.date(),
+            })
+    reviews.close()
+    counts['reviews'] = reviews.count
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='خروجی Parquet پارتیشن‌بندی‌شده از digikala.db')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    parser.add_argument('--output', default='digikala_parquet', help='پوشه dataset خروجی')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    export_parquet(create_db_engine(args.db), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from twisted.internet.defer import Deferred
+
+from digikala_extractors import get_extractor
+
+logger = logging.getLogger(__name__)
+
+# extractor هر پروسس worker؛ یک بار در initializer ساخته می‌شود
+_worker_extractor = None
+
+def _init_worker(extractor_name: str) -> None:
+    global _worker_extractor
+    _worker_extractor = get_extractor(extractor_name)
+
+def _call(method: str, args: tuple):
+    return getattr(_worker_extractor, method)(*args)
+
+class ParsePool:
+    """اجرای متدهای extractor در پروسس‌های جدا تا پارس HTML حلقه reactor را مسدود نکند"""
+
+    def __init__(self, extractor_name: str = 'next_data', workers: Optional[int] = None):
+        self.extractor_name = extractor_name
+        self.workers = workers or os.cpu_count() or 1
+        # pool پس از شروع reactor و threadهای آن ساخته می‌شود؛ fork پروسسی با چند thread ممکن است قفل بماند
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(extractor_name,),
+        )
+        logger.info(f"پارس صفحات در {self.workers} پروسس جدا (extractor: {extractor_name})")
+
+    def submit_future(self, method: str, *args) -> Future:
+        """ارسال فراخوانی (مثلاً listing یا product_page) به pool و برگرداندن Future"""
+        return self.executor.submit(_call, method, args)
+
+    def submit(self, method: str, *args) -> Deferred:
+        """مثل submit_future ولی نتیجه به صورت Deferred در thread reactor تحویل می‌شود"""
+        from twisted.internet import reactor
+
+        d = Deferred()
+
+        def done(future: Future) -> None:
+            error = future.exception()
+            if error is not None:
+                reactor.callFromThread(d.errback, error)
+            else:
+                reactor.callFromThread(d.callback, future.result())
+
+        self.submit_future(method, *args).add_done_callback(done)
+        return d
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,111 @@
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from digikala_storage import create_db_engine, parse_product_id, price_observation
+
+logger = logging.getLogger(__name__)
+
+# سری قیمت یک محصول: range scan روی کلید اصلی (product_id, ts)
+SERIES_SQL = text("""
+SELECT ts, selling_price, rrp, is_ad, in_stock
+FROM price_history
+WHERE product_id = :product_id AND ts >= :start AND ts <= :end
+ORDER BY ts
+""")
+
+# قیمت هر محصول در لحظه since (آخرین مشاهده تا آن زمان) در برابر قیمت فعلی؛
+# فقط محصولاتی بررسی می‌شوند که پس از since تغییر داشته‌اند (ایندکس ts)
+DROPS_SQL = text("""
+WITH changed AS (
+    SELECT DISTINCT product_id FROM price_history WHERE ts > :since
+),
+compared AS (
+    SELECT l.product_id, l.selling_price AS price_now, l.ts AS changed_at,
+           (SELECT h.selling_price FROM price_history h
+            WHERE h.product_id = l.product_id AND h.ts <= :since
+            ORDER BY h.ts DESC LIMIT 1) AS price_before
+    FROM changed c JOIN price_latest l ON l.product_id = c.product_id
+)
+SELECT c.product_id, c.price_before, c.price_now, c.changed_at,
+       1.0 - CAST(c.price_now AS REAL) / c.price_before AS drop_ratio,
+       p.name, p.category, p.url
+FROM compared c LEFT JOIN products p ON p.product_id = c.product_id
+WHERE c.price_before > 0 AND c.price_now <= c.price_before * (1.0 - :threshold)
+ORDER BY drop_ratio DESC
+LIMIT :limit
+""")
+
+def observation_from_listing_item(item: Dict, ts: Optional[int] = None) -> Optional[Dict]:
+    """مشاهده قیمت از آیتم خزنده (قیمت‌های آیتم به تومان‌اند و به ریال ذخیره می‌شوند)"""
+    price = item.get('price')
+    rrp = item.get('rrp')
+    return price_observation(
+        item.get('product_id') or parse_product_id(item.get('url')),
+        price * 10 if price else None,
+        rrp * 10 if rrp else None,
+        item.get('is_ad'),
+        item.get('in_stock'),
+        ts,
+    )
+
+def observation_from_api_item(item: Dict, ts: Optional[int] = None) -> Optional[Dict]:
+    """مشاهده قیمت از محصول digikala_api_engine (کلیدهای فارسی، قیمت به ریال)"""
+    return price_observation(
+        parse_product_id(item.get('آدرس')),
+        item.get('قیمت'),
+        item.get('_rrp'),
+        item.get('تبلیغاتی'),
+        item.get('_in_stock'),
+        ts,
+    )
+
+def price_series(engine, product_id: int, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+    """تغییرات قیمت و موجودی یک محصول در بازه [start, end] (unix timestamp)"""
+    with engine.connect() as conn:
+        rows = conn.execute(SERIES_SQL, {
+            'product_id': product_id,
+            'start': start if start is not None else 0,
+            'end': end if end is not None else 2 ** 62,
+        })
+        return [dict(row._mapping) for row in rows]
+
+def price_drops(engine, since: int, threshold: float = 0.10, limit: int = 1000) -> List[Dict]:
+    """محصولاتی که قیمت فعلی‌شان حداقل threshold (نسبت) کمتر از قیمتشان در لحظه since است"""
+    with engine.connect() as conn:
+        rows = conn.execute(DROPS_SQL, {'since': since, 'threshold': threshold, 'limit': limit})
+        return [dict(row._mapping) for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description='کوئری تاریخچه قیمت محصولات دیجی‌کالا')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    series = subparsers.add_parser('series', help='سری قیمت یک محصول')
+    series.add_argument('product', help='شناسه محصول (123 یا dkp-123 یا آدرس محصول)')
+    series.add_argument('--days', type=float, default=None, help='فقط n روز اخیر')
+    drops = subparsers.add_parser('drops', help='محصولاتی که قیمتشان کاهش یافته')
+    drops.add_argument('--hours', type=float, default=24.0, help='مقایسه با قیمت n ساعت پیش')
+    drops.add_argument('--threshold', type=float, default=0.10, help='حداقل نسبت کاهش (0.10 یعنی ۱۰٪)')
+    drops.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    engine = create_db_engine(args.db)
+    started = time.perf_counter()
+    if args.command == 'series':
+        product_id = int(args.product) if args.product.isdigit() else parse_product_id('/' + args.product.lstrip('/'))
+        start = int(time.time() - args.days * 86400) if args.days else None
+        result = price_series(engine, product_id, start)
+        for row in result:
+            row['time'] = datetime.fromtimestamp(row['ts']).isoformat()
+    else:
+        result = price_drops(engine, int(time.time() - args.hours * 3600), args.threshold, args.limit)
+    print(json.dumps(result, ensure_ascii=False, indent=4))
+    logger.info(f"{len(result)} ردیف در {(time.perf_counter() - started) * 1000:.1f} میلی‌ثانیه")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+from digikala_api_engine import ApiClient
+from digikala_har import har_body, iter_har_entries
+
+logger = logging.getLogger(__name__)
+
+# هدرهایی که با بدنه decode‌شده HAR دیگر درست نیستند
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+def normalize_url(url: str) -> str:
+    """کلید تطبیق آدرس: بدون fragment، میزبان با حروف کوچک، پارامترها مرتب و بدون / انتهایی"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))
+
+class ReplayCorpus:
+    """پاسخ‌های ضبط‌شده (HAR و HTML ذخیره‌شده) با کلید آدرس نرمال‌شده"""
+
+    def __init__(self):
+        # url -> (status, headers, body یا مسیر فایل بدنه)
+        self.entries: Dict[str, Tuple[int, Dict[str, str], object]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, url: str, status: int, headers: Dict[str, str], body) -> None:
+        key = normalize_url(url)
+        # در HAR ممکن است یک آدرس چند بار باشد؛ اولین پاسخ موفق نگه داشته می‌شود
+        if key in self.entries and self.entries[key][0] == 200:
+            return
+        self.entries[key] = (status, headers, body)
+
+    def load_har(self, path: str) -> int:
+        count = 0
+        for entry in iter_har_entries(path):
+            request = entry.get('request', {})
+            response = entry.get('response', {})
+            if request.get('method', 'GET') != 'GET' or not response.get('status'):
+                continue
+            headers = {
+                h['name']: h['value'] for h in response.get('headers', [])
+                if h.get('name', '').lower() not in DROPPED_HEADERS
+            }
+            content = response.get('content', {})
+            if content.get('mimeType') and not any(k.lower() == 'content-type' for k in headers):
+                headers['Content-Type'] = content['mimeType']
+            self.add(request.get('url', ''), response['status'], headers, har_body(content))
+            count += 1
+        logger.info(f"replay: {count} پاسخ از {path}")
+        return count
+
+    def load_html(self, source) -> int:
+        """HTML ذخیره‌شده: dict آدرس به مسیر فایل، یا پوشه‌ای با index.json به همین شکل"""
+        base = ''
+        if isinstance(source, str):
+            base = source
+            with open(os.path.join(source, 'index.json'), 'r', encoding='utf-8') as f:
+                source = json.load(f)
+        for url, path in source.items():
+            # بدنه فقط هنگام نیاز از فایل خوانده می‌شود
+            self.add(url, 200, {'Content-Type': 'text/html; charset=utf-8'}, os.path.join(base, path))
+        logger.info(f"replay: {len(source)} صفحه HTML ذخیره‌شده")
+        return len(source)
+
+    def get(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        found = self.entries.get(normalize_url(url))
+        if found is None:
+            return None
+        status, headers, body = found
+        if isinstance(body, str):
+            with open(body, 'rb') as f:
+                body = f.read()
+        return status, headers, body
+
+    @classmethod
+    def from_sources(cls, har_files=(), html_sources=()) -> 'ReplayCorpus':
+        corpus = cls()
+        for path in har_files:
+            corpus.load_har(path)
+        for source in html_sources:
+            corpus.load_html(source)
+        return corpus
+
+class ReplayRecorder:
+    """ذخیره پاسخ‌های HTML/JSON واقعی در پوشه‌ای که load_html می‌تواند بخواند"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        self.index: Dict[str, str] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def save(self, url: str, body: bytes) -> None:
+        name = hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest() + '.html'
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(body)
+        self.index[url] = name
+
+    def close(self) -> None:
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        logger.info(f"replay: {len(self.index)} صفحه در {self.directory} ذخیره شد")
+
+class ReplayMiddleware:
+    """downloader middleware که پاسخ را به جای شبکه از HAR یا HTML ذخیره‌شده برمی‌گرداند"""
+
+    def __init__(self, corpus: Optional[ReplayCorpus], strict: bool, recorder: Optional[ReplayRecorder], stats):
+        self.corpus = corpus
+        self.strict = strict
+        self.recorder = recorder
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        har_files = settings.getlist('DIGIKALA_REPLAY_HAR')
+        html = settings.get('DIGIKALA_REPLAY_HTML')
+        record_dir = settings.get('DIGIKALA_REPLAY_RECORD')
+        if not har_files and not html and not record_dir:
+            raise NotConfigured
+        corpus = None
+        if har_files or html:
+            html_sources = [settings.getdict('DIGIKALA_REPLAY_HTML') if html.startswith('{') else html] if html else []
+            corpus = ReplayCorpus.from_sources(har_files, html_sources)
+        recorder = ReplayRecorder(record_dir) if record_dir else None
+        middleware = cls(corpus, settings.getbool('DIGIKALA_REPLAY_STRICT', True), recorder, crawler.stats)
+        if recorder:
+            from scrapy import signals
+            crawler.signals.connect(lambda spider: recorder.close(), signal=signals.spider_closed)
+        return middleware
+
+    def process_request(self, request, spider):
+        if self.corpus is None:
+            return None
+        found = self.corpus.get(request.url)
+        if found is None:
+            self.stats.inc_value('replay/miss')
+            if self.strict:
+                raise IgnoreRequest(f'replay: پاسخی برای {request.url} ضبط نشده است')
+            return None
+        status, headers, body = found
+        self.stats.inc_value('replay/hit')
+        request.meta['dont_cache'] = True
+        headers = Headers(headers)
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return respcls(url=request.url, status=status, headers=headers, body=body, flags=['replay'])
+
+    def process_response(self, request, response, spider):
+        if self.recorder is not None and response.status == 200 and 'replay' not in response.flags:
+            self.recorder.save(request.url, response.body)
+        return response
+
+class ReplayApiClient(ApiClient):
+    """ApiClient که JSON را از HAR یا پوشه ضبط‌شده می‌خواند (بدون شبکه و محدودیت نرخ)"""
+
+    def __init__(self, corpus: ReplayCorpus, **kwargs):
+        super().__init__(**kwargs)
+        self.corpus = corpus
+        self.misses = 0
+
+    async def __aenter__(self) -> 'ReplayApiClient':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+    async def get_json(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        self.requests_made += 1
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+        found = self.corpus.get(url)
+        if found is None or found[0] != 200:
+            self.misses += 1
+            logger.error(f"replay: پاسخی برای {url} ضبط نشده است")
+            return None
+        return json.loads(found[2])
+
+def client_from_env(**kwargs) -> ApiClient:
+    """ReplayApiClient اگر DIGIKALA_REPLAY_HAR یا DIGIKALA_REPLAY_HTML تنظیم شده باشد، وگرنه ApiClient"""
+    har_files = [p for p in os.environ.get('DIGIKALA_REPLAY_HAR', '').split(',') if p]
+    html_dirs = [p for p in os.environ.get('DIGIKALA_REPLAY_HTML', '').split(',') if p]
+    if not har_files and not html_dirs:
+        return ApiClient(**kwargs)
+    return ReplayApiClient(ReplayCorpus.from_sources(har_files, html_dirs), **kwargs)
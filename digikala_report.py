@@ -0,0 +1,140 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from digikala_storage import create_db_engine
+
+logger = logging.getLogger(__name__)
+
+# صدک‌های قیمت (درصد صحیح)
+PRICE_PERCENTILES = [10, 25, 50, 75, 90, 99]
+
+# آمار پایه همه دسته‌ها در یک بار پیمایش جدول
+CATEGORY_STATS_SQL = """
+SELECT
+    category,
+    COUNT(*) AS products,
+    COUNT(CASE WHEN price > 0 THEN 1 END) AS priced,
+    SUM(CASE WHEN price > 0 THEN price END) AS price_sum,
+    MIN(CASE WHEN price > 0 THEN price END) AS min_price,
+    MAX(CASE WHEN price > 0 THEN price END) AS max_price,
+    COUNT(CASE WHEN rating > 0 THEN 1 END) AS rated,
+    SUM(CASE WHEN rating > 0 THEN rating END) AS rating_sum,
+    MIN(CASE WHEN rating > 0 THEN rating END) AS min_rating,
+    MAX(CASE WHEN rating > 0 THEN rating END) AS max_rating,
+    SUM(COALESCE(review_count, 0)) AS listed_reviews
+FROM products
+GROUP BY category
+"""
+
+STORED_REVIEWS_SQL = """
+SELECT p.category, COUNT(*) AS stored_reviews
+FROM reviews r JOIN products p ON p.product_id = r.product_id
+GROUP BY p.category
+"""
+
+# صدک به روش nearest-rank: ردیف شماره ceil(n * p / 100) در هر بخش
+PERCENTILES_SQL = """
+WITH ranked AS (
+    SELECT {partition} AS part, price,
+           ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY price) AS rn,
+           COUNT(*) OVER (PARTITION BY {partition}) AS cnt
+    FROM products WHERE price > 0
+)
+SELECT part, rn, cnt, price FROM ranked WHERE {condition}
+"""
+
+def _percentiles(conn, partition: str) -> Dict[Optional[str], Dict[str, float]]:
+    condition = ' OR '.join(f'rn = (cnt * {p} + 99) / 100' for p in PRICE_PERCENTILES)
+    result: Dict[Optional[str], Dict[str, float]] = {}
+    for part, rn, cnt, price in conn.execute(text(PERCENTILES_SQL.format(partition=partition, condition=condition))):
+        for p in PRICE_PERCENTILES:
+            if rn == (cnt * p + 99) // 100:
+                result.setdefault(part, {})[f'p{p}'] = price
+    return result
+
+def _avg(total, count) -> float:
+    return total / count if count else 0
+
+def build_report(engine) -> Dict:
+    """محاسبه آمار محصولات و نظرات با تجمیع سمت SQL"""
+    with engine.connect() as conn:
+        rows = conn.execute(text(CATEGORY_STATS_SQL)).mappings().all()
+        stored_reviews = dict(conn.execute(text(STORED_REVIEWS_SQL)).all())
+        total_reviews = conn.execute(text('SELECT COUNT(*) FROM reviews')).scalar()
+        overall_percentiles = _percentiles(conn, "'all'").get('all', {})
+        category_percentiles = _percentiles(conn, 'category')
+
+    breakdown: List[Dict] = []
+    for row in rows:
+        breakdown.append({
+            'category': row['category'],
+            'products': row['products'],
+            'avg_price': _avg(row['price_sum'], row['priced']),
+            'min_price': row['min_price'] or 0,
+            'max_price': row['max_price'] or 0,
+            'price_percentiles': category_percentiles.get(row['category'], {}),
+            'avg_rating': _avg(row['rating_sum'], row['rated']),
+            'listed_reviews': row['listed_reviews'],
+            'stored_reviews': stored_reviews.get(row['category'], 0),
+        })
+    breakdown.sort(key=lambda c: c['products'], reverse=True)
+
+    # آمار کلی از ردیف‌های هر دسته جمع زده می‌شود، نه با پیمایش دوباره جدول
+    priced = sum(r['priced'] for r in rows)
+    rated = sum(r['rated'] for r in rows)
+    min_prices = [r['min_price'] for r in rows if r['min_price'] is not None]
+    max_prices = [r['max_price'] for r in rows if r['max_price'] is not None]
+    min_ratings = [r['min_rating'] for r in rows if r['min_rating'] is not None]
+    max_ratings = [r['max_rating'] for r in rows if r['max_rating'] is not None]
+    return {
+        'total_products': sum(r['products'] for r in rows),
+        'total_reviews': total_reviews,
+        'avg_price': _avg(sum(r['price_sum'] or 0 for r in rows), priced),
+        'max_price': max(max_prices) if max_prices else 0,
+        'min_price': min(min_prices) if min_prices else 0,
+        'price_percentiles': overall_percentiles,
+        'avg_rating': _avg(sum(r['rating_sum'] or 0 for r in rows), rated),
+        'max_rating': max(max_ratings) if max_ratings else 0,
+        'min_rating': min(min_ratings) if min_ratings else 0,
+        'categories_breakdown': breakdown,
+    }
+
+def build_warnings(total_items: int, failed_count: int) -> List[str]:
+    """سیستم هشدار"""
+    warnings = []
+    if total_items < 100:
+        warnings.append('تعداد محصولات بسیار کم است!')
+    if failed_count > 50:
+        warnings.append('تعداد خطاها زیاد است!')
+    return warnings
+
+def write_report(report: Dict, path: str = 'crawler_report.json') -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    logger.info(f"گزارش آماری و تحلیلی تولید شد: {path}")
+    if report.get('warnings'):
+        logger.warning(f"هشدارها: {' | '.join(report['warnings'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description='تولید گزارش آماری از digikala.db بدون اجرای خزنده')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    parser.add_argument('--output', default='crawler_report.json', help='مسیر فایل گزارش')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    stats = build_report(create_db_engine(args.db))
+    report = {
+        'total_items': stats['total_products'],
+        'categories': [c['category'] for c in stats['categories_breakdown']],
+        'timestamp': datetime.now().isoformat(),
+        **stats,
+        'warnings': build_warnings(stats['total_products'], 0),
+    }
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
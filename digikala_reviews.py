@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from digikala_api_engine import API_BASE, HEADERS, ApiClient
+from digikala_storage import BufferedWriter, Product, create_db_engine
+
+logger = logging.getLogger(__name__)
+
+COMMENTS_URL = API_BASE + '/product/{product_id}/comments/'
+
+def comments_url(product_id: int, page: int = 1) -> str:
+    return COMMENTS_URL.format(product_id=product_id) + f'?page={page}'
+
+def map_comment(comment: Dict, product_id: int, product_url: str) -> Dict:
+    """نگاشت نظر endpoint comments به ساختار نظر دیتابیس (همان فیلدهای استخراج __NEXT_DATA__)"""
+    return {
+        'review_id': comment.get('id'),
+        'product_id': product_id,
+        'product_url': product_url,
+        'comment': comment.get('body') or 'N/A',
+        'rating': float(comment.get('rate') or 0.0),
+        'date': comment.get('created_at') or 'N/A',
+    }
+
+def comments_page(data: Optional[Dict]) -> Tuple[List[Dict], int]:
+    """نظرهای یک صفحه و تعداد کل صفحات از پاسخ JSON"""
+    body = (data or {}).get('data') or {}
+    comments = [c for c in body.get('comments') or [] if isinstance(c, dict)]
+    return comments, int((body.get('pager') or {}).get('total_pages') or 0)
+
+def new_reviews(comments: List[Dict], product_id: int, product_url: str, known: Set[str]) -> Tuple[List[Dict], bool]:
+    """نظرهای جدید یک صفحه و اینکه به نظر ذخیره‌شده رسیده‌ایم یا نه"""
+    # نظرها از جدید به قدیم مرتب‌اند؛ اولین نظر ذخیره‌شده یعنی بقیه صفحات هم قبلاً ذخیره شده‌اند
+    reviews = []
+    for comment in comments:
+        if str(comment.get('id')) in known:
+            return reviews, True
+        reviews.append(map_comment(comment, product_id, product_url))
+    return reviews, False
+
+async def review_pages(client: ApiClient, product_id: int, product_url: str, max_pages: int,
+                       known: Set[str]) -> AsyncIterator[List[Dict]]:
+    """صفحات نظر یک محصول تا آخرین صفحه، max_pages یا اولین نظر ذخیره‌شده"""
+    for page in range(1, max_pages + 1):
+        comments, total_pages = comments_page(await client.get_json(COMMENTS_URL.format(product_id=product_id),
+                                                                    {'page': page}))
+        reviews, reached_known = new_reviews(comments, product_id, product_url, known)
+        if reviews:
+            yield reviews
+        if not comments or reached_known or (total_pages and page >= total_pages):
+            return
+
+def top_products(engine, limit: int) -> List[Tuple[int, str]]:
+    """محصولات با بیشترین تعداد نظر (شناسه و آدرس)"""
+    statement = (
+        select(Product.product_id, Product.url)
+        .where(Product.product_id.is_not(None))
+        .order_by(Product.review_count.desc())
+        .limit(limit)
+    )
+    with engine.connect() as conn:
+        return [(row.product_id, row.url) for row in conn.execute(statement)]
+
+async def harvest_reviews(client: ApiClient, writer: BufferedWriter, products: List[Tuple[int, str]],
+                          max_pages: int, concurrency: int = 8) -> Dict[str, int]:
+    """دریافت همزمان نظرهای چند محصول با بودجه نرخ مشترک client و ذخیره دسته‌ای در writer"""
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {'products': 0, 'reviews': 0}
+
+    async def worker(product_id: int, product_url: str) -> None:
+        async with semaphore:
+            # صفحات هر محصول پشت سر هم خوانده می‌شوند تا توقف در اولین نظر ذخیره‌شده ممکن باشد
+            known = writer.stored_review_keys(product_id)
+            try:
+                async for reviews in review_pages(client, product_id, product_url, max_pages, known):
+                    for review in reviews:
+                        writer.add_review(review)
+                    counts['reviews'] += len(reviews)
+            except Exception as e:
+                logger.error(f"خطا در دریافت نظرهای محصول {product_id}: {str(e)}")
+            counts['products'] += 1
+
+    await asyncio.gather(*(worker(product_id, url) for product_id, url in products))
+    writer.close()
+    return counts
+
+def main():
+    from digikala_replay import client_from_env
+
+    parser = argparse.ArgumentParser(description='دریافت کامل نظرهای محصولات پرنظر از API نظرات دیجی‌کالا')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    parser.add_argument('--top', type=int, default=100, help='تعداد محصولات (بیشترین تعداد نظر)')
+    parser.add_argument('--max-pages', type=int, default=50, help='حداکثر صفحات نظر هر محصول')
+    parser.add_argument('--rate', type=float, default=4.0, help='حداکثر درخواست در ثانیه برای همه محصولات')
+    parser.add_argument('--concurrency', type=int, default=8, help='تعداد محصولاتی که همزمان خوانده می‌شوند')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    engine = create_db_engine(args.db)
+    products = top_products(engine, args.top)
+
+    async def run() -> Dict[str, int]:
+        async with client_from_env(rate=args.rate, headers=HEADERS) as client:
+            counts = await harvest_reviews(client, BufferedWriter(engine), products, args.max_pages, args.concurrency)
+            counts['requests'] = client.requests_made
+            return counts
+
+    counts = asyncio.run(run())
+    logger.info(f"{counts['reviews']} نظر جدید از {counts['products']} محصول با {counts['requests']} درخواست")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import logging
+import re
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, text
+
+logger = logging.getLogger(__name__)
+
+# ی و ک عربی، ارقام فارسی و عربی، ة و ۀ و أ/إ/آ به شکل یکسان
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا',
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    # نیم‌فاصله و نویسه‌های جهت‌دهی: جداکننده کلمه
+    '\u200c': ' ', '\u200d': '', '\u200e': '', '\u200f': '',
+})
+# اعراب و کشیده
+_DIACRITICS_RE = re.compile('[\u064B-\u065F\u0670\u0640]')
+
+PRODUCT_WEIGHTS = (10.0, 2.0, 1.0)  # name، description، specs در bm25
+
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, specs, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5("
+    "comment, tokenize = 'unicode61 remove_diacritics 2')",
+]
+
+# rowid جدول‌های FTS همان id ردیف اصلی است؛ ردیف‌های جدید همیشه id بزرگ‌تری از آخرین ردیف نمایه‌شده دارند
+INDEX_NEW_PRODUCTS_SQL = text("""
+INSERT OR REPLACE INTO products_fts(rowid, name, description, specs)
+SELECT id, fa_normalize(name), fa_normalize(description), fa_specs(specs) FROM products
+WHERE id > (SELECT COALESCE(MAX(rowid), 0) FROM products_fts)
+""")
+INDEX_PRODUCTS_SQL = text("""
+INSERT OR REPLACE INTO products_fts(rowid, name, description, specs)
+SELECT id, fa_normalize(name), fa_normalize(description), fa_specs(specs) FROM products
+WHERE product_id IN :product_ids
+""").bindparams(bindparam('product_ids', expanding=True))
+INDEX_NEW_REVIEWS_SQL = text("""
+INSERT INTO reviews_fts(rowid, comment)
+SELECT id, fa_normalize(comment) FROM reviews
+WHERE id > (SELECT COALESCE(MAX(rowid), 0) FROM reviews_fts)
+""")
+
+def normalize_text(value: Optional[str]) -> str:
+    """یکسان‌سازی متن فارسی برای نمایه و جستجو (ی/ک عربی، نیم‌فاصله، ارقام فارسی، اعراب)"""
+    if not value:
+        return ''
+    return _DIACRITICS_RE.sub('', str(value).translate(_CHAR_MAP))
+
+def flatten_specs(specs: Optional[str]) -> str:
+    """عنوان‌ها و مقدارهای JSON مشخصات فنی به صورت یک متن نرمال‌شده"""
+    if not specs:
+        return ''
+    try:
+        data = json.loads(specs)
+    except ValueError:
+        return normalize_text(specs)
+    parts = []
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                parts.append(str(key))
+                stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif node is not None:
+            parts.append(str(node))
+    return normalize_text(' '.join(parts))
+
+def register_functions(dbapi_connection) -> None:
+    """توابع نرمال‌سازی برای SQL نمایه (روی هر اتصال SQLite)"""
+    dbapi_connection.create_function('fa_normalize', 1, normalize_text, deterministic=True)
+    dbapi_connection.create_function('fa_specs', 1, flatten_specs, deterministic=True)
+
+def has_fts5(conn) -> bool:
+    return conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar() == 1
+
+def search_index_exists(engine) -> bool:
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")).first() is not None
+
+def update_search_index(conn, product_ids: Iterable[Optional[int]] = ()) -> None:
+    """نمایه ردیف‌های جدید و محصولات تغییرکرده (در همان تراکنش ذخیره)"""
+    conn.execute(INDEX_NEW_PRODUCTS_SQL)
+    product_ids = sorted({product_id for product_id in product_ids if product_id is not None})
+    if product_ids:
+        conn.execute(INDEX_PRODUCTS_SQL, {'product_ids': product_ids})
+    conn.execute(INDEX_NEW_REVIEWS_SQL)
+
+def ensure_search_index(engine) -> bool:
+    """ساخت جدول‌های FTS5 و نمایه ردیف‌هایی که هنوز نمایه نشده‌اند؛ False اگر SQLite از FTS5 پشتیبانی نکند"""
+    with engine.begin() as conn:
+        if not has_fts5(conn):
+            logger.warning('SQLite بدون FTS5 است؛ نمایه جستجوی متنی ساخته نشد')
+            return False
+        for statement in SEARCH_DDL:
+            conn.execute(text(statement))
+        update_search_index(conn)
+    return True
+
+def rebuild_search_index(engine) -> None:
+    """ساخت دوباره کامل نمایه (مثلا پس از تغییر قواعد نرمال‌سازی)"""
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS products_fts'))
+        conn.execute(text('DROP TABLE IF EXISTS reviews_fts'))
+    ensure_search_index(engine)
+
+def match_expression(query: str, prefix: bool = True) -> str:
+    """عبارت MATCH از متن کاربر: همه کلمه‌ها لازم‌اند و کلمه آخر پیشوندی است"""
+    tokens = [token for token in re.split(r'\W+', normalize_text(query)) if token]
+    terms = ['"' + token + '"' for token in tokens]
+    if prefix and terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_products(engine, query: str, limit: int = 20, raw: bool = False) -> List[Dict]:
+    """محصولات مرتب‌شده با bm25 (وزن نام بیشتر از توضیحات و مشخصات)"""
+    expression = normalize_text(query) if raw else match_expression(query)
+    if not expression:
+        return []
+    # ORDER BY ستون rank خود FTS5: ردیف‌ها مرتب برگردانده می‌شوند و snippet و join فقط برای limit ردیف اجرا می‌شوند
+    statement = text(f"""
+        SELECT p.product_id, p.name, p.price, p.category, p.url, m.rank, m.snippet
+        FROM (
+            SELECT rowid, rank, snippet(products_fts, -1, '[', ']', '…', 12) AS snippet
+            FROM products_fts
+            WHERE products_fts MATCH :expression AND rank MATCH 'bm25({', '.join(map(str, PRODUCT_WEIGHTS))})'
+            ORDER BY rank LIMIT :limit
+        ) m JOIN products p ON p.id = m.rowid
+        ORDER BY m.rank
+    """)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(statement, {'expression': expression, 'limit': limit})]
+
+def search_reviews(engine, query: str, limit: int = 20, raw: bool = False) -> List[Dict]:
+    """نظرهای مرتب‌شده با bm25"""
+    expression = normalize_text(query) if raw else match_expression(query)
+    if not expression:
+        return []
+    statement = text("""
+        SELECT r.product_id, r.product_url, r.rating, r.date, r.comment, m.rank, m.snippet
+        FROM (
+            SELECT rowid, rank, snippet(reviews_fts, 0, '[', ']', '…', 16) AS snippet
+            FROM reviews_fts WHERE reviews_fts MATCH :expression
+            ORDER BY rank LIMIT :limit
+        ) m JOIN reviews r ON r.id = m.rowid
+        ORDER BY m.rank
+    """)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(statement, {'expression': expression, 'limit': limit})]
+
+def main():
+    from digikala_storage import create_db_engine
+
+    parser = argparse.ArgumentParser(description='جستجوی متنی (FTS5) در محصولات و نظرات digikala.db')
+    parser.add_argument('query', nargs='?', help='متن جستجو')
+    parser.add_argument('--db', default='sqlite:///digikala.db', help='آدرس پایگاه داده')
+    parser.add_argument('--reviews', action='store_true', help='جستجو در نظرات به جای محصولات')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--raw', action='store_true', help='عبارت MATCH خام FTS5 (OR، NEAR، name:...)')
+    parser.add_argument('--rebuild', action='store_true', help='ساخت دوباره کامل نمایه')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    engine = create_db_engine(args.db)
+    if args.rebuild:
+        rebuild_search_index(engine)
+        logger.info('نمایه جستجو دوباره ساخته شد')
+    if not args.query:
+        return
+    started = time.perf_counter()
+    search = search_reviews if args.reviews else search_products
+    results = search(engine, args.query, args.limit, args.raw)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(json.dumps(results, ensure_ascii=False, indent=4))
+    logger.info(f"{len(results)} نتیجه در {elapsed:.1f} میلی‌ثانیه")
+
+if __name__ == '__main__':
+    main()
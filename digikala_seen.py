@@ -0,0 +1,105 @@
+import fcntl
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+# رشد فایل در گام‌های یک مگابایتی (8 میلیون شناسه)
+GROW_BYTES = 1 << 20
+# سقف شناسه؛ فایل sparse است و فقط صفحات لمس‌شده حافظه و دیسک می‌گیرند
+MAX_ID = 1 << 31
+
+class DkpBitmap:
+    """مجموعه شناسه‌های dkp به صورت bitmap (یک بیت برای هر شناسه)؛ با path روی فایل mmap و ماندگار بین اجراها"""
+
+    def __init__(self, path: Optional[str] = None, reset: bool = False):
+        self.path = path
+        self.fd: Optional[int] = None
+        self.map = bytearray()
+        if path is not None:
+            if reset and os.path.exists(path):
+                os.remove(path)
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._remap(0)
+        self.count = self._popcount()
+
+    def _popcount(self) -> int:
+        # شمارش تکه‌تکه تا کل فایل یکجا به عدد صحیح تبدیل نشود
+        return sum(
+            int.from_bytes(self.map[start:start + GROW_BYTES], 'little').bit_count()
+            for start in range(0, len(self.map), GROW_BYTES)
+        )
+
+    @contextmanager
+    def _locked(self):
+        """قفل انحصاری فایل برای بررسی و تنظیم بیت؛ پروسس‌های دیگر همان فایل را هم‌زمان تغییر می‌دهند"""
+        if self.fd is None:
+            yield
+            return
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def _remap(self, min_size: int) -> None:
+        """نگاشت دوباره فایل؛ اگر پروسس دیگری فایل را بزرگ کرده باشد اندازه جدید دیده می‌شود"""
+        size = os.fstat(self.fd).st_size
+        if size < min_size:
+            size = (min_size + GROW_BYTES - 1) // GROW_BYTES * GROW_BYTES
+            os.ftruncate(self.fd, size)
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.map = mmap.mmap(self.fd, size) if size else bytearray()
+
+    def __contains__(self, dkp_id: int) -> bool:
+        index = dkp_id >> 3
+        if index >= len(self.map):
+            if self.fd is None or os.fstat(self.fd).st_size <= index:
+                return False
+            self._remap(0)
+        return bool(self.map[index] & (1 << (dkp_id & 7)))
+
+    def add(self, dkp_id: int) -> bool:
+        """افزودن شناسه؛ True اگر قبلا در مجموعه نبوده"""
+        with self._locked():
+            return self._add(dkp_id)
+
+    def _add(self, dkp_id: int) -> bool:
+        if not 0 <= dkp_id < MAX_ID:
+            raise ValueError(f"شناسه dkp خارج از محدوده: {dkp_id}")
+        index = dkp_id >> 3
+        if index >= len(self.map):
+            if self.fd is None:
+                self.map.extend(bytes(max(index + 1 - len(self.map), GROW_BYTES)))
+            else:
+                self._remap(index + 1)
+        bit = 1 << (dkp_id & 7)
+        value = self.map[index]
+        if value & bit:
+            return False
+        self.map[index] = value | bit
+        self.count += 1
+        return True
+
+    def update(self, dkp_ids: Iterable[int]) -> int:
+        """افزودن چند شناسه و برگرداندن تعداد شناسه‌های جدید (با یک بار قفل)"""
+        with self._locked():
+            return sum(1 for dkp_id in dkp_ids if self._add(dkp_id))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def flush(self) -> None:
+        if isinstance(self.map, mmap.mmap):
+            self.map.flush()
+
+    def close(self) -> None:
+        if self.fd is None:
+            return
+        if isinstance(self.map, mmap.mmap):
+            self.map.flush()
+            self.map.close()
+        self.map = bytearray()
+        os.close(self.fd)
+        self.fd = None
@@ -0,0 +1,526 @@
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, inspect, select, text, Boolean, Column, Index, Integer, String, Text, Float, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.declarative import declarative_base
+
+from digikala_search import ensure_search_index, register_functions, search_index_exists, update_search_index
+
+logger = logging.getLogger(__name__)
+
+# تنظیمات پایگاه داده
+Base = declarative_base()
+
+class Product(Base):
+    __tablename__ = 'products'
+
+    id = Column(Integer, primary_key=True)
+    # شناسه دیجی‌کالا (عدد بعد از dkp- در آدرس محصول)
+    product_id = Column(Integer, unique=True, index=True)
+    name = Column(String(255))
+    price = Column(Float)
+    category = Column(String(100))
+    url = Column(Text, index=True)
+    description = Column(Text)
+    rating = Column(Float)
+    review_count = Column(Integer)
+    image_url = Column(Text)
+    specs = Column(Text)
+    # اثر انگشت فیلدهای کارت لیست (قیمت، نام، تصویر) برای خزش افزایشی
+    listing_fingerprint = Column(String(16))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    # برای گزارش‌های تجمیعی و صدک قیمت هر دسته
+    __table_args__ = (Index('ix_products_category_price', 'category', 'price'),)
+
+class Review(Base):
+    __tablename__ = 'reviews'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, index=True)
+    # کلید یکتای نظر برای جلوگیری از ذخیره تکراری
+    review_key = Column(String(64), unique=True, index=True)
+    product_url = Column(Text, index=True)
+    comment = Column(Text)
+    rating = Column(Float)
+    date = Column(String(50))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PriceHistory(Base):
+    """تاریخچه قیمت و موجودی؛ فقط مشاهده‌هایی که با مشاهده قبلی همان محصول فرق دارند ذخیره می‌شوند"""
+    __tablename__ = 'price_history'
+    product_id = Column(Integer, primary_key=True)
+    ts = Column(Integer, primary_key=True)  # unix timestamp (ثانیه)
+    selling_price = Column(Integer)  # ریال
+    rrp = Column(Integer)  # قیمت قبل از تخفیف (ریال)
+    is_ad = Column(Boolean)
+    in_stock = Column(Boolean)
+
+    # WITHOUT ROWID: ردیف‌ها روی کلید (product_id, ts) کنار هم ذخیره می‌شوند و سری قیمت یک محصول یک range scan است
+    __table_args__ = (Index('ix_price_history_ts', 'ts'), {'sqlite_with_rowid': False})
+
+class PriceLatest(Base):
+    """آخرین مشاهده هر محصول برای تشخیص تغییر و کوئری‌های «تغییر از دیروز»"""
+    __tablename__ = 'price_latest'
+    product_id = Column(Integer, primary_key=True)
+    ts = Column(Integer)
+    selling_price = Column(Integer)
+    rrp = Column(Integer)
+    is_ad = Column(Boolean)
+    in_stock = Column(Boolean)
+
+class Category(Base):
+    """گره درخت دسته‌بندی (/v1/dictionaries/) با تعداد محصول و نرخ تغییر برای زمان‌بندی خزش برگ‌ها"""
+    __tablename__ = 'categories'
+    code = Column(String(150), primary_key=True)
+    category_id = Column(Integer)
+    parent_code = Column(String(150), index=True)
+    title_fa = Column(String(255))
+    title_en = Column(String(255))
+    depth = Column(Integer)
+    # فقط برگ‌ها خزیده می‌شوند؛ محصولات دسته والد زیرمجموعه محصولات برگ‌هاست
+    is_leaf = Column(Boolean)
+    product_count = Column(Integer)  # آخرین تعداد شناخته‌شده (درخت یا pager جستجو)
+    previous_count = Column(Integer)
+    change_rate = Column(Float, default=0.0)  # میانگین نمایی تغییر نسبی تعداد بین اجراها
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    counted_at = Column(DateTime)
+
+    __table_args__ = (Index('ix_categories_leaf_count', 'is_leaf', 'product_count'),)
+
+class ImageFile(Base):
+    """نمایه دائمی آدرس تصویر (بدون پارامترهای resize) به hash محتوای فایل ذخیره‌شده"""
+    __tablename__ = 'images'
+    url = Column(String(500), primary_key=True)
+    sha256 = Column(String(64), index=True)
+    path = Column(Text)  # نسبت به پوشه تصاویر: ab/cd/<sha256>.jpg
+    size = Column(Integer)
+    content_type = Column(String(50))
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+PRODUCT_FIELDS = ['product_id', 'name', 'price', 'category', 'url', 'description', 'rating', 'review_count', 'image_url', 'specs']
+REVIEW_FIELDS = ['product_id', 'review_key', 'product_url', 'comment', 'rating', 'date']
+
+PRICE_FIELDS = ['selling_price', 'rrp', 'is_ad', 'in_stock']
+
+# بافرهای BufferedWriter به ترتیب نوشتن در تراکنش
+BUFFERS = ('products', 'reviews', 'refreshed', 'touched', 'prices')
+# پس از این تعداد flush ناموفق پیاپی، ردیف‌ها تک‌تک ذخیره می‌شوند تا ردیف خراب جدا شود
+FLUSH_ATTEMPTS = 3
+MAX_RETRY_DELAY = 60.0
+
+PRODUCT_ID_PATTERN = re.compile(r'/dkp-(\d+)')
+
+def parse_product_id(url: Optional[str]) -> Optional[int]:
+    """استخراج شناسه عددی محصول از آدرس (dkp-...)"""
+    match = PRODUCT_ID_PATTERN.search(url or '')
+    return int(match.group(1)) if match else None
+
+def make_review_key(review_item: Dict) -> str:
+    """ساخت کلید یکتای نظر از شناسه API یا از محتوای آن"""
+    if review_item.get('review_id'):
+        return str(review_item['review_id'])
+    rating = float(review_item.get('rating') or 0.0)
+    raw = '|'.join([review_item.get('product_url') or '', review_item.get('date') or '', str(rating), review_item.get('comment') or ''])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def listing_fingerprint(item: Dict) -> str:
+    """اثر انگشت کوتاه فیلدهای کارت محصول در صفحه دسته‌بندی"""
+    raw = f"{item.get('name') or ''}|{float(item.get('price') or 0.0)}|{item.get('image_url') or ''}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def price_observation(product_id: Optional[int], selling_price, rrp=None, is_ad: Optional[bool] = None,
+                      in_stock: Optional[bool] = None, ts: Optional[int] = None) -> Optional[Dict]:
+    """ساخت یک مشاهده قیمت (ریال)؛ بدون شناسه یا قیمت None برمی‌گردد"""
+    if product_id is None or not selling_price:
+        return None
+    return {
+        'product_id': int(product_id),
+        'ts': int(ts if ts is not None else time.time()),
+        'selling_price': int(round(float(selling_price))),
+        'rrp': int(round(float(rrp))) if rrp else None,
+        'is_ad': is_ad,
+        'in_stock': in_stock,
+    }
+
+def _record_prices(conn, observations: List[Dict]) -> int:
+    """ذخیره فقط مشاهده‌های تغییرکرده نسبت به price_latest؛ تعداد ردیف‌های تاریخچه را برمی‌گرداند"""
+    product_ids = list({obs['product_id'] for obs in observations})
+    latest = {}
+    table = PriceLatest.__table__
+    # محدودیت تعداد پارامتر SQLite
+    for start in range(0, len(product_ids), 900):
+        chunk = product_ids[start:start + 900]
+        for row in conn.execute(select(table).where(table.c.product_id.in_(chunk))).mappings():
+            latest[row['product_id']] = row
+    changed = []
+    for obs in sorted(observations, key=lambda o: o['ts']):
+        last = latest.get(obs['product_id'])
+        if last is not None:
+            # None یعنی منبع این فیلد را نمی‌داند (مثلا is_ad در صفحه محصول)؛ مقدار قبلی حفظ می‌شود و تغییر حساب نمی‌شود
+            obs = {**obs, **{f: last[f] for f in PRICE_FIELDS if obs[f] is None}}
+            if obs['ts'] < last['ts'] or all(obs[f] == last[f] for f in PRICE_FIELDS):
+                continue
+        latest[obs['product_id']] = obs
+        changed.append(obs)
+    if changed:
+        history = sqlite_insert(PriceHistory.__table__)
+        conn.execute(
+            history.on_conflict_do_update(
+                index_elements=['product_id', 'ts'], set_={f: history.excluded[f] for f in PRICE_FIELDS}
+            ),
+            changed,
+        )
+        current = sqlite_insert(PriceLatest.__table__)
+        conn.execute(
+            current.on_conflict_do_update(
+                index_elements=['product_id'], set_={f: current.excluded[f] for f in ['ts'] + PRICE_FIELDS}
+            ),
+            list({obs['product_id']: obs for obs in changed}.values()),
+        )
+    return len(changed)
+
+def _product_row(item: Dict) -> Dict:
+    row = {field: item.get(field) for field in PRODUCT_FIELDS}
+    if row['product_id'] is None:
+        row['product_id'] = parse_product_id(row['url'])
+    row['listing_fingerprint'] = listing_fingerprint(item)
+    row['updated_at'] = datetime.utcnow()
+    return row
+
+def _review_row(review_item: Dict) -> Dict:
+    row = {field: review_item.get(field) for field in REVIEW_FIELDS}
+    if row['product_id'] is None:
+        row['product_id'] = parse_product_id(row['product_url'])
+    if not row['review_key']:
+        row['review_key'] = make_review_key(review_item)
+    return row
+
+def _product_upsert():
+    stmt = sqlite_insert(Product.__table__)
+    updated = PRODUCT_FIELDS[1:] + ['listing_fingerprint', 'updated_at']
+    return stmt.on_conflict_do_update(
+        index_elements=['product_id'],
+        set_={field: stmt.excluded[field] for field in updated},
+    )
+
+def _product_refresh():
+    # فقط فیلدهای کارت لیست و زمان به‌روزرسانی؛ توضیحات و مشخصات دست نمی‌خورند
+    return text(
+        'UPDATE products SET name = :name, price = :price, image_url = :image_url, '
+        'listing_fingerprint = :listing_fingerprint, updated_at = :updated_at '
+        'WHERE product_id = :product_id'
+    )
+
+def _product_touch():
+    return text('UPDATE products SET updated_at = :updated_at WHERE product_id = :product_id')
+
+def _review_insert():
+    return sqlite_insert(Review.__table__).on_conflict_do_nothing(index_elements=['review_key'])
+
+def _migrate_legacy_schema(engine) -> None:
+    """افزودن ستون‌های جدید به دیتابیس‌های قدیمی و حذف ردیف‌های تکراری"""
+    inspector = inspect(engine)
+    if not inspector.has_table('products'):
+        return
+    product_columns = {c['name'] for c in inspector.get_columns('products')}
+    review_columns = {c['name'] for c in inspector.get_columns('reviews')} if inspector.has_table('reviews') else None
+    if 'product_id' in product_columns and (review_columns is None or 'review_key' in review_columns):
+        return
+    logger.info("مهاجرت ساختار دیتابیس قدیمی به ساختار کلیددار")
+    with engine.begin() as conn:
+        if 'product_id' not in product_columns:
+            conn.execute(text('ALTER TABLE products ADD COLUMN product_id INTEGER'))
+            conn.execute(text('ALTER TABLE products ADD COLUMN updated_at DATETIME'))
+            rows = conn.execute(text('SELECT id, url FROM products')).fetchall()
+            if rows:
+                conn.execute(
+                    text('UPDATE products SET product_id = :product_id, updated_at = created_at WHERE id = :id'),
+                    [{'id': row_id, 'product_id': parse_product_id(url)} for row_id, url in rows],
+                )
+            # نگه‌داشتن آخرین ردیف هر محصول
+            conn.execute(text(
+                'DELETE FROM products WHERE product_id IS NOT NULL AND id NOT IN '
+                '(SELECT MAX(id) FROM products WHERE product_id IS NOT NULL GROUP BY product_id)'
+            ))
+        if review_columns is not None and 'review_key' not in review_columns:
+            conn.execute(text('ALTER TABLE reviews ADD COLUMN review_key VARCHAR(64)'))
+            rows = conn.execute(text('SELECT id, product_url, comment, rating, date FROM reviews')).fetchall()
+            seen = set()
+            for row_id, product_url, comment, rating, date in rows:
+                review_item = {'product_url': product_url, 'comment': comment, 'rating': rating, 'date': date}
+                key = make_review_key(review_item)
+                if key in seen:
+                    conn.execute(text('DELETE FROM reviews WHERE id = :id'), {'id': row_id})
+                    continue
+                seen.add(key)
+                conn.execute(
+                    text('UPDATE reviews SET review_key = :key, product_id = :product_id WHERE id = :id'),
+                    {'id': row_id, 'key': key, 'product_id': parse_product_id(product_url)},
+                )
+
+def _add_missing_columns(engine) -> None:
+    """افزودن ستون‌های جدید مدل‌ها به جدول‌های موجود (create_all این کار را نمی‌کند)"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def create_db_engine(db_url: str = 'sqlite:///digikala.db'):
+    """ساخت engine پایگاه داده با حالت WAL برای SQLite"""
+    engine = create_engine(db_url)
+    if engine.dialect.name == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # WAL: خواننده‌ها نویسنده را متوقف نمی‌کنند و commit به fsync کامل نیاز ندارد
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            # چند worker روی یک فایل: به جای خطای database is locked منتظر قفل نوشتن بمان
+            cursor.execute('PRAGMA busy_timeout=30000')
+            cursor.close()
+            # fa_normalize و fa_specs برای به‌روزرسانی نمایه FTS5
+            register_functions(dbapi_connection)
+        _migrate_legacy_schema(engine)
+    _add_missing_columns(engine)
+    Base.metadata.create_all(engine)
+    # create_all ایندکس جدول‌های موجود را نمی‌سازد
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    if engine.dialect.name == 'sqlite':
+        # جستجوی متنی نام، توضیحات، مشخصات و نظرات (ردیف‌های نمایه‌نشده دیتابیس‌های قدیمی هم نمایه می‌شوند)
+        ensure_search_index(engine)
+    return engine
+
+class BufferedWriter:
+    """بافر محصولات و نظرات در حافظه و upsert دسته‌ای آن‌ها در یک تراکنش"""
+
+    def __init__(self, engine, flush_size: int = 500, flush_interval: float = 5.0):
+        self.engine = engine
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.products: List[Dict] = []
+        self.reviews: List[Dict] = []
+        self.refreshed: List[Dict] = []
+        self.touched: List[Dict] = []
+        self.prices: List[Dict] = []
+        self.last_flush = time.monotonic()
+        # خطای پیاپی flush و زمان تلاش دوباره؛ ردیف‌های خراب جداشده در rejected می‌مانند
+        self.failures = 0
+        self.retry_at = 0.0
+        self.rejected: List[tuple] = []
+        # فراخوانی پس از هر flush با (مدت به ثانیه، تعداد ردیف)؛ توسط MetricsExtension تنظیم می‌شود
+        self.on_flush: Optional[Callable[[float, int], None]] = None
+        self.search_index = search_index_exists(engine)
+
+    def add_product(self, item: Dict) -> None:
+        """افزودن محصول به بافر"""
+        self.products.append(_product_row(item))
+        self._maybe_flush()
+
+    def add_review(self, review_item: Dict) -> None:
+        """افزودن نظر به بافر"""
+        self.reviews.append(_review_row(review_item))
+        self._maybe_flush()
+
+    def refresh_product(self, item: Dict) -> None:
+        """به‌روزرسانی قیمت، نام، تصویر و زمان محصولی که صفحه‌اش تغییری نکرده"""
+        self.refreshed.append({
+            'product_id': item.get('product_id') or parse_product_id(item.get('url')),
+            'name': item.get('name'),
+            'price': item.get('price'),
+            'image_url': item.get('image_url'),
+            'listing_fingerprint': listing_fingerprint(item),
+            'updated_at': datetime.utcnow(),
+        })
+        self._maybe_flush()
+
+    def touch_products(self, product_ids: List[int]) -> None:
+        """به‌روزرسانی دسته‌ای زمان محصولاتی که کارتشان تغییری نکرده"""
+        now = datetime.utcnow()
+        self.touched.extend({'product_id': product_id, 'updated_at': now} for product_id in product_ids)
+        self._maybe_flush()
+
+    def add_price(self, observation: Optional[Dict]) -> None:
+        """افزودن مشاهده قیمت (خروجی price_observation) به بافر"""
+        if observation is not None:
+            self.prices.append(observation)
+            self._maybe_flush()
+
+    def stored_fingerprints(self, product_ids: List[int]) -> Dict[int, str]:
+        """اثر انگشت ذخیره‌شده کارت محصولات با یک کوئری"""
+        product_ids = [product_id for product_id in product_ids if product_id is not None]
+        if not product_ids:
+            return {}
+        placeholders = ', '.join(f':p{i}' for i in range(len(product_ids)))
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f'SELECT product_id, listing_fingerprint FROM products WHERE product_id IN ({placeholders})'),
+                {f'p{i}': product_id for i, product_id in enumerate(product_ids)},
+            )
+            return {product_id: fingerprint for product_id, fingerprint in rows}
+
+    def stored_review_keys(self, product_id: Optional[int]) -> set:
+        """کلید نظرهای ذخیره‌شده (یا منتظر در بافر) یک محصول"""
+        keys = {row['review_key'] for row in self.reviews if row['product_id'] == product_id}
+        if product_id is not None:
+            with self.engine.connect() as conn:
+                keys.update(conn.execute(select(Review.review_key).where(Review.product_id == product_id)).scalars())
+        return keys
+
+    def has_product(self, product_id: Optional[int]) -> bool:
+        """آیا محصول قبلاً ذخیره شده (یا در بافر منتظر ذخیره است)"""
+        if product_id is None:
+            return False
+        if any(row['product_id'] == product_id for row in self.products):
+            return True
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text('SELECT 1 FROM products WHERE product_id = :product_id'), {'product_id': product_id}
+            ).first() is not None
+
+    def pending(self) -> int:
+        return sum(len(getattr(self, name)) for name in BUFFERS)
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() < self.retry_at:
+            return
+        if (self.pending() >= self.flush_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def _write(self, conn, products=(), reviews=(), refreshed=(), touched=(), prices=()) -> int:
+        """upsert ردیف‌ها در تراکنش conn و برگرداندن تعداد تغییرهای قیمت"""
+        changed = 0
+        if products:
+            conn.execute(_product_upsert(), products)
+        if reviews:
+            conn.execute(_review_insert(), reviews)
+        if refreshed:
+            conn.execute(_product_refresh(), refreshed)
+        if touched:
+            conn.execute(_product_touch(), touched)
+        if prices:
+            changed = _record_prices(conn, prices)
+        if self.search_index and (products or reviews or refreshed):
+            update_search_index(conn, [row['product_id'] for row in list(products) + list(refreshed)])
+        return changed
+
+    def _restore(self, batch: Dict[str, List[Dict]]) -> None:
+        """برگرداندن ردیف‌های ذخیره‌نشده به ابتدای بافر (ترتیب ورود حفظ می‌شود)"""
+        for name, rows in batch.items():
+            setattr(self, name, rows + getattr(self, name))
+
+    def _write_rows(self, batch: Dict[str, List[Dict]]) -> int:
+        """ذخیره تک‌تک ردیف‌ها برای جدا کردن ردیف خراب؛ اگر هیچ ردیفی ذخیره نشود مشکل از دیتابیس است و همه در بافر می‌مانند"""
+        changed = 0
+        failed: Dict[str, List[Dict]] = {name: [] for name in batch}
+        errors = []
+        for name, rows in batch.items():
+            for row in rows:
+                try:
+                    with self.engine.begin() as conn:
+                        changed += self._write(conn, **{name: [row]})
+                except Exception as e:
+                    failed[name].append(row)
+                    errors.append(f"{name} {row.get('product_id')}: {str(e)}")
+        if sum(len(rows) for rows in failed.values()) == sum(len(rows) for rows in batch.values()):
+            self._restore(failed)
+            return changed
+        for name, rows in failed.items():
+            self.rejected.extend((name, row) for row in rows)
+        for error in errors:
+            logger.error(f"ردیف خراب کنار گذاشته شد: {error}")
+        return changed
+
+    def flush(self) -> None:
+        """نوشتن همه ردیف‌های بافر با executemany در یک تراکنش؛ در صورت خطا ردیف‌ها در بافر می‌مانند"""
+        self.last_flush = time.monotonic()
+        if not self.pending():
+            return
+        batch = {name: getattr(self, name) for name in BUFFERS}
+        for name in BUFFERS:
+            setattr(self, name, [])
+        changed = 0
+        started = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                changed = self._write(conn, **batch)
+        except Exception as e:
+            self.failures += 1
+            # از تلاش FLUSH_ATTEMPTS به بعد هر تلاش ردیف خراب را جدا می‌کند (شاید در تلاش قبلی دیتابیس در دسترس نبوده)
+            if self.failures >= FLUSH_ATTEMPTS:
+                logger.error(f"خطا در ذخیره دسته‌ای در دیتابیس: {str(e)}؛ ذخیره تک‌تک ردیف‌ها برای یافتن ردیف خراب")
+                changed = self._write_rows(batch)
+            else:
+                self._restore(batch)
+            if self.pending():
+                delay = min(MAX_RETRY_DELAY, 2 ** self.failures)
+                self.retry_at = time.monotonic() + delay
+                logger.error(
+                    f"خطا در ذخیره دسته‌ای در دیتابیس (تلاش {self.failures}): {str(e)}؛ "
+                    f"{self.pending()} ردیف در بافر ماند و {delay} ثانیه بعد دوباره ذخیره می‌شود"
+                )
+            else:
+                self.failures = 0
+                self.retry_at = 0.0
+        else:
+            self.failures = 0
+            self.retry_at = 0.0
+            logger.info(
+                f"ذخیره دسته‌ای در دیتابیس: {len(batch['products'])} محصول، {len(batch['reviews'])} نظر، "
+                f"{len(batch['refreshed']) + len(batch['touched'])} به‌روزرسانی و {changed} تغییر قیمت"
+            )
+        if self.on_flush is not None:
+            self.on_flush(time.perf_counter() - started, sum(len(rows) for rows in batch.values()))
+
+    def close(self) -> None:
+        """flush نهایی؛ اگر ردیفی ذخیره نشده باشد خطا می‌دهد تا از دست رفتن داده پنهان نماند"""
+        self.flush()
+        lost = self.pending() + len(self.rejected)
+        if lost:
+            raise RuntimeError(f"{lost} ردیف در دیتابیس ذخیره نشد ({len(self.rejected)} ردیف خراب)")
+
+class DigikalaStoragePipeline:
+    """مرحله pipeline اسکرپی برای ذخیره دسته‌ای محصولات و نظرات"""
+
+    def __init__(self, flush_size: int, flush_interval: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.writer: Optional[BufferedWriter] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            flush_size=crawler.settings.getint('DIGIKALA_FLUSH_SIZE', 500),
+            flush_interval=crawler.settings.getfloat('DIGIKALA_FLUSH_INTERVAL', 5.0),
+        )
+
+    def open_spider(self, spider):
+        engine = getattr(spider, 'engine', None) or create_db_engine()
+        self.writer = BufferedWriter(engine, self.flush_size, self.flush_interval)
+        # خزنده از همین writer در closed() برای flush نهایی استفاده می‌کند
+        spider.writer = self.writer
+
+    def process_item(self, item, spider):
+        if 'product_url' in item:
+            self.writer.add_review(item)
+        else:
+            self.writer.add_product(item)
+        return item
+
+    def close_spider(self, spider):
+        self.writer.close()
@@ -0,0 +1,142 @@
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import scrapy.core.downloader
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from twisted.internet import error
+from twisted.web._newclient import ResponseNeverReceived
+
+from digikala_api_engine import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# محدوده پیش‌فرض هر میزبان؛ در تنظیم DIGIKALA_THROTTLE_HOSTS قابل تغییر است
+DEFAULT_HOST_LIMITS = {
+    'min_delay': 0.25,
+    'max_delay': 60.0,
+    'start_delay': 1.0,
+    'min_concurrency': 1,
+    'max_concurrency': 8,
+    'target_latency': 2.0,
+}
+
+THROTTLE_STATUSES = {429, 503}
+# خطاهای شبکه‌ای که نشانه فشار روی سرورند؛ خطاهای دیگر (DNS، TLS و ...) تاخیر را تغییر نمی‌دهند
+BACKOFF_EXCEPTIONS = (error.TimeoutError, error.TCPTimedOutError, error.ConnectionRefusedError, ResponseNeverReceived)
+
+# ساعتی که downloader برای slot.lastseen استفاده می‌کند (monotonic در نسخه‌های جدید اسکرپی)
+_slot_clock = getattr(scrapy.core.downloader, 'monotonic', time.time)
+
+class HostState:
+    """وضعیت throttle یک میزبان: تاخیر، همزمانی و آمار پاسخ‌های اخیر"""
+
+    def __init__(self, limits: Dict):
+        self.limits = limits
+        self.delay = limits['start_delay']
+        self.concurrency = max(limits['min_concurrency'], limits['max_concurrency'] // 2)
+        self.latency = None
+        self.successes = 0
+        self.recent = deque(maxlen=100)  # True برای پاسخ‌های 429/503
+
+    def throttled_rate(self) -> float:
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def on_success(self, latency: float) -> None:
+        self.recent.append(False)
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        limits = self.limits
+        if self.latency > limits['target_latency']:
+            # سرور کند شده: افزایش ملایم تاخیر
+            self.delay = min(limits['max_delay'], self.delay * 1.25)
+            return
+        self.successes += 1
+        self.delay = max(limits['min_delay'], self.delay * 0.9)
+        # افزایش جمعی همزمانی و کاهش ضربی در زمان 429 (AIMD)
+        if self.successes % 20 == 0:
+            self.concurrency = min(limits['max_concurrency'], self.concurrency + 1)
+
+    def on_throttled(self) -> None:
+        self.recent.append(True)
+        self.successes = 0
+        limits = self.limits
+        # Retry-After فقط یک مکث یکباره است و در تاخیر پایه اثر نمی‌گذارد
+        self.delay = min(limits['max_delay'], max(self.delay * 2, limits['min_delay']))
+        self.concurrency = max(limits['min_concurrency'], self.concurrency // 2)
+
+class AdaptiveThrottleMiddleware:
+    """throttle تطبیقی برای هر میزبان بر اساس تاخیر پاسخ و نرخ 429/503 با رعایت Retry-After"""
+
+    def __init__(self, crawler, host_limits: Dict[str, Dict], default_limits: Dict):
+        self.crawler = crawler
+        self.host_limits = host_limits
+        self.default_limits = default_limits
+        self.hosts: Dict[str, HostState] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DIGIKALA_THROTTLE_ENABLED', True):
+            raise NotConfigured
+        default_limits = {**DEFAULT_HOST_LIMITS, **settings.getdict('DIGIKALA_THROTTLE_DEFAULT')}
+        host_limits = {
+            host: {**default_limits, **limits}
+            for host, limits in settings.getdict('DIGIKALA_THROTTLE_HOSTS').items()
+        }
+        return cls(crawler, host_limits, default_limits)
+
+    def _state(self, host: str) -> HostState:
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.host_limits.get(host, self.default_limits))
+        return self.hosts[host]
+
+    def _slot(self, request):
+        downloader = self.crawler.engine.downloader
+        get_key = getattr(downloader, 'get_slot_key', None) or downloader._get_slot_key
+        return downloader.slots.get(get_key(request))
+
+    def _apply(self, request, host: str, state: HostState, pause: Optional[float] = None) -> None:
+        slot = self._slot(request)
+        if slot is None:
+            return
+        slot.delay = state.delay
+        slot.concurrency = state.concurrency
+        if pause:
+            # عقب انداختن زمان آخرین ارسال تا درخواست بعدی حداقل pause ثانیه صبر کند
+            slot.lastseen = max(slot.lastseen, _slot_clock() + pause - slot.delay)
+        stats = self.crawler.stats
+        stats.set_value(f'throttle/{host}/delay', round(state.delay, 3))
+        stats.set_value(f'throttle/{host}/concurrency', state.concurrency)
+        stats.set_value(f'throttle/{host}/throttled_rate', round(state.throttled_rate(), 3))
+
+    def process_response(self, request, response, spider):
+        host = urlparse(response.url).hostname or ''
+        state = self._state(host)
+        if response.status in THROTTLE_STATUSES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            state.on_throttled()
+            self.crawler.stats.inc_value(f'throttle/{host}/throttled')
+            logger.warning(
+                f"وضعیت {response.status} از {host}؛ تاخیر {state.delay:.2f} ثانیه و همزمانی {state.concurrency}"
+            )
+            self._apply(request, host, state, pause=retry_after)
+        elif response.status < 500:
+            latency = request.meta.get('download_latency')
+            if latency is not None:
+                state.on_success(latency)
+                self._apply(request, host, state)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # IgnoreRequest (robots.txt، offsite، replay) یعنی درخواست اصلا به سرور نرسیده است
+        if isinstance(exception, IgnoreRequest) or not isinstance(exception, BACKOFF_EXCEPTIONS):
+            return None
+        # timeout، رد اتصال و پاسخ دریافت‌نشده نشانه فشار روی سرور است
+        host = urlparse(request.url).hostname or ''
+        state = self._state(host)
+        state.on_throttled()
+        self.crawler.stats.inc_value(f'throttle/{host}/network_errors')
+        self._apply(request, host, state)
+        return None
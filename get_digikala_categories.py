@@ -1,6 +1,9 @@
 import requests
 import json
 
+from digikala_categories import save_tree
+from digikala_storage import create_db_engine
+
 url = "https://api.digikala.com/v1/dictionaries/"
 params = {'types[0]': 'category_tree'}
 headers = {
@@ -22,6 +25,10 @@ data = resp.json()
 with open('digikala_categories.json', 'w', encoding='utf-8') as f:
     json.dump(data, f, ensure_ascii=False, indent=2)
 
+# درخت با والد، برگ بودن و تعداد محصولات در digikala.db (جدول categories) برای زمان‌بندی خزنده‌ها
+count = save_tree(create_db_engine(), data)
+print(f'{count} دسته‌بندی در digikala.db ذخیره شد')
+
 # نمایش ساختار دسته‌بندی‌ها
 for d in data.get('data', []):
     if d.get('type') == 'category_tree':
@@ -0,0 +1,135 @@
+import asyncio
+import csv
+import json
+import time
+from email.utils import formatdate
+
+from digikala_api_engine import (
+    ApiClient, StreamWriter, TokenBucket, crawl, map_provider_product, map_search_product, parse_retry_after,
+)
+from digikala_prices import observation_from_api_item
+from digikala_seen import DkpBitmap
+
+SEARCH_PRODUCT = {
+    'id': 42,
+    'title_fa': 'گوشی نمونه',
+    'url': {'uri': '/product/dkp-42/'},
+    'status': 'marketable',
+    'default_variant': {'price': {'selling_price': 90000, 'rrp_price': 100000}},
+    'brand': {'title_fa': 'برند'},
+    'rating': {'rate': 4.5, 'count': 12},
+    'images': {'main': {'url': ['https://dkstatic.ir/42.jpg']}},
+}
+
+EXPORT_COLUMNS = ['نام', 'قیمت', 'برند', 'امتیاز', 'تعداد_نظرات', 'آدرس', 'تصویر', 'دسته', 'تبلیغاتی']
+
+def test_export_rows_keep_their_columns(tmp_path):
+    json_path, csv_path = tmp_path / 'products.json', tmp_path / 'products.csv'
+    writer = StreamWriter(str(json_path), str(csv_path))
+    writer.write(map_search_product(SEARCH_PRODUCT, 'mobile-phone'))
+    writer.close()
+    assert list(json.loads(json_path.read_text(encoding='utf-8'))[0]) == EXPORT_COLUMNS
+    with open(csv_path, encoding='utf-8-sig', newline='') as f:
+        assert next(csv.reader(f)) == EXPORT_COLUMNS
+
+def test_mapped_products_carry_price_history_fields():
+    for item in (map_search_product(SEARCH_PRODUCT, 'mobile-phone'), map_provider_product(SEARCH_PRODUCT)):
+        observation = observation_from_api_item(item, ts=1)
+        assert observation['product_id'] == 42
+        assert (observation['selling_price'], observation['rrp'], observation['in_stock']) == (90000, 100000, True)
+
+def test_stream_writer_empty_and_root_key(tmp_path):
+    path = tmp_path / 'empty.json'
+    StreamWriter(str(path)).close()
+    assert json.loads(path.read_text(encoding='utf-8')) == []
+    writer = StreamWriter(str(path), root_key='products')
+    writer.write({'نام': 'الف'})
+    writer.close()
+    assert json.loads(path.read_text(encoding='utf-8')) == {'products': [{'نام': 'الف'}]}
+
+def test_parse_retry_after():
+    assert parse_retry_after(b'120') == 120.0
+    assert parse_retry_after(' 5 ') == 5.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('not a date') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert 55 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+
+def test_token_bucket_allows_burst_then_rate():
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(10):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert 0.18 <= total < 0.5
+
+def test_api_client_honours_http_date_retry_after(monkeypatch):
+    from aiohttp import web
+
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        if len(calls) == 1:
+            return web.Response(status=429, headers={'Retry-After': formatdate(time.time() + 30, usegmt=True)})
+        return web.json_response({'ok': True})
+
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/v1/test/', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+        try:
+            async with ApiClient(rate=100) as client:
+                return await client.get_json(f'http://127.0.0.1:{port}/v1/test/')
+        finally:
+            monkeypatch.setattr(asyncio, 'sleep', real_sleep)
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == {'ok': True}
+    assert len(calls) == 2
+    assert 25 < delays[-1] <= 30
+
+def test_crawl_deduplicates_across_runs(tmp_path):
+    catalog = {'phone': [1, 2], 'case': [2, 3]}
+
+    async def pages(client, category, max_pages, expected, on_total):
+        yield [{'آدرس': f'https://www.digikala.com/product/dkp-{product_id}/', 'تبلیغاتی': False}
+               for product_id in catalog[category]]
+
+    def run(path, reset=False):
+        seen = DkpBitmap(path, reset=reset)
+        duplicates = []
+
+        async def collect():
+            return [item async for item in crawl(None, list(catalog), 1, pages=pages, seen=seen,
+                                                  on_duplicate=duplicates.append)]
+
+        items = asyncio.run(collect())
+        seen.close()
+        return sorted(item['آدرس'][-2] for item in items), len(duplicates)
+
+    path = str(tmp_path / 'api.seen')
+    assert run(path) == (['1', '2', '3'], 1)
+    # اجرای بعد با همان فایل فقط محصولات جدید را تحویل می‌دهد؛ تکراری‌ها به on_duplicate می‌رسند
+    catalog['phone'].append(4)
+    assert run(path) == (['4'], 4)
+    assert run(path, reset=True) == (['1', '2', '3', '4'], 1)
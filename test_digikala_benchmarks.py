@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import run_benchmarks
+from run_benchmarks import compare
+
+CASE = 'helpers/parse_price[x300]'
+
+def baseline(median_ms):
+    return {'results': {CASE: {'median_ms': median_ms}}}
+
+def run(monkeypatch, tmp_path, *args):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['run_benchmarks.py', '--repeat', '1', '--filter', CASE, *args])
+    run_benchmarks.main()
+
+def test_compare():
+    results = baseline(10.0)['results']
+    assert compare(CASE, {'median_ms': 10.5}, results, 0.10) == (pytest.approx(1.05), False)
+    assert compare(CASE, {'median_ms': 12.0}, results, 0.10) == (pytest.approx(1.2), True)
+    assert compare(CASE, {'median_ms': 12.0}, results, 0.25) == (pytest.approx(1.2), False)
+    # case جدید یا اجرای بدون --compare پسرفت حساب نمی‌شود
+    assert compare('new/case', {'median_ms': 12.0}, results, 0.10) == (None, False)
+    assert compare(CASE, {'median_ms': 12.0}, None, 0.10) == (None, False)
+
+def test_regression_fails_the_run(monkeypatch, tmp_path, capsys):
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps(baseline(1e-6)), encoding='utf-8')
+    with pytest.raises(SystemExit) as exit_info:
+        run(monkeypatch, tmp_path, '--compare', str(path))
+    assert exit_info.value.code == 1
+    out = capsys.readouterr().out
+    assert 'پسرفت' in out and f'1 case کندتر از baseline: {CASE}' in out
+
+    path.write_text(json.dumps(baseline(1e6)), encoding='utf-8')
+    run(monkeypatch, tmp_path, '--compare', str(path))
+    assert 'پسرفت' not in capsys.readouterr().out
+
+def test_saved_baseline_can_be_compared(monkeypatch, tmp_path):
+    path = tmp_path / 'baseline.json'
+    run(monkeypatch, tmp_path, '--save-baseline', str(path))
+    saved = json.loads(path.read_text(encoding='utf-8'))
+    assert list(saved['results']) == [CASE] and saved['results'][CASE]['median_ms'] > 0
+    run(monkeypatch, tmp_path, '--compare', str(path), '--threshold', '1000')
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import text
+
+from digikala_categories import category_counts, leaf_categories, record_counts, save_tree
+from digikala_storage import create_db_engine
+
+def node(code, children=(), count=None):
+    result = {'id': len(code), 'code': code, 'title_fa': f'دسته {code}', 'children': list(children)}
+    if count is not None:
+        result['product_count'] = count
+    return result
+
+TREE = [
+    node('electronic', [
+        node('mobile', [node('phone', count=500), node('case', count=2000)]),
+        node('laptop', count=800),
+    ], count=9999),
+    node('book', [node('novel'), node('poem', count=100)]),
+]
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}")
+    save_tree(engine, {'data': [{'type': 'category_tree', 'data': {'tree': TREE}}]})
+    return engine
+
+def codes(leaves):
+    return [leaf['code'] for leaf in leaves]
+
+def test_leaves_by_size_unknown_first(engine):
+    # novel تعداد ندارد و اول خزیده می‌شود تا اندازه‌اش معلوم شود؛ دسته‌های والد هرگز برگشت داده نمی‌شوند
+    assert codes(leaf_categories(engine)) == ['novel', 'case', 'laptop', 'phone', 'poem']
+    assert codes(leaf_categories(engine, limit=2)) == ['novel', 'case']
+    with pytest.raises(ValueError):
+        leaf_categories(engine, 'random')
+
+def test_leaves_by_change_rate(engine):
+    record_counts(engine, {'poem': 150, 'laptop': 820, 'novel': 30})
+    # poem ‏50٪ رشد کرده، laptop ‏2.5٪؛ اولین تعداد novel تغییر حساب نمی‌شود
+    assert codes(leaf_categories(engine, 'change')) == ['poem', 'laptop', 'case', 'phone', 'novel']
+    assert codes(leaf_categories(engine, 'size')) == ['case', 'laptop', 'phone', 'poem', 'novel']
+
+def test_record_counts(engine):
+    record_counts(engine, {'phone': 600})
+    record_counts(engine, {'phone': 600})
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT product_count, previous_count, change_rate, counted_at FROM categories WHERE code = 'phone'"
+        )).one()
+    assert (row.product_count, row.previous_count) == (600, 600)
+    assert row.change_rate == pytest.approx(0.7 * 0.3 * 0.2)
+    assert row.counted_at is not None
+    assert category_counts(engine, ['phone', 'novel', 'missing']) == {'phone': 600}
+
+def test_saving_the_tree_again_keeps_recorded_counts(engine):
+    record_counts(engine, {'novel': 30})
+    save_tree(engine, {'data': [{'type': 'category_tree', 'data': {'tree': TREE}}]})
+    assert category_counts(engine, ['novel', 'phone']) == {'novel': 30, 'phone': 500}
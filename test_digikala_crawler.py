@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.utils.test import get_crawler
+from sqlalchemy import text
+
+from digikala_categories import category_counts, save_tree
+from digikala_extractors import NEXT_DATA_START
+from digikala_reviews import comments_url
+
+CATEGORY = 'https://www.digikala.com/search/category-phone/'
+
+def listing_page(product_ids, pager=None):
+    products = [{
+        'id': product_id,
+        'title_fa': f'محصول {product_id}',
+        'url': {'uri': f'/product/dkp-{product_id}/'},
+        'default_variant': {'price': {'selling_price': 10000 * product_id}},
+    } for product_id in product_ids]
+    data = {'products': products}
+    if pager:
+        data['pager'] = pager
+    blob = json.dumps({'props': {'pageProps': {'data': data}}}, ensure_ascii=False)
+    return f'<html><body>{NEXT_DATA_START}{blob}</script></body></html>'.encode('utf-8')
+
+def response(url, body, **meta):
+    return HtmlResponse(url, body=body, encoding='utf-8', request=Request(url, meta=meta))
+
+def run(callback):
+    async def collect():
+        return [output async for output in callback]
+    return asyncio.run(collect())
+
+@pytest.fixture
+def make_spider(tmp_path, monkeypatch):
+    # اسپایدر digikala.db و فایل لاگ را در پوشه جاری می‌سازد
+    monkeypatch.chdir(tmp_path)
+    from digikala_crawler import DigikalaSpider
+
+    spiders = []
+
+    def make(**kwargs):
+        spiders.append(DigikalaSpider.from_crawler(get_crawler(DigikalaSpider), **kwargs))
+        return spiders[-1]
+    yield make
+    for spider in spiders:
+        spider.writer.close()
+
+@pytest.fixture
+def spider(make_spider):
+    spider = make_spider()
+    tree = [{'code': 'phone', 'title_fa': 'گوشی', 'product_count': 2}]
+    save_tree(spider.engine, {'data': [{'type': 'category_tree', 'data': {'tree': tree}}]})
+    return spider
+
+def rows(engine, sql):
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).fetchall()
+
+def split(outputs):
+    pages = [request for request in outputs if request.callback.__name__ == 'parse_category']
+    products = [request for request in outputs if request.callback.__name__ == 'parse_product_page']
+    return pages, products
+
+def test_paging_uses_the_current_total(spider):
+    # تعداد درخت (2) قدیمی است؛ pager صفحه اول 4 محصول دارد
+    pager = {'current_page': 1, 'total_pages': 3, 'total_items': 4}
+    pages, products = split(run(spider.parse_category(
+        response(CATEGORY, listing_page([1, 2], pager), category='گوشی', category_code='phone'))))
+    assert len(products) == 2 and len(pages) == 1
+    assert pages[0].meta['total'] == 4
+    assert category_counts(spider.engine, ['phone']) == {'phone': 4}
+
+    # صفحه دوم همه 4 محصول را کامل می‌کند؛ صفحه سوم درخواست نمی‌شود
+    pager = {'current_page': 2, 'total_pages': 3, 'total_items': 4}
+    pages, products = split(run(spider.parse_category(response(pages[0].url, listing_page([3, 4], pager), **pages[0].meta))))
+    assert len(products) == 2 and pages == []
+    assert spider.crawler.stats.get_value('digikala/category_pages_skipped') == 1
+
+def test_count_is_recorded_when_paging_ends_without_pager(spider):
+    html = listing_page([1, 2, 3])
+    assert split(run(spider.parse_category(response(CATEGORY, html, category='گوشی', category_code='phone'))))[0] == []
+    assert category_counts(spider.engine, ['phone']) == {'phone': 3}
+
+def test_start_requests_follow_leaf_order(spider):
+    tree = [{'code': 'phone', 'product_count': 5}, {'code': 'case', 'product_count': 50}, {'code': 'new'}]
+    save_tree(spider.engine, {'data': [{'type': 'category_tree', 'data': {'tree': tree}}]})
+    requests = list(spider.start_requests())
+    assert [request.meta['category_code'] for request in requests] == ['new', 'case', 'phone']
+    assert [request.priority for request in requests] == [0, -1, -2]
+    assert all('total' not in request.meta for request in requests)
+
+def test_incremental_skips_unchanged_listing_cards(make_spider):
+    html = listing_page([1, 2, 3])
+    spider = make_spider(incremental='true')
+    items, _ = spider.extractor.listing(html.decode('utf-8'), CATEGORY, 'گوشی')
+    # 1 با همان کارت ذخیره شده، قیمت 2 عوض شده و 3 جدید است
+    spider.writer.add_product({**items[0], 'product_id': 1})
+    spider.writer.add_product({**items[1], 'product_id': 2, 'price': 1.0})
+    spider.writer.flush()
+    before = dict(rows(spider.engine, 'SELECT product_id, updated_at FROM products'))
+
+    _, products = split(run(spider.parse_category(response(CATEGORY, html, category='گوشی'))))
+    assert [request.url for request in products] == [items[1]['url'], items[2]['url']]
+    assert spider.crawler.stats.get_value('digikala/listing_unchanged') == 1
+    spider.writer.flush()
+    after = dict(rows(spider.engine, 'SELECT product_id, updated_at FROM products'))
+    assert after[1] > before[1] and after[2] == before[2]
+
+    # بدون حالت افزایشی همه صفحات محصول دوباره دریافت می‌شوند
+    full = make_spider()
+    assert len(split(run(full.parse_category(response(CATEGORY, html, category='گوشی'))))[1]) == 3
+
+def comments(ids, total_pages=9):
+    data = {'comments': [{'id': i, 'body': f'نظر {i}', 'rate': 4, 'created_at': '1403/01/01'} for i in ids],
+            'pager': {'total_pages': total_pages}}
+    return json.dumps({'status': 200, 'data': data}).encode('utf-8')
+
+def test_comment_pages_stop_at_a_stored_review(make_spider):
+    spider = make_spider(review_pages='5')
+    url = 'https://www.digikala.com/product/dkp-7/'
+    spider.writer.add_review({'review_id': 102, 'product_id': 7, 'product_url': url, 'comment': 'قدیمی'})
+    # 105 همین حالا از صفحه محصول در بافر است؛ چون تازه است صفحه‌بندی را متوقف نمی‌کند
+    spider.writer.add_review({'review_id': 105, 'product_id': 7, 'product_url': url, 'comment': 'نظر 105'})
+    meta = {'product_id': 7, 'product_url': url, 'page': 1, 'fresh_reviews': ['105']}
+
+    outputs = run(spider.parse_comments(TextResponse(comments_url(7), body=comments([105, 104]),
+                                                     request=Request(comments_url(7), meta=meta))))
+    requests = [output for output in outputs if isinstance(output, Request)]
+    assert [review['review_id'] for review in outputs if isinstance(review, dict)] == [105, 104]
+    assert [request.url for request in requests] == [comments_url(7, 2)]
+
+    # صفحه دوم به 102 ذخیره‌شده می‌رسد: 101 و صفحات بعد دریافت نمی‌شوند
+    outputs = run(spider.parse_comments(TextResponse(requests[0].url, body=comments([103, 102, 101]),
+                                                     request=requests[0])))
+    assert outputs == [{'review_id': 103, 'product_id': 7, 'product_url': url, 'comment': 'نظر 103',
+                        'rating': 4.0, 'date': '1403/01/01'}]
+    assert spider.crawler.stats.get_value('digikala/api_reviews') == 3
+
+def test_product_requests_carry_only_the_staged_dkp_id(make_spider, tmp_path):
+    from digikala_frontier import SqliteFrontier
+
+    spider = make_spider()
+    spider.frontier = SqliteFrontier(str(tmp_path / 'crawl_state.sqlite'))
+    _, products = split(run(spider.parse_category(response(CATEGORY, listing_page([1, 2]), category='گوشی'))))
+    assert [request.meta for request in products] == [{'product_id': 1}, {'product_id': 2}]
+    staged = spider.frontier.staged(2)
+    assert (staged['name'], staged['price'], staged['category']) == ('محصول 2', 2000.0, 'گوشی')
+
+    page = response(products[1].url, b'<html><body></body></html>', **products[1].meta)
+    [item] = [output for output in run(spider.parse_product_page(page)) if 'name' in output]
+    assert (item['product_id'], item['name'], item['price']) == (2, 'محصول 2', 2000.0)
+    # پس از پردازش صفحه، کارت از staged_items حذف می‌شود
+    assert spider.frontier.staged(2) is None and spider.frontier.staged(1) is not None
+    spider.frontier.close()
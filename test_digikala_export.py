@@ -0,0 +1,86 @@
+import csv
+import json
+
+import pytest
+
+from digikala_export import (
+    PRODUCT_CSV_COLUMNS, REVIEW_CSV_COLUMNS, export_csv, export_structured_json, iter_structured_products,
+)
+from digikala_storage import BufferedWriter, create_db_engine
+
+SPECS = json.dumps({'رنگ': 'مشکی'}, ensure_ascii=False)
+
+def url(product_id):
+    return f'https://www.digikala.com/product/dkp-{product_id}/'
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}")
+    writer = BufferedWriter(engine)
+    # ترتیب url با ترتیب شناسه فرق دارد تا merge-join واقعا آزموده شود
+    for product_id in (30, 4, 125, 7):
+        writer.add_product({'product_id': product_id, 'name': f'محصول {product_id}', 'price': 1000.0 * product_id,
+                            'url': url(product_id) + 'old-slug/', 'category': 'mobile', 'specs': SPECS})
+    # نظرها با آدرس قدیمی محصول ذخیره شده‌اند
+    for product_id, comment in ((7, 'اول'), (125, 'خوب'), (7, 'دوم'), (99, 'بدون محصول')):
+        writer.add_review({'product_url': url(product_id) + 'old-slug/', 'comment': comment, 'rating': 4,
+                           'date': '1402/01/01'})
+    writer.flush()
+    # upsert بعدی آدرس محصولات را به نسخه جدید تغییر می‌دهد
+    for product_id in (30, 4, 125, 7):
+        writer.add_product({'product_id': product_id, 'name': f'محصول {product_id}', 'price': 1000.0 * product_id,
+                            'url': url(product_id), 'category': 'mobile', 'specs': SPECS})
+    writer.close()
+    return engine
+
+def comments_by_product(items):
+    return {item['url']: [review['comment'] for review in item['reviews']] for item in items}
+
+def test_reviews_are_attached_to_their_products(engine):
+    # batch کوچک‌تر از تعداد ردیف‌ها تا خواندن تکه‌تکه cursor آزموده شود
+    items = list(iter_structured_products(engine, batch_size=1))
+    assert [item['url'] for item in items] == [url(product_id) for product_id in (4, 7, 30, 125)]
+    assert comments_by_product(items) == {url(4): [], url(7): ['اول', 'دوم'], url(30): [], url(125): ['خوب']}
+    assert items[0]['specs'] == {'رنگ': 'مشکی'}
+
+def test_products_are_streamed(engine):
+    items = iter_structured_products(engine)
+    first = next(items)
+    assert first['url'] == url(4)
+    items.close()
+
+def test_json_array_and_jsonl_match(engine, tmp_path):
+    array_path, lines_path = tmp_path / 'products.json', tmp_path / 'products.jsonl'
+    assert export_structured_json(engine, str(array_path)) == 4
+    assert export_structured_json(engine, str(lines_path), jsonl=True) == 4
+    array = json.loads(array_path.read_text(encoding='utf-8'))
+    lines = [json.loads(line) for line in lines_path.read_text(encoding='utf-8').splitlines()]
+    assert array == lines
+    assert comments_by_product(array)[url(7)] == ['اول', 'دوم']
+
+def test_empty_database_writes_empty_array(tmp_path):
+    path = tmp_path / 'products.json'
+    assert export_structured_json(create_db_engine(f"sqlite:///{tmp_path / 'empty.db'}"), str(path)) == 0
+    assert json.loads(path.read_text(encoding='utf-8')) == []
+
+def test_csv_export(engine, tmp_path):
+    products_path, reviews_path = tmp_path / 'products.csv', tmp_path / 'reviews.csv'
+    export_csv(engine, str(products_path), str(reviews_path))
+    with open(products_path, encoding='utf-8', newline='') as f:
+        products = list(csv.reader(f))
+    with open(reviews_path, encoding='utf-8', newline='') as f:
+        reviews = list(csv.reader(f))
+    assert products[0] == PRODUCT_CSV_COLUMNS and len(products) == 5
+    assert reviews[0] == REVIEW_CSV_COLUMNS and len(reviews) == 5
+    assert [row[1] for row in reviews[1:]] == ['اول', 'خوب', 'دوم', 'بدون محصول']
+
+def test_product_without_dkp_id_gets_no_reviews(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    writer = BufferedWriter(engine)
+    landing = 'https://www.digikala.com/landing/'
+    writer.add_product({'name': 'صفحه قدیمی', 'url': landing})
+    writer.add_product({'product_id': 1, 'name': 'محصول', 'url': url(1)})
+    writer.add_review({'product_url': landing, 'comment': 'بی‌شناسه'})
+    writer.add_review({'product_url': url(1), 'comment': 'خوب'})
+    writer.close()
+    assert comments_by_product(iter_structured_products(engine)) == {landing: [], url(1): ['خوب']}
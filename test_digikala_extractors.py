@@ -0,0 +1,145 @@
+import json
+import os
+
+import pytest
+
+from digikala_extractors import EXTRACTORS, NEXT_DATA_START, extract_next_data, get_extractor, parse_price
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASE_URL = 'https://www.digikala.com/search/category-mobile-phone/'
+DOM_EXTRACTORS = ['soup', 'lxml']
+
+PRODUCTS = [
+    {'id': 11, 'title': 'گوشی الف', 'price': 125000, 'image': 'https://dkstatics-public.digikala.com/11.jpg'},
+    {'id': 12, 'title': 'گوشی ب', 'price': 98000, 'image': 'https://dkstatics-public.digikala.com/12.jpg'},
+]
+
+def card(product):
+    # کارت فعلی سایت: div داخل لینک محصول، قیمت به ریال با جداکننده هزارگان
+    return (f'<a href="/product/dkp-{product["id"]}/"><div data-testid="product-card">'
+            f'<img src="{product["image"]}"><h3 data-testid="product-title"> {product["title"]} </h3>'
+            f'<span data-testid="price-main">{product["price"]:,}</span></div></a>')
+
+def next_data(products, current_page=1, total_pages=3):
+    blob = {'props': {'pageProps': {'data': {
+        'products': [{
+            'id': p['id'],
+            'title_fa': p['title'],
+            'url': {'uri': f'/product/dkp-{p["id"]}/'},
+            'default_variant': {'price': {'selling_price': p['price'], 'rrp_price': p['price'] + 1000}},
+            'images': {'main': {'url': [p['image']]}},
+            'rating': {'rate': 4.1, 'count': 3},
+            'status': 'marketable',
+        } for p in products],
+        'pager': {'current_page': current_page, 'total_pages': total_pages},
+    }}}}
+    return f'{NEXT_DATA_START}{json.dumps(blob, ensure_ascii=False)}</script>'
+
+LISTING = (f'<html><body><main>{"".join(card(p) for p in PRODUCTS)}</main>'
+           f'<a aria-label="صفحه بعد" href="?page=2">بعدی</a></body></html>')
+
+PRODUCT_PAGE = """<html><body>
+<div class="c-product__description"> توضیحات محصول </div>
+<span class="c-product__rating-score">4.5</span><span class="c-product__review-count">(12 نظر)</span>
+<div class="c-product__specifications"><table>
+<tr><th>وزن</th><td>180 گرم</td></tr><tr><th>رنگ</th><td>مشکی</td></tr></table></div>
+<div class="c-comment__item"><p class="c-comment__text">عالی بود</p><span class="c-comment__rating">5</span>
+<span class="c-comment__date">1402/01/01</span></div>
+<div class="c-comment__item"><p class="c-comment__text">معمولی</p></div>
+</body></html>"""
+
+@pytest.mark.parametrize('name', DOM_EXTRACTORS)
+def test_dom_listing(name):
+    items, next_url = get_extractor(name).listing(LISTING, BASE_URL, 'mobile-phone')
+    assert next_url == BASE_URL + '?page=2'
+    assert items == [{
+        'name': p['title'],
+        'price': p['price'] / 10,
+        'url': f'https://www.digikala.com/product/dkp-{p["id"]}/',
+        'category': 'mobile-phone',
+        'image_url': p['image'],
+    } for p in PRODUCTS]
+
+@pytest.mark.parametrize('name', DOM_EXTRACTORS)
+def test_dom_product_page(name):
+    page = get_extractor(name).product_page(PRODUCT_PAGE)
+    assert page == {
+        'description': 'توضیحات محصول',
+        'rating': 4.5,
+        'review_count': 12,
+        'specs': {'وزن': '180 گرم', 'رنگ': 'مشکی'},
+        'reviews': [
+            {'comment': 'عالی بود', 'rating': 5.0, 'date': '1402/01/01'},
+            {'comment': 'معمولی', 'rating': 0.0, 'date': 'N/A'},
+        ],
+    }
+
+@pytest.mark.parametrize('fixture', ['digikala_page_source.html', 'digikala_page_source_after_scroll.html'])
+def test_backends_agree_on_saved_pages(fixture):
+    with open(os.path.join(ROOT, fixture), encoding='utf-8') as f:
+        html = f.read()
+    results = [
+        (extractor.categories(html, BASE_URL), extractor.listing(html, BASE_URL, 'mobile-phone'), extractor.product_page(html))
+        for extractor in map(get_extractor, EXTRACTORS)
+    ]
+    assert all(result == results[0] for result in results)
+
+# ساختار قدیمی سایت: فقط سلکتورهای fallback، متن تودرتو و کارت‌های ناقص
+LEGACY_LISTING = """<html><body><nav>
+<a href="/search/category-book/"> کتاب <b>و</b> مجله </a><a href="/search/category-toy/">اسباب‌بازی</a><a href="/about/">درباره</a>
+</nav>
+<div class="c-product-box"><a href="/product/dkp-21/x/"><h3>کتاب <i>الف</i></h3></a>
+<div class="c-price__value"> ۲۵,۰۰۰ </div><img src="/21.jpg"></div>
+<div class="c-product-box"><h3></h3><img></div>
+<a rel="next" href="?page=2">بعدی</a></body></html>"""
+
+def test_dom_backends_agree_on_fallback_selectors():
+    soup, lxml = get_extractor('soup'), get_extractor('lxml')
+    assert soup.categories(LEGACY_LISTING, BASE_URL) == lxml.categories(LEGACY_LISTING, BASE_URL) == [
+        ('https://www.digikala.com/search/category-book/', 'کتاب و مجله'),
+        ('https://www.digikala.com/search/category-toy/', 'اسباب‌بازی'),
+    ]
+    listing = lxml.listing(LEGACY_LISTING, BASE_URL, 'book')
+    assert soup.listing(LEGACY_LISTING, BASE_URL, 'book') == listing
+    assert listing == ([
+        {'name': 'کتاب الف', 'price': 2500.0, 'url': 'https://www.digikala.com/product/dkp-21/x/',
+         'category': 'book', 'image_url': '/21.jpg'},
+        {'name': '', 'price': 0.0, 'url': 'N/A', 'category': 'book', 'image_url': 'N/A'},
+    ], BASE_URL + '?page=2')
+    empty = '<html><body><p>صفحه خالی</p></body></html>'
+    assert soup.product_page(empty) == lxml.product_page(empty) == {
+        'description': 'N/A', 'rating': 0.0, 'review_count': 0, 'specs': {}, 'reviews': [],
+    }
+
+def test_next_data_matches_dom_fields():
+    html = LISTING.replace('</body>', next_data(PRODUCTS) + '</body>')
+    dom_items, _ = get_extractor('lxml').listing(html, BASE_URL, 'mobile-phone')
+    json_items, next_url = get_extractor('next_data').listing(html, BASE_URL, 'mobile-phone')
+    for dom, item in zip(dom_items, json_items):
+        assert {key: item[key] for key in dom} == dom
+    assert [(item['product_id'], item['rrp'], item['in_stock']) for item in json_items] == [
+        (11, 12600.0, True), (12, 9900.0, True),
+    ]
+    assert next_url == BASE_URL + '?page=2'
+
+def test_next_data_pager_and_fallback():
+    extractor = get_extractor('next_data')
+    _, next_url = extractor.listing(next_data(PRODUCTS, 2, 3), BASE_URL + '?sort=4&page=2', 'mobile-phone')
+    assert next_url == BASE_URL + '?sort=4&page=3'
+    assert extractor.listing(next_data(PRODUCTS, 3, 3), BASE_URL, 'mobile-phone')[1] is None
+    # بدون محصول در JSON همان خروجی DOM برگردانده می‌شود
+    empty = LISTING.replace('</body>', next_data([]) + '</body>')
+    assert extractor.listing(empty, BASE_URL, 'mobile-phone') == get_extractor('lxml').listing(empty, BASE_URL, 'mobile-phone')
+    assert extractor.product_page(PRODUCT_PAGE) == get_extractor('lxml').product_page(PRODUCT_PAGE)
+
+def test_extract_next_data_errors():
+    assert extract_next_data('<html></html>') is None
+    assert extract_next_data(NEXT_DATA_START + '{"a": 1}') is None
+    assert extract_next_data(NEXT_DATA_START + '{broken</script>') is None
+    assert extract_next_data(NEXT_DATA_START + '{"a": 1}</script>') == {'a': 1}
+
+def test_parse_price_and_unknown_extractor():
+    assert parse_price('125,000 ریال') == 12500.0
+    assert parse_price('ناموجود') == 0.0
+    with pytest.raises(ValueError):
+        get_extractor('regex')
@@ -0,0 +1,153 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from digikala_frontier import FrontierAckMiddleware, SqliteFrontier
+
+def state(frontier, fingerprint):
+    return frontier.conn.execute('SELECT state FROM requests WHERE fingerprint = ?', (fingerprint,)).fetchone()[0]
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = SqliteFrontier(str(tmp_path / 'crawl_state.sqlite'))
+    yield frontier
+    frontier.close()
+
+def test_push_deduplicates_and_pops_by_priority(frontier):
+    assert frontier.push(b'a', 'https://a', 'parse', b'', 0)
+    assert not frontier.push(b'a', 'https://a', 'parse', b'', 0)
+    assert frontier.push(b'b', 'https://b', 'parse', b'', 10)
+    assert frontier.pop()[0] == b'b'
+    assert frontier.pop()[0] == b'a'
+    assert frontier.pop() is None
+    assert frontier.pending() == 0 and frontier.in_flight() == 2
+
+def test_ack_and_fail(frontier):
+    frontier.push(b'a', 'https://a', 'parse', b'', 0)
+    frontier.push(b'b', 'https://b', 'parse', b'', 0)
+    frontier.pop()
+    frontier.pop()
+    frontier.ack(b'a')
+    frontier.fail(b'b', 'timeout')
+    assert state(frontier, b'a') == 2
+    assert frontier.failures() == [('https://b', 'parse', 1, 'timeout')]
+    # ack پس از fail وضعیت ناموفق را پاک نمی‌کند
+    frontier.ack(b'b')
+    assert state(frontier, b'b') == 3
+
+def test_release_requeues_leased_and_failed(frontier):
+    for fingerprint in (b'a', b'b', b'c'):
+        frontier.push(fingerprint, 'https://' + fingerprint.decode(), 'parse', b'', 0)
+        frontier.pop()
+    frontier.ack(b'a')
+    frontier.fail(b'b', 'error')
+    assert frontier.release() == 2
+    assert frontier.pending() == 2
+    assert state(frontier, b'a') == 2
+
+def test_expired_lease_is_requeued_until_max_attempts(frontier):
+    frontier.lease_timeout = -1
+    frontier.push(b'a', 'https://a', 'parse', b'', 0)
+    for _ in range(frontier.max_attempts - 1):
+        frontier.pop()
+        assert frontier.requeue_expired() == 1
+    frontier.pop()
+    assert frontier.requeue_expired() == 0
+    assert state(frontier, b'a') == 3
+
+def test_reserve_stops_at_limit(frontier):
+    assert [frontier.reserve('items_scraped', 2) for _ in range(3)] == [True, True, False]
+    assert frontier.counter('items_scraped') == 2
+
+@pytest.fixture
+def middleware(frontier):
+    crawler = get_crawler()
+    crawler.spider = SimpleNamespace(frontier=frontier)
+    return FrontierAckMiddleware.from_crawler(crawler)
+
+def leased_response(middleware, frontier, url='https://www.digikala.com/product/dkp-1/'):
+    request = Request(url)
+    frontier.push(middleware.crawler.request_fingerprinter.fingerprint(request), url, 'parse', b'', 0)
+    frontier.pop()
+    return HtmlResponse(url, body=b'', request=request)
+
+def test_ack_after_output_is_consumed(middleware, frontier):
+    response = leased_response(middleware, frontier)
+    fingerprint = middleware.crawler.request_fingerprinter.fingerprint(response.request)
+    output = middleware.process_spider_output(response, iter([{'a': 1}, {'b': 2}]))
+    next(output)
+    assert state(frontier, fingerprint) == 1
+    list(output)
+    assert state(frontier, fingerprint) == 2
+
+def test_async_ack_after_output_is_consumed(middleware, frontier):
+    response = leased_response(middleware, frontier)
+    fingerprint = middleware.crawler.request_fingerprinter.fingerprint(response.request)
+
+    async def callback():
+        yield {'a': 1}
+        assert state(frontier, fingerprint) == 1
+        yield {'b': 2}
+
+    async def consume():
+        return [item async for item in middleware.process_spider_output_async(response, callback())]
+
+    assert len(asyncio.run(consume())) == 2
+    assert state(frontier, fingerprint) == 2
+
+def test_redirected_request_acks_original_lease(middleware, frontier):
+    original = leased_response(middleware, frontier, 'https://www.digikala.com/product/dkp-1/')
+    fingerprint = middleware.crawler.request_fingerprinter.fingerprint(original.request)
+    redirected = leased_response(middleware, frontier, 'https://www.digikala.com/product/dkp-1/slug/')
+    redirected.request.meta['frontier_fingerprint'] = fingerprint
+    list(middleware.process_spider_output(redirected, iter([])))
+    assert state(frontier, fingerprint) == 2
+
+def test_callback_exception_marks_failure(middleware, frontier):
+    response = leased_response(middleware, frontier)
+    middleware.process_spider_exception(response, ValueError('bad page'))
+    assert frontier.failures()[0][3] == "ValueError('bad page')"
+
+def test_crashed_worker_does_not_block_the_report(tmp_path):
+    path = str(tmp_path / 'crawl_state.sqlite')
+    crashed, last = SqliteFrontier(path, worker_timeout=60), SqliteFrontier(path, worker_timeout=60)
+    crashed.worker, last.worker = 'host-1', 'host-2'
+    crashed.register()
+    last.register()
+    # worker اول بدون unregister از کار افتاده و heartbeat آن قدیمی است
+    crashed.conn.execute('UPDATE workers SET seen_at = seen_at - 120 WHERE worker = ?', (crashed.worker,))
+    last.heartbeat()
+    assert last.unregister() == 0
+    crashed.close()
+    last.close()
+
+def test_live_worker_is_still_counted(tmp_path):
+    path = str(tmp_path / 'crawl_state.sqlite')
+    first, second = SqliteFrontier(path), SqliteFrontier(path)
+    first.worker, second.worker = 'host-1', 'host-2'
+    first.register()
+    second.register()
+    assert first.unregister() == 1
+    assert second.unregister() == 0
+    first.close()
+    second.close()
+
+def test_staged_items_round_trip(tmp_path, frontier):
+    item = {'product_id': 5, 'name': 'گوشی', 'price': 1250.0, 'url': 'https://www.digikala.com/product/dkp-5/',
+            'in_stock': True, 'rrp': None}
+    frontier.stage({5: item, 6: {'product_id': 6, 'name': 'کیف'}})
+    frontier.stage({})
+    # worker دیگری روی همان فایل صفحه محصول را دانلود می‌کند
+    other = SqliteFrontier(str(tmp_path / 'crawl_state.sqlite'))
+    assert other.staged(5) == item
+    assert other.staged(7) is None
+    frontier.stage({6: {'product_id': 6, 'name': 'کیف چرمی'}})
+    assert other.staged(6)['name'] == 'کیف چرمی'
+    other.unstage(5)
+    assert frontier.staged(5) is None and frontier.staged(6) is not None
+    frontier.reset()
+    assert other.staged(6) is None
+    other.close()
@@ -0,0 +1,101 @@
+import base64
+import io
+import json
+
+import pytest
+
+import digikala_har
+from digikala_har import extract_har, iter_entries, products_from_body
+
+def entry(url, body='', status=200, mime='application/json', encoding=None):
+    content = {'mimeType': mime, 'text': body}
+    if encoding:
+        content['encoding'] = encoding
+    return {'request': {'url': url, 'method': 'GET', 'headers': [{'name': 'accept', 'value': '*/*'}],
+                        'queryString': [{'name': 'page', 'value': '1'}]},
+            'response': {'status': status, 'content': content}}
+
+# رشته‌هایی که اسکنر ساده را گمراه می‌کنند: "entries" داخل رشته، کروشه، کاما، escape و یونیکد
+TRICKY = entry('https://www.digikala.com/x?q=\\"entries\\": [', '{"a": "], ,\\"}\\u06cc", "b": "\\\\"}', mime='text/plain')
+
+def har(entries, pages=None):
+    log = {'version': '1.2', 'creator': {'name': 'test', 'comment': '"entries": [1, 2]'}, 'pages': pages or []}
+    log['entries'] = entries
+    return json.dumps({'log': log}, ensure_ascii=False, indent=1)
+
+class Trickle(io.StringIO):
+    """فایل متنی که هر بار حداکثر n کاراکتر برمی‌گرداند تا entryها در مرز تکه‌ها بریده شوند"""
+
+    def __init__(self, text, n):
+        super().__init__(text)
+        self.n = n
+
+    def read(self, size=-1):
+        return super().read(self.n if size < 0 else min(size, self.n))
+
+@pytest.mark.parametrize('n', [1, 7, 64, 1 << 20])
+def test_split_and_escaped_input(monkeypatch, n):
+    monkeypatch.setattr(digikala_har, 'CHUNK_SIZE', 16)
+    entries = [TRICKY, entry('https://api.digikala.com/v1/search/', 'x' * 500), {'nested': [[], {}, ['[']]}]
+    assert list(iter_entries(Trickle(har(entries), n))) == entries
+
+def test_large_entry_and_empty_array(monkeypatch):
+    monkeypatch.setattr(digikala_har, 'CHUNK_SIZE', 8)
+    big = entry('https://api.digikala.com/v1/search/', 'ی' * 5000)
+    assert list(iter_entries(io.StringIO(har([big, big])))) == [big, big]
+    assert list(iter_entries(io.StringIO(har([])))) == []
+    assert list(iter_entries(io.StringIO('{"log": {}}'))) == []
+
+def test_truncated_file_raises():
+    text = har([entry('https://api.digikala.com/v1/search/', 'abc')])
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_entries(io.StringIO(text[:len(text) // 2])))
+
+def test_extract_har(tmp_path):
+    product = {'id': 5, 'title_fa': 'محصول', 'url': {'uri': '/product/dkp-5/'},
+               'default_variant': {'price': {'selling_price': 1000}}, 'rating': {'rate': 4, 'count': 1}}
+    body = json.dumps({'data': {'products': [product], 'pager': {}}, 'padding': 'x' * 100}, ensure_ascii=False)
+    encoded = base64.b64encode(body.encode('utf-8')).decode('ascii')
+    entries = [
+        entry('https://api.digikala.com/v1/categories/mobile-phone/search/?page=1', body),
+        # همان پاسخ با base64؛ بدنه یک بار ذخیره و محصول یک بار نوشته می‌شود
+        entry('https://api.digikala.com/v1/categories/mobile-phone/search/?page=2', encoded, encoding='base64'),
+        entry('https://api.digikala.com/v1/categories/mobile-phone/search/?page=3', body, status=500),
+        entry('https://www.digikala.com/static/app.js', body, mime='application/javascript'),
+    ]
+    path = tmp_path / 'session.har'
+    path.write_text(har(entries), encoding='utf-8')
+    counts = extract_har(str(path), str(tmp_path / 'xhrs.json'), str(tmp_path / 'bodies'),
+                         str(tmp_path / 'products.json'), None)
+    assert counts == {'entries': 4, 'xhrs': 2, 'products': 1}
+    assert len(list((tmp_path / 'bodies').iterdir())) == 1
+    products = json.loads((tmp_path / 'products.json').read_text(encoding='utf-8'))
+    assert [(p['نام'], p['دسته'], p['آدرس']) for p in products] == [
+        ('محصول', 'mobile-phone', 'https://www.digikala.com/product/dkp-5/'),
+    ]
+
+def test_providers_products_body():
+    url = 'https://api.digikala.com/v1/providers-products/?page=1'
+    good = {'id': 8, 'title_fa': 'کالا', 'default_variant': {'price': {'selling_price': 500}},
+            'brand': {'title_fa': 'برند'}, 'rating': 4, 'review': {'count': 2}, 'status': 'marketable'}
+    # brand برابر null: فقط همین محصول رد می‌شود
+    broken = {'id': 9, 'title_fa': 'خراب', 'brand': None}
+    items = products_from_body(url, {'data': [good, broken, 'x']})
+    assert [(item['نام'], item['قیمت'], item['آدرس']) for item in items] == [
+        ('کالا', 500, 'https://www.digikala.com/product/dkp-8/'),
+    ]
+    assert products_from_body(url, {'data': {'products': [good]}})[0]['برند'] == 'برند'
+    assert products_from_body(url, {'data': None}) == []
+    assert products_from_body(url, []) == []
+
+def test_providers_products_entry_does_not_abort_extraction(tmp_path):
+    providers = json.dumps({'data': [{'id': 8, 'title_fa': 'کالا', 'brand': None}], 'padding': 'x' * 100})
+    search = json.dumps({'data': {'products': [{'id': 5, 'title_fa': 'محصول'}]}, 'padding': 'x' * 100})
+    path = tmp_path / 'session.har'
+    path.write_text(har([
+        entry('https://api.digikala.com/v1/providers-products/?page=1', providers),
+        entry('https://api.digikala.com/v1/categories/book/search/?page=1', search),
+    ]), encoding='utf-8')
+    counts = extract_har(str(path), str(tmp_path / 'xhrs.json'), str(tmp_path / 'bodies'),
+                         str(tmp_path / 'products.json'), None)
+    assert counts == {'entries': 2, 'xhrs': 2, 'products': 1}
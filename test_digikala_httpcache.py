@@ -0,0 +1,110 @@
+import time
+
+import pytest
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from digikala_httpcache import DigikalaHttpCacheMiddleware, SqliteCacheStorage, page_type
+
+PRODUCT_URL = 'https://www.digikala.com/product/dkp-123/'
+
+@pytest.fixture
+def middleware(tmp_path):
+    crawler = get_crawler(settings_dict={
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': str(tmp_path),
+        'HTTPCACHE_POLICY': 'digikala_httpcache.DigikalaCachePolicy',
+        'HTTPCACHE_STORAGE': 'digikala_httpcache.SqliteCacheStorage',
+    })
+    crawler.spider = Spider('test')
+    middleware = DigikalaHttpCacheMiddleware.from_crawler(crawler)
+    middleware.storage.open_spider(crawler.spider)
+    yield middleware
+    middleware.storage.close_spider(crawler.spider)
+
+def cache_page(middleware, etag=b'"v1"'):
+    request = Request(PRODUCT_URL)
+    response = HtmlResponse(PRODUCT_URL, body=b'<html>v1</html>', headers={'ETag': etag})
+    assert middleware.process_request(request) is None
+    middleware.process_response(request, response)
+
+def expire(middleware, seconds=25 * 3600):
+    middleware.storage.conn.execute('UPDATE responses SET stored_at = stored_at - ?', (seconds,))
+
+def test_page_type():
+    assert page_type('https://api.digikala.com/v1/product/1/') == 'api'
+    assert page_type(PRODUCT_URL) == 'product'
+    assert page_type('https://www.digikala.com/search/category-mobile-phone/') == 'category'
+    assert page_type('https://www.digikala.com') == 'homepage'
+
+def test_fresh_response_served_from_cache(middleware):
+    cache_page(middleware)
+    cached = middleware.process_request(Request(PRODUCT_URL))
+    assert cached is not None and cached.body == b'<html>v1</html>'
+
+def test_expired_response_sends_validators(middleware):
+    cache_page(middleware)
+    expire(middleware)
+    request = Request(PRODUCT_URL)
+    assert middleware.process_request(request) is None
+    assert request.headers[b'If-None-Match'] == b'"v1"'
+
+def test_304_refreshes_stored_at_and_validators(middleware):
+    cache_page(middleware)
+    expire(middleware)
+    request = Request(PRODUCT_URL)
+    middleware.process_request(request)
+    result = middleware.process_response(request, Response(PRODUCT_URL, status=304, headers={'ETag': '"v2"'}))
+    assert result.status == 200 and result.body == b'<html>v1</html>'
+    stored_at = middleware.storage.conn.execute('SELECT stored_at FROM responses').fetchone()[0]
+    assert time.time() - stored_at < 60
+    # دوباره تازه است و validator جدید سرور برای دفعه بعد ذخیره شده
+    cached = middleware.process_request(Request(PRODUCT_URL))
+    assert cached is not None and cached.headers[b'ETag'] == b'"v2"'
+
+def test_changed_page_replaces_cached_body(middleware):
+    cache_page(middleware)
+    expire(middleware)
+    request = Request(PRODUCT_URL)
+    middleware.process_request(request)
+    response = HtmlResponse(PRODUCT_URL, body=b'<html>v2</html>', headers={'ETag': '"v2"'})
+    assert middleware.process_response(request, response).body == b'<html>v2</html>'
+    assert middleware.process_request(Request(PRODUCT_URL)).body == b'<html>v2</html>'
+
+def store(storage, spider, i):
+    url = f'https://www.digikala.com/product/dkp-{i}/'
+    body = bytes(range(256)) * 4  # فشرده نمی‌شود
+    storage.store_response(spider, Request(url), Response(url, body=body))
+
+def cached_count(storage):
+    return storage.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+@pytest.fixture
+def storages(tmp_path):
+    settings = Settings({'HTTPCACHE_DIR': str(tmp_path), 'DIGIKALA_CACHE_MAX_BYTES': 8000})
+    spider = Spider('test')
+    pair = SqliteCacheStorage(settings), SqliteCacheStorage(settings)
+    for storage in pair:
+        storage.open_spider(spider)
+    yield spider, pair
+    for storage in pair:
+        storage.close_spider(spider)
+
+def test_size_cap_counts_other_processes(storages, monkeypatch):
+    monkeypatch.setattr('digikala_httpcache.SYNC_EVERY', 1)
+    spider, (first, second) = storages
+    for i in range(12):
+        store(first if i % 2 else second, spider, i)
+    assert first.conn.execute('SELECT SUM(size) FROM responses').fetchone()[0] <= 8000
+
+def test_no_eviction_after_other_process_evicted(storages):
+    spider, (first, second) = storages
+    for i in range(7):
+        store(first, spider, i)
+    # پروسس دیگر همه را حذف کرده؛ total_bytes این پروسس هنوز آنها را می‌شمارد
+    second.conn.execute('DELETE FROM responses')
+    store(first, spider, 7)
+    store(first, spider, 8)
+    assert cached_count(first) == 2
@@ -0,0 +1,87 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from digikala_images import ImageDownloader, ImageStore, canonical_url, download_images, fetch_url
+from digikala_storage import create_db_engine
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'0' * 100
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}"), str(tmp_path / 'images'))
+
+def serve(handler, run):
+    """اجرای run(base_url) در برابر یک سرور محلی aiohttp"""
+    from aiohttp import web
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/{name}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await run(f'http://127.0.0.1:{port}')
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+def test_canonical_and_fetch_url():
+    url = 'https://DKSTATIC.digikala.com/a/1.jpg?x-oss-process=image/resize,h_1600#top'
+    assert canonical_url(url) == 'https://dkstatic.digikala.com/a/1.jpg'
+    assert fetch_url(url, 'image/resize,h_800') == 'https://dkstatic.digikala.com/a/1.jpg?x-oss-process=image/resize,h_800'
+    assert fetch_url('https://example.com/1.jpg?v=2') == 'https://example.com/1.jpg?v=2'
+
+def test_duplicates_are_fetched_once(store):
+    from aiohttp import web
+
+    requests = []
+
+    async def handler(request):
+        requests.append(request.path)
+        return web.Response(body=PNG, content_type='image/png')
+
+    async def run(base):
+        urls = [f'{base}/a.png', f'{base}/a.png', f'{base}/b.png', f'{base}/a.png?v=1', None, 'data:image/png']
+        first = await download_images(store, urls, concurrency=2, resize=None)
+        # اجرای بعد آدرس‌های ذخیره‌شده را از جدول images می‌شناسد
+        second = await download_images(store, [f'{base}/a.png', f'{base}/b.png'], resize=None)
+        return first, second
+
+    first, second = serve(handler, run)
+    assert sorted(requests) == ['/a.png', '/b.png']
+    # محتوای یکسان با دو آدرس فقط یک فایل دارد
+    assert (first['downloaded'], first['deduplicated']) == (1, 1)
+    assert len(list(Path(store.root).rglob('*.png'))) == 1
+    assert second['skipped'] == 2
+
+def test_full_queue_blocks_producer(store):
+    from aiohttp import web
+
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return web.Response(body=PNG + request.path.encode(), content_type='image/png')
+
+    async def run(base):
+        async with ImageDownloader(store, concurrency=1, queue_size=2, resize=None) as downloader:
+            for name in ('a', 'b', 'c'):
+                await downloader.add(f'{base}/{name}.png')
+            # worker یکی را برداشته و دو آدرس صف را پر کرده‌اند
+            producer = asyncio.create_task(downloader.add(f'{base}/d.png'))
+            await asyncio.sleep(0.2)
+            blocked = not producer.done()
+            assert len(downloader.active) == 4
+            release.set()
+            await producer
+        return blocked, downloader
+
+    blocked, downloader = serve(handler, run)
+    assert blocked
+    assert downloader.counts['downloaded'] == 4 and not downloader.active
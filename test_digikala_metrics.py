@@ -0,0 +1,82 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from digikala_metrics import CrawlMetrics, Histogram, timed_callback
+
+class Spider(SimpleNamespace):
+
+    @timed_callback
+    async def parse(self, response):
+        time.sleep(0.02)
+        yield 1
+        # انتظار برای ParsePool یا شبکه زمان callback نیست
+        await asyncio.sleep(0.2)
+        time.sleep(0.02)
+        yield 2
+
+class RecordingProfiler:
+    """profiler ساختگی که فعال شدن هم‌پوشان را ثبت می‌کند"""
+
+    active = 0
+    overlaps = 0
+
+    def enable(self):
+        RecordingProfiler.active += 1
+        RecordingProfiler.overlaps += RecordingProfiler.active > 1
+
+    def disable(self):
+        RecordingProfiler.active -= 1
+
+def consume(*generators):
+    async def drain(generator):
+        return [output async for output in generator]
+
+    async def run():
+        return await asyncio.gather(*(drain(generator) for generator in generators))
+
+    return asyncio.run(run())
+
+def test_histogram_quantile_and_render():
+    metrics = CrawlMetrics()
+    for value in (0.001, 0.002, 0.02, 0.2):
+        metrics.observe('digikala_callback_seconds', value, callback='parse')
+    histogram = metrics.histograms['digikala_callback_seconds'][(('callback', 'parse'),)]
+    assert histogram.count == 4
+    assert 0.0025 < histogram.quantile(0.75) <= 0.025
+    text = metrics.render()
+    assert 'digikala_callback_seconds_bucket{callback="parse",le="+Inf"} 4' in text
+    assert 'digikala_callback_seconds_count{callback="parse"} 4' in text
+    assert Histogram().quantile(0.5) == 0.0
+
+def test_callback_time_excludes_awaits():
+    metrics = CrawlMetrics()
+    assert consume(Spider(metrics=metrics).parse(None)) == [[1, 2]]
+    busy = metrics.histograms['digikala_callback_seconds'][(('callback', 'parse'),)].sum
+    assert 0.04 <= busy < 0.1
+
+def test_interleaved_callbacks_do_not_share_time_or_profilers():
+    metrics = CrawlMetrics()
+    metrics.profilers['parse'] = RecordingProfiler()
+    spider = Spider(metrics=metrics)
+    assert consume(spider.parse(None), spider.parse(None), spider.parse(None)) == [[1, 2]] * 3
+    histogram = metrics.histograms['digikala_callback_seconds'][(('callback', 'parse'),)]
+    assert histogram.count == 3 and histogram.sum < 0.25
+    assert RecordingProfiler.overlaps == 0 and not metrics.profiling
+
+def test_flush_time_is_excluded():
+    metrics = CrawlMetrics()
+
+    class FlushingSpider(SimpleNamespace):
+        @timed_callback
+        async def parse(self, response):
+            started = time.perf_counter()
+            time.sleep(0.05)
+            metrics.on_flush(time.perf_counter() - started, 10)
+            yield 1
+
+    consume(FlushingSpider(metrics=metrics).parse(None))
+    assert metrics.histograms['digikala_callback_seconds'][(('callback', 'parse'),)].sum < 0.01
+
+def test_without_metrics_outputs_pass_through():
+    assert consume(Spider(metrics=None).parse(None)) == [[1, 2]]
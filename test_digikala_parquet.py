@@ -0,0 +1,39 @@
+from datetime import date, datetime
+
+import pyarrow as pa
+
+from digikala_parquet import HIVE_NULL, PRODUCT_SCHEMA, ParquetDatasetWriter, from_api_item, open_dataset
+
+def item(product_id, category):
+    return {'نام': f'محصول {product_id}', 'قیمت': 1000 * product_id, 'دسته': category,
+            'آدرس': f'https://www.digikala.com/product/dkp-{product_id}/', 'امتیاز': 4, 'تعداد_نظرات': 2}
+
+def write(root, rows, crawled_at):
+    writer = ParquetDatasetWriter(str(root), PRODUCT_SCHEMA, batch_size=2)
+    writer.write_many(from_api_item(row, crawled_at) for row in rows)
+    writer.close()
+    return writer
+
+def test_round_trip(tmp_path):
+    first = write(tmp_path, [item(1, 'mobile/phone'), item(2, 'book'), item(3, 'book'), item(4, None)],
+                  datetime(2024, 5, 1, 10, 30, 15, 999))
+    # اجرای دوم در همان پارتیشن فایل جدا می‌نویسد و اجرای اول را بازنویسی نمی‌کند
+    write(tmp_path, [item(5, 'book')], datetime(2024, 5, 1, 18))
+    assert first.count == 4
+
+    partitions = sorted(str(path.parent.relative_to(tmp_path)) for path in tmp_path.rglob('*.parquet'))
+    assert partitions == [
+        f'category={HIVE_NULL}/crawl_date=2024-05-01',
+        'category=book/crawl_date=2024-05-01',
+        'category=book/crawl_date=2024-05-01',
+        'category=mobile%2Fphone/crawl_date=2024-05-01',
+    ]
+
+    table = open_dataset(str(tmp_path), PRODUCT_SCHEMA).to_table().sort_by('product_id')
+    assert table.schema.field('crawl_date').type == pa.date32()
+    rows = table.to_pylist()
+    assert [row['product_id'] for row in rows] == [1, 2, 3, 4, 5]
+    assert [row['category'] for row in rows] == ['mobile/phone', 'book', 'book', None, 'book']
+    assert {row['crawl_date'] for row in rows} == {date(2024, 5, 1)}
+    assert rows[0]['crawled_at'] == datetime(2024, 5, 1, 10, 30, 15)
+    assert rows[0]['price'] == 1000.0 and rows[0]['review_count'] == 2 and rows[0]['is_ad'] is False
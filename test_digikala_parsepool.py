@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+from digikala_extractors import get_extractor
+from digikala_parsepool import ParsePool
+
+PRODUCT_PAGE = '<html><body><span class="c-product__rating-score">4.5</span></body></html>'
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = ParsePool('lxml', 2)
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """اجرای callFromThread در همان thread؛ نتیجه Deferred پس از تحویل برگردانده می‌شود"""
+    from twisted.internet import reactor
+
+    monkeypatch.setattr(reactor, 'callFromThread', lambda f, *args: f(*args))
+
+    def wait(d):
+        results = []
+        done = threading.Event()
+        d.addBoth(lambda result: (results.append(result), done.set()))
+        assert done.wait(30)
+        return results[0]
+
+    return wait
+
+def test_workers_are_spawned(pool):
+    assert pool.executor._mp_context.get_start_method() == 'spawn'
+
+def test_submit_delivers_result(pool, delivered):
+    assert delivered(pool.submit('product_page', PRODUCT_PAGE)) == get_extractor('lxml').product_page(PRODUCT_PAGE)
+
+def test_submit_delivers_exception(pool, delivered):
+    failure = delivered(pool.submit('no_such_method'))
+    assert failure.check(AttributeError)
+    # خطا به callback بعدی نمی‌رسد و pool برای درخواست‌های بعدی سالم است
+    assert delivered(pool.submit('categories', '<html></html>', 'https://www.digikala.com/')) == []
@@ -0,0 +1,55 @@
+import pytest
+
+from digikala_prices import observation_from_api_item, observation_from_listing_item, price_drops, price_series
+from digikala_storage import BufferedWriter, create_db_engine
+
+URL = 'https://www.digikala.com/product/dkp-7/'
+
+@pytest.fixture
+def writer(tmp_path):
+    return BufferedWriter(create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}"))
+
+def api_item(price, in_stock=True, is_ad=False):
+    return {'آدرس': URL, 'قیمت': price, 'تبلیغاتی': is_ad, '_rrp': price + 500, '_in_stock': in_stock}
+
+def record(writer, observation):
+    writer.add_price(observation)
+    writer.flush()
+
+def test_listing_prices_are_stored_in_rials():
+    observation = observation_from_listing_item({'url': URL, 'price': 1000.0, 'rrp': 1200.0}, ts=1)
+    assert observation['product_id'] == 7
+    assert (observation['selling_price'], observation['rrp']) == (10000, 12000)
+    assert observation_from_listing_item({'url': URL, 'price': None}) is None
+
+def test_only_changes_are_stored(writer):
+    record(writer, observation_from_api_item(api_item(10000), ts=1))
+    record(writer, observation_from_api_item(api_item(10000), ts=2))
+    record(writer, observation_from_api_item(api_item(9000), ts=3))
+    record(writer, observation_from_api_item(api_item(9000, in_stock=False), ts=4))
+    series = price_series(writer.engine, 7)
+    assert [(row['ts'], row['selling_price'], row['in_stock']) for row in series] == [
+        (1, 10000, True), (3, 9000, True), (4, 9000, False),
+    ]
+
+def test_unknown_fields_do_not_count_as_changes(writer):
+    # API (همه فیلدها) و صفحه محصول (is_ad و in_stock نامعلوم) به نوبت
+    record(writer, observation_from_api_item(api_item(10000), ts=1))
+    record(writer, observation_from_listing_item({'url': URL, 'price': 1000.0}, ts=2))
+    record(writer, observation_from_api_item(api_item(10000), ts=3))
+    assert [row['ts'] for row in price_series(writer.engine, 7)] == [1]
+    record(writer, observation_from_listing_item({'url': URL, 'price': 900.0}, ts=4))
+    latest = price_series(writer.engine, 7)[-1]
+    assert (latest['selling_price'], latest['rrp'], latest['is_ad'], latest['in_stock']) == (9000, 10500, False, True)
+
+def test_out_of_order_observation_is_ignored(writer):
+    record(writer, observation_from_api_item(api_item(10000), ts=10))
+    record(writer, observation_from_api_item(api_item(5000), ts=5))
+    assert [row['ts'] for row in price_series(writer.engine, 7)] == [10]
+
+def test_price_drops(writer):
+    record(writer, observation_from_api_item(api_item(10000), ts=1))
+    record(writer, observation_from_api_item(api_item(8000), ts=20))
+    drops = price_drops(writer.engine, since=10, threshold=0.1)
+    assert [(row['product_id'], row['price_before'], row['price_now']) for row in drops] == [(7, 10000, 8000)]
+    assert price_drops(writer.engine, since=10, threshold=0.3) == []
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+from digikala_replay import ReplayCorpus, ReplayMiddleware, ReplayRecorder, normalize_url
+
+PRODUCT = 'https://www.digikala.com/product/dkp-5/'
+API = 'https://api.digikala.com/v1/categories/book/search/?page=2&sort=4'
+
+def test_normalize_url():
+    assert normalize_url('HTTPS://WWW.Digikala.com/product/dkp-5#reviews') == normalize_url(PRODUCT)
+    assert normalize_url('https://api.digikala.com/v1/categories/book/search?sort=4&page=2') == normalize_url(API)
+    assert normalize_url('https://www.digikala.com') == 'https://www.digikala.com/'
+    # پارامتر خالی حذف نمی‌شود و مقدار متفاوت آدرس دیگری است
+    assert normalize_url(API + '&q=') != normalize_url(API)
+    assert normalize_url(API.replace('page=2', 'page=3')) != normalize_url(API)
+
+@pytest.fixture
+def replay_settings(tmp_path):
+    recorder = ReplayRecorder(str(tmp_path / 'pages'))
+    recorder.save(PRODUCT, '<html><body>محصول</body></html>'.encode('utf-8'))
+    recorder.close()
+    har = {'log': {'entries': [
+        {'request': {'method': 'GET', 'url': API},
+         'response': {'status': 200, 'headers': [{'name': 'Content-Encoding', 'value': 'gzip'}],
+                      'content': {'mimeType': 'application/json', 'text': json.dumps({'data': {'products': []}})}}},
+        {'request': {'method': 'POST', 'url': 'https://api.digikala.com/v1/cart/'},
+         'response': {'status': 200, 'content': {'text': '{}'}}},
+    ]}}
+    (tmp_path / 'session.har').write_text(json.dumps(har), encoding='utf-8')
+    return {'DIGIKALA_REPLAY_HAR': [str(tmp_path / 'session.har')], 'DIGIKALA_REPLAY_HTML': str(tmp_path / 'pages')}
+
+@pytest.fixture
+def crawler(replay_settings):
+    return get_crawler(settings_dict=replay_settings)
+
+def test_recorded_responses_are_replayed(crawler):
+    middleware = ReplayMiddleware.from_crawler(crawler)
+    page = middleware.process_request(Request('https://www.digikala.com/product/dkp-5#specs'), None)
+    assert isinstance(page, HtmlResponse) and 'replay' in page.flags
+    assert page.text == '<html><body>محصول</body></html>'
+    api = middleware.process_request(Request(API.replace('page=2&sort=4', 'sort=4&page=2')), None)
+    assert isinstance(api, TextResponse) and json.loads(api.text) == {'data': {'products': []}}
+    assert b'Content-Encoding' not in api.headers
+    assert crawler.stats.get_value('replay/hit') == 2
+
+def test_miss_is_ignored_when_strict(crawler):
+    middleware = ReplayMiddleware.from_crawler(crawler)
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request('https://www.digikala.com/product/dkp-6/'), None)
+    # درخواست POST ضبط‌شده در replay استفاده نمی‌شود
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request('https://api.digikala.com/v1/cart/'), None)
+    assert crawler.stats.get_value('replay/miss') == 2
+
+def test_miss_goes_to_network_when_not_strict(replay_settings):
+    crawler = get_crawler(settings_dict={**replay_settings, 'DIGIKALA_REPLAY_STRICT': False})
+    middleware = ReplayMiddleware.from_crawler(crawler)
+    request = Request('https://www.digikala.com/product/dkp-6/')
+    assert middleware.process_request(request, None) is None
+    assert crawler.stats.get_value('replay/miss') == 1
+    assert 'dont_cache' not in request.meta
+
+def test_recording(tmp_path):
+    crawler = get_crawler(settings_dict={'DIGIKALA_REPLAY_RECORD': str(tmp_path / 'recorded')})
+    middleware = ReplayMiddleware.from_crawler(crawler)
+    request = Request(PRODUCT)
+    assert middleware.process_request(request, None) is None
+    middleware.process_response(request, HtmlResponse(PRODUCT, body=b'<html>1</html>'), None)
+    middleware.process_response(request, HtmlResponse(PRODUCT, status=404, body=b''), None)
+    middleware.recorder.close()
+    corpus = ReplayCorpus.from_sources(html_sources=[str(tmp_path / 'recorded')])
+    assert corpus.get(PRODUCT + '#x') == (200, {'Content-Type': 'text/html; charset=utf-8'}, b'<html>1</html>')
+    with pytest.raises(NotConfigured):
+        ReplayMiddleware.from_crawler(get_crawler())
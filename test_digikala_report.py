@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+from digikala_report import PRICE_PERCENTILES, build_report, build_warnings
+from digikala_storage import BufferedWriter, create_db_engine
+
+PRODUCTS = {
+    'mobile': [(1, 100.0, 4.0, 3), (2, 300.0, 5.0, 1), (3, 200.0, 0.0, 0), (4, 0.0, 3.0, 2)],
+    'laptop': [(5, 1000.0, 4.5, 7)],
+    'book': [(6, None, None, None)],
+}
+
+def nearest_rank(values, p):
+    values = sorted(values)
+    return values[math.ceil(len(values) * p / 100) - 1]
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}")
+    writer = BufferedWriter(engine)
+    for category, products in PRODUCTS.items():
+        for product_id, price, rating, review_count in products:
+            url = f'https://www.digikala.com/product/dkp-{product_id}/'
+            writer.add_product({'product_id': product_id, 'url': url, 'category': category, 'price': price,
+                                'rating': rating, 'review_count': review_count})
+    for comment in ('الف', 'ب'):
+        writer.add_review({'product_url': 'https://www.digikala.com/product/dkp-1/', 'comment': comment, 'rating': 5})
+    writer.close()
+    return engine
+
+def test_overall_stats(engine):
+    report = build_report(engine)
+    prices = [100.0, 300.0, 200.0, 1000.0]
+    assert report['total_products'] == 6 and report['total_reviews'] == 2
+    # قیمت و امتیاز صفر یا NULL در میانگین و کمینه حساب نمی‌شود
+    assert report['avg_price'] == sum(prices) / len(prices)
+    assert (report['min_price'], report['max_price']) == (100.0, 1000.0)
+    assert report['avg_rating'] == pytest.approx((4.0 + 5.0 + 3.0 + 4.5) / 4)
+    assert (report['min_rating'], report['max_rating']) == (3.0, 5.0)
+    assert report['price_percentiles'] == {f'p{p}': nearest_rank(prices, p) for p in PRICE_PERCENTILES}
+
+def test_category_breakdown(engine):
+    rows = build_report(engine)['categories_breakdown']
+    # دسته‌ها به ترتیب تعداد محصول
+    assert rows[0]['category'] == 'mobile'
+    breakdown = {row['category']: row for row in rows}
+    mobile = breakdown['mobile']
+    assert (mobile['products'], mobile['avg_price'], mobile['min_price'], mobile['max_price']) == (4, 200.0, 100.0, 300.0)
+    assert (mobile['listed_reviews'], mobile['stored_reviews']) == (6, 2)
+    assert mobile['price_percentiles'] == {f'p{p}': nearest_rank([100.0, 300.0, 200.0], p) for p in PRICE_PERCENTILES}
+    book = breakdown['book']
+    assert (book['avg_price'], book['min_price'], book['avg_rating'], book['stored_reviews']) == (0, 0, 0, 0)
+    assert book['price_percentiles'] == {}
+
+def test_empty_database(tmp_path):
+    report = build_report(create_db_engine(f"sqlite:///{tmp_path / 'empty.db'}"))
+    assert report['total_products'] == 0 and report['avg_price'] == 0
+    assert report['price_percentiles'] == {} and report['categories_breakdown'] == []
+
+def test_warnings():
+    assert build_warnings(10, 0) == ['تعداد محصولات بسیار کم است!']
+    assert build_warnings(500, 51) == ['تعداد خطاها زیاد است!']
+    assert build_warnings(500, 0) == []
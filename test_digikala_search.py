@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from sqlalchemy import text
+
+from digikala_search import (
+    flatten_specs, has_fts5, match_expression, normalize_text, rebuild_search_index, search_products, search_reviews,
+)
+from digikala_storage import BufferedWriter, create_db_engine
+
+def url(product_id):
+    return f'https://www.digikala.com/product/dkp-{product_id}/'
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}")
+    with engine.connect() as conn:
+        if not has_fts5(conn):
+            pytest.skip('SQLite بدون FTS5')
+    writer = BufferedWriter(engine)
+    # متن‌ها با ی/ک عربی، نیم‌فاصله، ارقام فارسی و اعراب ذخیره می‌شوند
+    writer.add_product({'product_id': 1, 'url': url(1), 'name': 'گوشي موبايل سامسونگ مدل A۵۴',
+                        'description': 'صفحه‌نمایش بزرگ', 'specs': json.dumps({'رنگ': ['مشكي', 'آبی']}, ensure_ascii=False)})
+    writer.add_product({'product_id': 2, 'url': url(2), 'name': 'کیف لپ‌تاپ',
+                        'description': 'مناسب گوشی و تبلت'})
+    writer.add_review({'product_url': url(1), 'comment': 'كيفيت دوربین عالیٌ است', 'rating': 5})
+    writer.close()
+    return engine
+
+def product_ids(results):
+    return [row['product_id'] for row in results]
+
+def test_normalize_text():
+    assert normalize_text('كيف‌پول ۱۲٣') == 'کیف پول 123'
+    assert normalize_text('مُحَمَّد ـــ أحمد') == 'محمد  احمد'
+    assert normalize_text(None) == ''
+
+def test_flatten_specs():
+    assert sorted(flatten_specs(json.dumps({'رنگ': ['مشكي', None], 'وزن': 180})).split()) == sorted('رنگ مشکی وزن 180'.split())
+    assert flatten_specs('متن ساده يك') == 'متن ساده یک'
+    assert flatten_specs(None) == ''
+
+def test_match_expression():
+    assert match_expression('گوشي سامسونگ') == '"گوشی" "سامسونگ"*'
+    assert match_expression('لپ‌تاپ', prefix=False) == '"لپ" "تاپ"'
+    # کاراکترهای عملگر FTS5 به عبارت نمی‌رسند
+    assert match_expression('"a" OR b*') == '"a" "OR" "b"*'
+    assert match_expression(' ،. ') == ''
+
+def test_search_ignores_spelling_variants(engine):
+    assert product_ids(search_products(engine, 'گوشی موبایل')) == [1]
+    assert product_ids(search_products(engine, 'گوشي')) == [1, 2]
+    assert product_ids(search_products(engine, 'a54')) == [1]
+    assert product_ids(search_products(engine, 'لپ‌تاپ')) == [2]
+    assert product_ids(search_products(engine, 'سامس')) == [1]
+    assert product_ids(search_products(engine, 'مشکی')) == [1]
+    assert search_products(engine, '') == []
+
+def test_name_outranks_description(engine):
+    results = search_products(engine, 'گوشی')
+    assert results[0]['product_id'] == 1 and results[0]['rank'] < results[1]['rank']
+    assert '[' in results[0]['snippet']
+
+def test_index_follows_updates(engine):
+    writer = BufferedWriter(engine)
+    writer.refresh_product({'product_id': 2, 'url': url(2), 'name': 'کوله پشتی', 'price': 100.0})
+    writer.close()
+    assert product_ids(search_products(engine, 'کوله')) == [2]
+    assert product_ids(search_products(engine, 'لپ‌تاپ')) == []
+
+def test_search_reviews_and_rebuild(engine):
+    assert [row['product_id'] for row in search_reviews(engine, 'کیفیت')] == [1]
+    rebuild_search_index(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM products_fts')).scalar() == 2
+    assert product_ids(search_products(engine, 'NEAR(گوشی سامسونگ)', raw=True)) == [1]
@@ -0,0 +1,48 @@
+import multiprocessing
+
+import pytest
+
+from digikala_seen import GROW_BYTES, DkpBitmap
+
+def test_add_and_contains():
+    seen = DkpBitmap()
+    assert seen.add(12345)
+    assert not seen.add(12345)
+    assert 12345 in seen
+    assert 12346 not in seen
+    assert len(seen) == 1
+
+def test_out_of_range_id():
+    with pytest.raises(ValueError):
+        DkpBitmap().add(-1)
+
+def test_persistent_count_and_reset(tmp_path):
+    path = str(tmp_path / 'crawl.seen')
+    seen = DkpBitmap(path)
+    ids = [1, 7, 8, GROW_BYTES * 8 + 3, 20000000]
+    assert seen.update(ids + ids) == len(ids)
+    seen.close()
+    seen = DkpBitmap(path)
+    assert len(seen) == len(ids)
+    assert all(dkp_id in seen for dkp_id in ids)
+    seen.close()
+    assert len(DkpBitmap(path, reset=True)) == 0
+
+def _claim(path, ids, results):
+    seen = DkpBitmap(path)
+    results.put(sum(1 for dkp_id in ids if seen.add(dkp_id)))
+    seen.close()
+
+def test_processes_claim_each_id_once(tmp_path):
+    path = str(tmp_path / 'shared.seen')
+    ids = list(range(0, 200000, 3))
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=_claim, args=(path, ids, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = sum(results.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+    assert claimed == len(ids)
+    assert len(DkpBitmap(path)) == len(ids)
@@ -0,0 +1,169 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+import digikala_storage
+from digikala_storage import BufferedWriter, create_db_engine, make_review_key, parse_product_id
+
+def product(product_id, **fields):
+    return {'product_id': product_id, 'name': f'محصول {product_id}', 'price': 1000.0,
+            'url': f'https://www.digikala.com/product/dkp-{product_id}/', **fields}
+
+def rows(engine, sql):
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).fetchall()
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_db_engine(f"sqlite:///{tmp_path / 'digikala.db'}")
+
+def test_parse_product_id():
+    assert parse_product_id('https://www.digikala.com/product/dkp-12345/slug/') == 12345
+    assert parse_product_id('https://www.digikala.com/search/') is None
+    assert parse_product_id(None) is None
+
+def test_product_upsert_keeps_one_row(engine):
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1, description='قدیمی'))
+    writer.flush()
+    writer.add_product(product(1, price=900.0, description='جدید'))
+    writer.flush()
+    assert rows(engine, 'SELECT product_id, price, description FROM products') == [(1, 900.0, 'جدید')]
+
+def test_upsert_updates_existing_row(engine):
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1, category='گوشی', rating=4.0))
+    writer.add_product(product(2))
+    writer.flush()
+    (row_id,), _ = rows(engine, 'SELECT id FROM products ORDER BY product_id')
+    # آدرس جدید (slug عوض شده) همان محصول را به‌روز می‌کند و ردیف تازه نمی‌سازد
+    writer.add_product(product(1, name='نام جدید', price=750.0, rating=4.5,
+                               url='https://www.digikala.com/product/dkp-1/new-slug/'))
+    writer.close()
+    assert rows(engine, 'SELECT id, name, price, rating, url FROM products WHERE product_id = 1') == [
+        (row_id, 'نام جدید', 750.0, 4.5, 'https://www.digikala.com/product/dkp-1/new-slug/'),
+    ]
+    assert rows(engine, 'SELECT COUNT(*) FROM products') == [(2,)]
+
+def test_legacy_database_is_migrated(tmp_path):
+    path = tmp_path / 'legacy.db'
+    legacy = create_engine(f'sqlite:///{path}')
+    # ساختار نسخه اول خزنده: بدون product_id و review_key و با ردیف تکراری برای هر بار خزش
+    with legacy.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR(255), price FLOAT, category VARCHAR(100), '
+            'url TEXT, description TEXT, rating FLOAT, review_count INTEGER, image_url TEXT, specs TEXT, created_at DATETIME)'
+        ))
+        conn.execute(text(
+            'CREATE TABLE reviews (id INTEGER PRIMARY KEY, product_id INTEGER, product_url TEXT, comment TEXT, '
+            'rating FLOAT, date VARCHAR(50), created_at DATETIME)'
+        ))
+        conn.execute(text(
+            "INSERT INTO products (name, price, url, created_at) VALUES (:name, :price, :url, '2023-01-01 00:00:00')"
+        ), [
+            {'name': 'قدیمی', 'price': 1000.0, 'url': product(1)['url']},
+            {'name': 'محصول 2', 'price': 500.0, 'url': product(2)['url']},
+            {'name': 'جدید', 'price': 1200.0, 'url': product(1)['url']},
+        ])
+        review = {'product_url': product(1)['url'], 'comment': 'عالی', 'rating': 5.0, 'date': '1402/01/01'}
+        conn.execute(text(
+            'INSERT INTO reviews (product_url, comment, rating, date) VALUES (:product_url, :comment, :rating, :date)'
+        ), [review, review])
+    legacy.dispose()
+
+    engine = create_db_engine(f'sqlite:///{path}')
+    assert rows(engine, 'SELECT product_id, name, price FROM products ORDER BY product_id') == [
+        (1, 'جدید', 1200.0), (2, 'محصول 2', 500.0),
+    ]
+    assert rows(engine, 'SELECT product_id, review_key FROM reviews') == [(1, make_review_key(review))]
+    # پس از مهاجرت upsert روی کلید product_id کار می‌کند
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1, price=1100.0))
+    writer.close()
+    assert rows(engine, 'SELECT product_id, price FROM products WHERE product_id = 1') == [(1, 1100.0)]
+
+def test_refresh_keeps_description(engine):
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1, description='توضیحات'))
+    writer.flush()
+    writer.refresh_product(product(1, price=800.0))
+    writer.flush()
+    assert rows(engine, 'SELECT price, description FROM products') == [(800.0, 'توضیحات')]
+
+def test_reviews_are_deduplicated(engine):
+    writer = BufferedWriter(engine)
+    review = {'product_url': product(1)['url'], 'comment': 'عالی', 'rating': 5, 'date': '1402/01/01'}
+    writer.add_review(review)
+    writer.add_review(dict(review))
+    writer.flush()
+    writer.add_review(dict(review))
+    writer.close()
+    assert rows(engine, 'SELECT product_id, review_key FROM reviews') == [(1, make_review_key(review))]
+
+def test_failed_flush_keeps_rows_for_retry(engine, monkeypatch):
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1))
+    calls = []
+    original = writer._write
+
+    def flaky(conn, **batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        return original(conn, **batch)
+
+    monkeypatch.setattr(writer, '_write', flaky)
+    writer.flush()
+    assert writer.pending() == 1 and writer.retry_at > 0
+    # تا زمان تلاش دوباره flush خودکار انجام نمی‌شود
+    writer.add_product(product(2))
+    assert len(calls) == 1
+    writer.close()
+    assert rows(engine, 'SELECT product_id FROM products ORDER BY product_id') == [(1,), (2,)]
+    assert writer.failures == 0
+
+def test_bad_row_is_isolated(engine, monkeypatch):
+    monkeypatch.setattr(digikala_storage, 'FLUSH_ATTEMPTS', 1)
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1))
+    writer.add_product(product(2, specs={'قابل ذخیره': False}))
+    writer.add_product(product(3))
+    writer.flush()
+    assert rows(engine, 'SELECT product_id FROM products ORDER BY product_id') == [(1,), (3,)]
+    assert [row['product_id'] for _, row in writer.rejected] == [2]
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+def test_bad_row_is_isolated_after_database_recovers(engine, monkeypatch):
+    monkeypatch.setattr(digikala_storage, 'FLUSH_ATTEMPTS', 1)
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1))
+    writer.add_product(product(2, specs={'قابل ذخیره': False}))
+    original = writer._write
+    down = [True]
+
+    def flaky(conn, **batch):
+        if down[0]:
+            raise RuntimeError('database is locked')
+        return original(conn, **batch)
+
+    monkeypatch.setattr(writer, '_write', flaky)
+    # در تلاش جداسازی دیتابیس قفل است و همه ردیف‌ها در بافر می‌مانند
+    writer.flush()
+    assert writer.pending() == 2 and writer.rejected == []
+    down[0] = False
+    writer.flush()
+    assert rows(engine, 'SELECT product_id FROM products') == [(1,)]
+    assert [row['product_id'] for _, row in writer.rejected] == [2]
+    assert writer.pending() == 0 and writer.failures == 0
+
+def test_close_raises_when_database_is_unavailable(engine, monkeypatch):
+    writer = BufferedWriter(engine)
+    writer.add_product(product(1))
+
+    def broken(conn, **batch):
+        raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(writer, '_write', broken)
+    with pytest.raises(RuntimeError):
+        writer.close()
+    assert writer.pending() == 1
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, Response
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+from twisted.internet import error
+from twisted.web._newclient import ResponseNeverReceived
+
+from digikala_throttle import DEFAULT_HOST_LIMITS, AdaptiveThrottleMiddleware, HostState
+
+URL = 'https://api.digikala.com/v1/product/1/'
+
+def make_middleware():
+    downloader = SimpleNamespace(slots={}, get_slot_key=lambda request: 'api.digikala.com')
+    crawler = SimpleNamespace(engine=SimpleNamespace(downloader=downloader), stats=MemoryStatsCollector(get_crawler()))
+    return AdaptiveThrottleMiddleware(crawler, {}, dict(DEFAULT_HOST_LIMITS))
+
+def test_throttled_halves_concurrency_and_doubles_delay():
+    state = HostState(dict(DEFAULT_HOST_LIMITS))
+    delay, concurrency = state.delay, state.concurrency
+    state.on_throttled()
+    assert state.delay == delay * 2
+    assert state.concurrency == concurrency // 2
+    assert state.throttled_rate() == 1.0
+
+def test_successes_recover_delay_and_concurrency():
+    state = HostState(dict(DEFAULT_HOST_LIMITS))
+    state.on_throttled()
+    delay, concurrency = state.delay, state.concurrency
+    for _ in range(20):
+        state.on_success(0.1)
+    assert state.delay < delay
+    assert state.concurrency == concurrency + 1
+
+def test_slow_responses_increase_delay():
+    state = HostState(dict(DEFAULT_HOST_LIMITS))
+    delay = state.delay
+    state.on_success(DEFAULT_HOST_LIMITS['target_latency'] * 2)
+    assert state.delay == delay * 1.25
+
+def test_429_response_backs_off():
+    middleware = make_middleware()
+    request = Request(URL)
+    middleware.process_response(request, Response(URL, status=429), None)
+    assert middleware.hosts['api.digikala.com'].throttled_rate() == 1.0
+
+@pytest.mark.parametrize('exception', [
+    error.TimeoutError(), error.TCPTimedOutError(), error.ConnectionRefusedError(), ResponseNeverReceived([]),
+])
+def test_network_errors_back_off(exception):
+    middleware = make_middleware()
+    assert middleware.process_exception(Request(URL), exception, None) is None
+    assert middleware.hosts['api.digikala.com'].recent[-1] is True
+
+@pytest.mark.parametrize('exception', [IgnoreRequest(), error.DNSLookupError(), ValueError()])
+def test_other_exceptions_do_not_back_off(exception):
+    middleware = make_middleware()
+    assert middleware.process_exception(Request(URL), exception, None) is None
+    assert middleware.hosts == {}